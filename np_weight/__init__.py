@@ -0,0 +1,118 @@
+"""
+Shared core for the TCX weight power analysis scripts.
+
+The top-level scripts (weight_power_analysis.py, analyze_weight.py, ...) are
+thin front-ends over the modules in this package: one TCX parser (tcx), one
+data model (ride) and one analysis engine (analysis).
+"""
+
+import importlib
+
+# Imported eagerly: the function shares its name with its submodule, which
+# would otherwise replace it as the package attribute once anything imports
+# np_weight.resample. Neither it nor what it imports is a command-line module.
+from .resample import resample
+
+# Public name → submodule defining it. Submodules are imported on first
+# access, so `python -m np_weight.<module>` does not find its own module
+# already imported by the package (runpy warns about that), and a script
+# using one module does not pay for importing all of them.
+_EXPORTS = {
+    'RideAnalysis': 'analysis',
+    'analyze_ride': 'analysis',
+    'open_ride': 'analysis',
+    'Archive': 'archive',
+    'build_archive': 'archive',
+    'write_archive': 'archive',
+    'RideCache': 'cache',
+    'load_ride': 'cache',
+    'PowerCurve': 'curve',
+    'mean_max': 'curve',
+    'season_best': 'curve',
+    'scan_tcx': 'fastscan',
+    'IntervalCost': 'index',
+    'IntervalIndex': 'index',
+    'LiveAnalyzer': 'live',
+    'LiveMetrics': 'live',
+    'BatchManifest': 'manifest',
+    'normalized_power': 'metrics',
+    'rolling_mean': 'metrics',
+    'ExtraPower': 'physics',
+    'extra_power': 'physics',
+    'ModelledPower': 'power_model',
+    'fit_cda_crr': 'power_model',
+    'model_power': 'power_model',
+    'open_results': 'results',
+    'read_results': 'results',
+    'Ride': 'ride',
+    'Segment': 'segments',
+    'segment_ride': 'segments',
+    'read_series': 'series',
+    'step_series': 'series',
+    'write_series': 'series',
+    'MassSweep': 'sweep',
+    'SweepBasis': 'sweep',
+    'mass_sweep': 'sweep',
+    'sweep_basis': 'sweep',
+    'synthetic_ride': 'synthetic',
+    'write_tcx': 'synthetic',
+    'TrackpointRecord': 'tcx',
+    'iter_trackpoints': 'tcx',
+}
+
+__all__ = [
+    'Archive',
+    'BatchManifest',
+    'ExtraPower',
+    'IntervalCost',
+    'IntervalIndex',
+    'LiveAnalyzer',
+    'LiveMetrics',
+    'MassSweep',
+    'ModelledPower',
+    'PowerCurve',
+    'Ride',
+    'RideAnalysis',
+    'RideCache',
+    'Segment',
+    'SweepBasis',
+    'TrackpointRecord',
+    'analyze_ride',
+    'build_archive',
+    'extra_power',
+    'fit_cda_crr',
+    'iter_trackpoints',
+    'load_ride',
+    'mass_sweep',
+    'mean_max',
+    'model_power',
+    'normalized_power',
+    'open_results',
+    'open_ride',
+    'read_results',
+    'read_series',
+    'resample',
+    'rolling_mean',
+    'scan_tcx',
+    'season_best',
+    'segment_ride',
+    'step_series',
+    'sweep_basis',
+    'synthetic_ride',
+    'write_archive',
+    'write_series',
+    'write_tcx',
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
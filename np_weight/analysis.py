@@ -0,0 +1,142 @@
+"""
+Analysis engine shared by every report.
+
+open_ride() loads a TCX file (through the cache if one is given), keeps the
+trackpoints a report needs and optionally resamples them; analyze_ride()
+runs the extra-weight physics over the whole ride once. The front-end
+scripts only format a RideAnalysis into their own result dicts, so a fix or
+speed-up here reaches every report. RideAnalysis.index adds prefix sums for
+O(1) / O(log n) window queries (np_weight.index), and RideAnalysis.power_curve
+the mean-maximal power curves (np_weight.curve); both are built on first use.
+"""
+
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Optional
+
+import numpy as np
+
+from .cache import RideCache, load_ride
+from .columnar import is_columnar, read_ride
+from .curve import PowerCurve, power_curve
+from .index import IntervalIndex
+from .instrument import count, stage
+from .metrics import normalized_power
+from .physics import ExtraPower, extra_power
+from .resample import resample as resample_ride
+from .ride import HAS_DISTANCE, REQUIRE_PROFILE, Ride
+
+
+def open_ride(path: str, fields: int = REQUIRE_PROFILE, cache: Optional[RideCache] = None,
+              resample: bool = False) -> Ride:
+    """
+    Load a ride ready for analysis.
+
+    Args:
+        path: TCX file, or a Parquet/Arrow export (see np_weight.columnar)
+        fields: HAS_* bits a trackpoint needs to be kept (REQUIRE_TRACK or
+                REQUIRE_PROFILE)
+        cache: optional parsed-ride cache
+        resample: put the ride on a 1 Hz grid (gaps > 10 s are kept)
+    """
+    ride = read_ride(path) if is_columnar(path) else load_ride(path, cache)
+    with stage('select'):
+        selected = ride.select(fields)
+    count('trackpoints.skipped', len(ride) - len(selected))
+    if resample:
+        with stage('resample'):
+            return resample_ride(selected)
+    return selected
+
+
+@dataclass
+class RideAnalysis:
+    """Extra-weight analysis of one ride (per-step series have len(ride) - 1 entries)."""
+    file_name: Optional[str]
+    trackpoints: int
+    duration: float  # s, elapsed
+    distance: float  # m, NaN without distance data
+    elevation: np.ndarray  # m per trackpoint
+    speed: np.ndarray  # m/s per step
+    measured: np.ndarray  # W per step, 0 where the file has no power
+    extra: ExtraPower
+    distances: Optional[np.ndarray] = None  # m per trackpoint, cumulative
+
+    @cached_property
+    def index(self) -> IntervalIndex:
+        """Prefix sums for window queries, built on first use."""
+        with stage('index'):
+            return IntervalIndex(self.extra, self.measured, self.distances)
+
+    @cached_property
+    def power_curve(self) -> PowerCurve:
+        """Mean-maximal power curves, measured and with the extra weight."""
+        with stage('power_curve'):
+            return power_curve(self)
+
+    @property
+    def has_measured_power(self) -> bool:
+        return bool((self.measured > 0).any())
+
+    @property
+    def with_extra(self) -> np.ndarray:
+        """Measured power plus the extra-weight cost (W per step)."""
+        return self.measured + self.extra.total
+
+    @property
+    def avg_measured(self) -> Optional[float]:
+        """Average of the measured power readings (W), None without power data."""
+        with_data = self.measured > 0
+        return float(self.measured[with_data].mean()) if with_data.any() else None
+
+    @property
+    def avg_with_extra(self) -> Optional[float]:
+        """Average power with the extra weight at the measured readings (W)."""
+        with_data = self.measured > 0
+        return float(self.with_extra[with_data].mean()) if with_data.any() else None
+
+    @property
+    def np_measured(self) -> Optional[float]:
+        """NP of the measured power (W), None without power data."""
+        return normalized_power(self.measured) if self.has_measured_power else None
+
+    @property
+    def np_with_extra(self) -> float:
+        """
+        NP with the extra weight (W).
+
+        Without power data this is the NP of the extra-weight cost alone.
+        """
+        if self.has_measured_power:
+            return normalized_power(self.with_extra)
+        return self.extra.normalized_power
+
+
+def analyze_ride(ride: Ride, extra_weight: float = 1.0) -> Optional[RideAnalysis]:
+    """
+    Run the extra-weight physics over a ride.
+
+    Returns:
+        RideAnalysis, or None if the ride has fewer than two trackpoints
+    """
+    if len(ride) < 2:
+        return None
+    with stage('physics'):
+        extra = extra_power(ride.speed, ride.elevation, extra_weight, dt=ride.dt())
+    distance = float(ride.distance[-1]) if ride.mask[-1] & HAS_DISTANCE else float('nan')
+    if ride.has(HAS_DISTANCE).all():
+        distances = ride.distance
+    else:
+        # Integrate the speed where the file has no complete distance record
+        distances = np.r_[0.0, np.cumsum(ride.speed[1:] * extra.dt)]
+    return RideAnalysis(
+        file_name=ride.file_name,
+        trackpoints=len(ride),
+        duration=ride.duration,
+        distance=distance,
+        elevation=ride.elevation,
+        speed=ride.speed[1:],
+        measured=ride.watts[1:],
+        extra=extra,
+        distances=distances,
+    )
@@ -0,0 +1,304 @@
+"""
+Memory-mapped season archive.
+
+Every run that compares many races would otherwise parse each TCX file
+again. A season archive stores the parsed rides in one binary file:
+
+    magic (8 bytes) | header length (uint64) | JSON header | column blocks
+
+The header indexes the rides (name, source path, content digest, first row
+and row count) and locates one fixed-dtype block per column, holding that
+column for every ride back to back. Archive maps the file read-only, so
+archive['ride.tcx'] is a Ride whose arrays are zero-copy slices of the map,
+and archive.column('watts') covers the whole season for cross-ride queries.
+Timestamps are stored decoded as well, so nothing is parsed on load. At about
+85 bytes per trackpoint, a season of 1 Hz racing fits in tens of MB.
+
+Rides are looked up by file name, so the names in one archive must be
+unique: two inputs called ride.tcx from different directories are refused.
+The analyze command works on the mapped slices too. Only a ride with
+trackpoints missing a time or elevation is copied, when select() drops them.
+
+Run as a script to build or inspect an archive:
+
+    python -m np_weight.archive build season.npwa ~/season_2025
+    python -m np_weight.archive analyze season.npwa --extra-weight 1
+"""
+
+import argparse
+import json
+import os
+import struct
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .analysis import analyze_ride
+from .batch import expand_tcx_inputs
+from .cache import DEFAULT_CACHE_DIR, RideCache, file_digest, load_ride
+from .ride import COLUMNS, REQUIRE_PROFILE, Ride
+from .tcx import READER_VERSION
+
+MAGIC = b'NPWARCH\x00'
+# Bump whenever the layout changes
+ARCHIVE_VERSION = 1
+
+# Column blocks in file order; 'time' is S<n> with n the widest timestamp
+_DTYPES = {
+    'time': None,
+    'epoch': '<f8',
+    'latitude': '<f8',
+    'longitude': '<f8',
+    'elevation': '<f8',
+    'distance': '<f8',
+    'speed': '<f8',
+    'cadence': '<i2',
+    'watts': '<f8',
+    'mask': '|u1',
+}
+
+# Column blocks start on this boundary
+_ALIGN = 64
+
+_PREFIX = struct.Struct('<8sQ')
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def write_archive(path: Union[str, Path], rides: Sequence[Ride],
+                  digests: Optional[Sequence[Optional[str]]] = None) -> None:
+    """
+    Write rides to a season archive, replacing `path` atomically.
+
+    Raises ValueError if two rides have the same file name, since rides
+    are looked up by name.
+
+    Args:
+        path: archive file
+        rides: rides in archive order
+        digests: optional content digest of each ride's TCX file (see
+                 cache.file_digest), used by build_archive() to skip
+                 unchanged files
+    """
+    rides = list(rides)
+    digests = list(digests) if digests is not None else [None] * len(rides)
+    if len(digests) != len(rides):
+        raise ValueError('need one digest per ride')
+    names = Counter(ride.file_name for ride in rides if ride.file_name is not None)
+    duplicates = sorted(name for name, n in names.items() if n > 1)
+    if duplicates:
+        sources = [ride.source for ride in rides if ride.file_name in duplicates]
+        raise ValueError(f"duplicate ride names {', '.join(duplicates)} "
+                         f"(from {', '.join(map(str, sources))})")
+    lengths = [len(ride) for ride in rides]
+    starts = np.r_[0, np.cumsum(lengths, dtype=np.int64)]
+    total = int(starts[-1])
+    width = max([ride.time.dtype.itemsize for ride in rides if len(ride)] or [1])
+    dtypes = {name: np.dtype(dtype or f'S{width}') for name, dtype in _DTYPES.items()}
+
+    columns = {}
+    offset = 0
+    for name, dtype in dtypes.items():
+        columns[name] = {'dtype': dtype.str, 'offset': offset}
+        offset += _aligned(dtype.itemsize * total)
+    header = json.dumps({
+        'version': ARCHIVE_VERSION,
+        'reader_version': READER_VERSION,
+        'trackpoints': total,
+        'columns': columns,
+        'rides': [{'name': ride.file_name, 'source': ride.source, 'digest': digest,
+                   'start': int(start), 'length': length}
+                  for ride, digest, start, length in zip(rides, digests, starts, lengths)],
+    }).encode('utf-8')
+    data_start = _aligned(_PREFIX.size + len(header))
+
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, len(header)))
+            f.write(header)
+            f.write(bytes(data_start - f.tell()))
+            for name, dtype in dtypes.items():
+                block_start = f.tell()
+                for ride in rides:
+                    values = ride.epoch if name == 'epoch' else getattr(ride, name)
+                    f.write(np.ascontiguousarray(values, dtype=dtype).data)
+                f.write(bytes(_aligned(f.tell() - block_start) - (f.tell() - block_start)))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Archive:
+    """
+    Read-only view of a season archive.
+
+    Rides are looked up by position or file name; their arrays are slices of
+    the memory map, so only the pages actually used are ever read.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) != _PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+                raise ValueError(f'{self.path}: not a ride archive')
+            _, size = _PREFIX.unpack(prefix)
+            header = json.loads(f.read(size))
+        if header['version'] != ARCHIVE_VERSION:
+            raise ValueError(f"{self.path}: archive version {header['version']}, "
+                             f'expected {ARCHIVE_VERSION}')
+        self.reader_version = header['reader_version']
+        self.trackpoints = header['trackpoints']
+        self.index = header['rides']
+        self._layout = header['columns']
+        self._data_start = _aligned(_PREFIX.size + size)
+        self._map = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self._columns = {}
+        self._by_name = {entry['name']: i for i, entry in enumerate(self.index)}
+
+    def __repr__(self) -> str:
+        return f'Archive({str(self.path)!r}, {len(self)} rides, {self.trackpoints} trackpoints)'
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __iter__(self) -> Iterator[Ride]:
+        return self.rides()
+
+    def __getitem__(self, key: Union[int, str]) -> Ride:
+        """Ride by position or file name."""
+        i = self._by_name[key] if isinstance(key, str) else key
+        entry = self.index[i]
+        rows = slice(entry['start'], entry['start'] + entry['length'])
+        ride = Ride(*(self.column(col)[rows] for col in COLUMNS), source=entry['source'])
+        ride._epoch = self.column('epoch')[rows]
+        return ride
+
+    @property
+    def names(self) -> List[Optional[str]]:
+        return [entry['name'] for entry in self.index]
+
+    @property
+    def digests(self) -> List[Optional[str]]:
+        return [entry['digest'] for entry in self.index]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """First row of each ride in the season columns, plus the total (len(self) + 1 entries)."""
+        return np.array([entry['start'] for entry in self.index] + [self.trackpoints],
+                        dtype=np.int64)
+
+    def column(self, name: str) -> np.ndarray:
+        """One column for the whole season (read-only, zero-copy)."""
+        values = self._columns.get(name)
+        if values is None:
+            layout = self._layout[name]
+            dtype = np.dtype(layout['dtype'])
+            start = self._data_start + layout['offset']
+            block = self._map[start:start + dtype.itemsize * self.trackpoints]
+            values = self._columns[name] = block.view(dtype=dtype, type=np.ndarray)
+        return values
+
+    def rides(self, keys: Optional[Sequence[Union[int, str]]] = None) -> Iterator[Ride]:
+        """Rides in archive order, or those named by `keys` (positions or file names)."""
+        for key in (range(len(self)) if keys is None else keys):
+            yield self[key]
+
+
+def build_archive(path: Union[str, Path], tcx_files: Sequence[Union[str, Path]],
+                  cache: Optional[RideCache] = None) -> Archive:
+    """
+    Write an archive holding `tcx_files`, in that order.
+
+    If `path` already holds an archive, rides whose file content is unchanged
+    are copied from it instead of being parsed again. Raises ValueError if
+    two files have the same name (see write_archive()).
+    """
+    previous: Dict[str, Ride] = {}
+    try:
+        old = Archive(path)
+    except (OSError, ValueError, KeyError):
+        old = None
+    if old is not None and old.reader_version == READER_VERSION:
+        previous = {digest: old[i] for i, digest in enumerate(old.digests) if digest}
+
+    rides, digests = [], []
+    for tcx_file in tcx_files:
+        digest = file_digest(tcx_file)
+        ride = previous.get(digest)
+        if ride is None:
+            ride = load_ride(tcx_file, cache)
+        else:
+            ride.source = str(tcx_file)
+        rides.append(ride)
+        digests.append(digest)
+    write_archive(path, rides, digests)
+    return Archive(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or query a season ride archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='write an archive from TCX files')
+    build.add_argument('archive', help='archive file')
+    build.add_argument('inputs', nargs='+', help='TCX files or directories')
+    build.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                       help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    info = commands.add_parser('info', help='list the rides in an archive')
+    info.add_argument('archive', help='archive file')
+    analyze = commands.add_parser('analyze', help='extra-weight cost of archived rides')
+    analyze.add_argument('archive', help='archive file')
+    analyze.add_argument('--ride', action='append', dest='rides', metavar='NAME',
+                         help='analyze only this ride (repeatable)')
+    analyze.add_argument('--extra-weight', type=float, default=1.0,
+                         help='extra weight in kg')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        cache = RideCache(args.cache_dir) if args.cache_dir else None
+        try:
+            archive = build_archive(args.archive, expand_tcx_inputs(args.inputs), cache)
+        except ValueError as e:
+            print(f"✗ {args.archive}: {e}")
+            return
+        size = archive.path.stat().st_size
+        print(f"✓ {archive.path}: {len(archive)} rides, {archive.trackpoints} trackpoints, "
+              f"{size / 1e6:.1f} MB")
+        return
+
+    archive = Archive(args.archive)
+    if args.command == 'info':
+        for entry in archive.index:
+            print(f"{entry['length']:>8}  {entry['name']}")
+        print(f"{archive.trackpoints:>8}  total in {len(archive)} rides")
+        return
+
+    print(f"{'Ride':<50} {'Minutes':>8} {'Extra avg':>10} {'Extra NP':>9} {'NP + extra':>11}")
+    for ride in archive.rides(args.rides):
+        # select() returns the mapped ride itself unless rows are missing
+        analysis = analyze_ride(ride.select(REQUIRE_PROFILE), args.extra_weight)
+        if analysis is None:
+            print(f"✗ {ride.file_name} (insufficient data)")
+            continue
+        np_new = f"{analysis.np_with_extra:.1f} W" if analysis.has_measured_power else 'N/A'
+        print(f"{(ride.file_name or '')[:50]:<50} {analysis.duration / 60:>8.1f} "
+              f"{analysis.extra.average:>8.2f} W {analysis.extra.normalized_power:>7.2f} W "
+              f"{np_new:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Parallel multi-file batch runner.
+
+Spreads TCX files across a process pool and streams each file's result back
+as soon as it finishes. Every file runs inside its own try/except, so one bad
+upload is reported as an error without stopping the batch.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from . import instrument
+
+
+class BatchResult(NamedTuple):
+    """Outcome for one input file; exactly one of result/error is meaningful."""
+    path: str
+    result: Optional[dict]
+    error: Optional[str] = None
+    metrics: Optional[dict] = None  # instrument report, when instrumentation is on
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_one(analyze: Callable[[str], Optional[dict]], path: str,
+             trace_memory: Optional[bool] = None) -> BatchResult:
+    """
+    Analyze one file, turning any exception into an error result.
+
+    With `trace_memory` not None the file is instrumented and its report
+    returned with the result.
+    """
+    if trace_memory is None:
+        try:
+            return BatchResult(path, analyze(path))
+        except Exception as e:
+            return BatchResult(path, None, f'{type(e).__name__}: {e}')
+    with instrument.recording(trace_memory) as recorder:
+        item = run_one(analyze, path)
+    return item._replace(metrics=recorder.report())
+
+
+def default_workers() -> int:
+    """One worker per available CPU."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def run_batch(paths: Iterable[str], analyze: Callable[[str], Optional[dict]],
+              workers: Optional[int] = None) -> Iterator[BatchResult]:
+    """
+    Analyze many files in parallel, yielding results as they complete.
+
+    While instrumentation is on (np_weight.instrument.enable()), each file is
+    recorded separately and its report is merged into the active recorder.
+
+    Args:
+        paths: input files
+        analyze: picklable callable (module-level function or functools.partial)
+                 mapping a path to a result dict, or None if nothing to report
+        workers: process count; None uses every CPU, 1 runs in this process
+
+    Yields:
+        BatchResult per file, in completion order
+    """
+    paths = [str(p) for p in paths]
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(paths) or 1))
+    recorder = instrument.active()
+    trace_memory = recorder.trace_memory if recorder is not None else None
+
+    for item in _run_all(analyze, paths, workers, trace_memory):
+        if recorder is not None and item.metrics is not None:
+            recorder.merge(item.metrics, Path(item.path).name)
+        yield item
+
+
+def _run_all(analyze, paths, workers, trace_memory) -> Iterator[BatchResult]:
+    if workers == 1:
+        for path in paths:
+            yield run_one(analyze, path, trace_memory)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_one, analyze, path, trace_memory): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # Worker died (e.g. killed by the OOM killer)
+                yield BatchResult(futures[future], None, f'{type(e).__name__}: {e}')
+
+
+def find_tcx_files(directory: str) -> list:
+    """TCX files in `directory`, sorted by name for a stable order."""
+    return sorted(Path(directory).glob('*.tcx'))
+
+
+def expand_tcx_inputs(inputs: Sequence[str]) -> list:
+    """TCX files named directly or found in named directories."""
+    files = []
+    for name in inputs:
+        files.extend(find_tcx_files(name) if Path(name).is_dir() else [Path(name)])
+    return files
@@ -0,0 +1,225 @@
+"""
+Benchmarks for the parsing and analysis hot paths.
+
+Times TCX parsing (byte-scanning and XML readers), the vectorised analysis,
+the per-point live analyzer, NP and an end-to-end batch run, and records the
+peak memory of parse + analyze, on the bundled race files and on synthetic
+1, 6 and 24 hour rides (np_weight.synthetic, fixed seed). Results are saved
+as JSON and can be compared with an earlier run; any benchmark slower (or
+hungrier) than the baseline by more than the threshold is reported and makes
+the command exit with status 1:
+
+    python -m np_weight.bench --save baseline.json
+    python -m np_weight.bench --baseline baseline.json --threshold 0.15
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .analysis import analyze_ride, open_ride
+from .batch import find_tcx_files, run_batch
+from .live import LiveAnalyzer
+from .metrics import normalized_power
+from .ride import Ride
+from .synthetic import synthetic_ride, write_tcx
+from .tcx import iter_trackpoints
+
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+SYNTHETIC_HOURS = (1, 6, 24)
+SYNTHETIC_SEED = 2025
+# Shortest timed run; faster benchmarks are looped to fill it
+MIN_RUN_SECONDS = 0.02
+
+
+class Regression(NamedTuple):
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+
+def time_call(fn: Callable[[], object], repeat: int = DEFAULT_REPEAT) -> Dict[str, float]:
+    """
+    Best and median wall time per call over `repeat` runs, in seconds.
+
+    Fast calls are looped within each run until it lasts MIN_RUN_SECONDS,
+    so sub-millisecond benchmarks are not swamped by timer noise.
+    """
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+    number = max(1, math.ceil(MIN_RUN_SECONDS / first)) if first > 0 else 1
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    return {'seconds': min(runs), 'median_seconds': statistics.median(runs)}
+
+
+def peak_memory(fn: Callable[[], object]) -> int:
+    """Peak bytes allocated (Python and NumPy) while `fn` runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def make_datasets(tcx_dir: str, work_dir: str,
+                  hours: Sequence[float] = SYNTHETIC_HOURS) -> Dict[str, List[Path]]:
+    """
+    Benchmark inputs: 'bundled' (the TCX files in `tcx_dir`) and one
+    synthetic ride per entry in `hours`, written to `work_dir`.
+    """
+    bundled = find_tcx_files(tcx_dir)
+    if not bundled:
+        raise ValueError(f'no TCX files in {tcx_dir}')
+    datasets = {'bundled': bundled}
+    for h in hours:
+        path = Path(work_dir) / f'synthetic_{h:g}h.tcx'
+        write_tcx(synthetic_ride(hours=h, seed=SYNTHETIC_SEED), path)
+        datasets[f'synthetic-{h:g}h'] = [path]
+    return datasets
+
+
+def _parse_and_analyze(path: str) -> dict:
+    """Batch worker: parse and analyze one file."""
+    analysis = analyze_ride(open_ride(path))
+    return {'np_with_extra': analysis.np_with_extra} if analysis else None
+
+
+def _run_all(fn: Callable, items: Sequence) -> Callable[[], None]:
+    def run():
+        for item in items:
+            fn(item)
+    return run
+
+
+def run_benchmarks(datasets: Dict[str, List[Path]], repeat: int = DEFAULT_REPEAT,
+                   only: Optional[str] = None, log=print) -> Dict[str, dict]:
+    """
+    Run every benchmark; returns {name: {'seconds', 'median_seconds',
+    'trackpoints', 'us_per_point'} or {'peak_bytes', 'trackpoints'}}.
+    """
+    results = {}
+
+    def record(name, trackpoints, fn, memory=False):
+        if only and only not in name:
+            return
+        if memory:
+            result = {'peak_bytes': peak_memory(fn)}
+        else:
+            result = time_call(fn, repeat)
+            result['us_per_point'] = result['seconds'] / trackpoints * 1e6
+        result['trackpoints'] = trackpoints
+        results[name] = result
+        log(format_result(name, result))
+
+    for label, paths in datasets.items():
+        rides = [Ride.from_tcx(path) for path in paths]
+        n = sum(len(ride) for ride in rides)
+        record(f'parse.fast/{label}', n, _run_all(Ride.from_tcx, paths))
+        record(f'parse.xml/{label}', n, _run_all(partial(Ride.from_tcx, fast=False), paths))
+        record(f'analyze/{label}', n, _run_all(analyze_ride, rides))
+        analyses = [a for a in map(analyze_ride, rides) if a is not None]
+        record(f'np/{label}', n, _run_all(lambda a: normalized_power(a.with_extra), analyses))
+        records = [list(iter_trackpoints(path)) for path in paths]
+        record(f'live/{label}', n, _run_all(lambda r: LiveAnalyzer().extend(r), records))
+        record(f'batch/{label}', n,
+               lambda: list(run_batch(paths, _parse_and_analyze, workers=1)))
+        record(f'memory/{label}', n, _run_all(_parse_and_analyze, paths), memory=True)
+    return results
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Regression]:
+    """Benchmarks present in both runs that got worse by more than `threshold`."""
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if metric in result and base.get(metric):
+                if result[metric] > base[metric] * (1 + threshold):
+                    regressions.append(Regression(name, metric, base[metric], result[metric]))
+    return regressions
+
+
+def format_result(name: str, result: dict) -> str:
+    if 'peak_bytes' in result:
+        return f"{name:<32} {result['peak_bytes'] / 1e6:>9.1f} MB peak"
+    return (f"{name:<32} {result['seconds'] * 1e3:>9.2f} ms "
+            f"(median {result['median_seconds'] * 1e3:.2f} ms, "
+            f"{result['us_per_point']:.2f} µs/point)")
+
+
+def environment() -> dict:
+    """Interpreter, NumPy and machine details saved alongside the results."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark parsing and analysis')
+    parser.add_argument('directory', nargs='?', default='.',
+                        help='directory containing the bundled .tcx files (default: current)')
+    parser.add_argument('--hours', type=float, nargs='*', default=list(SYNTHETIC_HOURS),
+                        help='lengths of the synthetic rides in hours')
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='timed runs per benchmark (the best is kept)')
+    parser.add_argument('-k', '--only', metavar='TEXT',
+                        help='run only benchmarks whose name contains TEXT')
+    parser.add_argument('--save', metavar='PATH', help='write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved run')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown before a regression is reported (0.10 = 10%%)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='np_weight_bench_') as work_dir:
+        datasets = make_datasets(args.directory, work_dir, args.hours)
+        results = run_benchmarks(datasets, args.repeat, args.only)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Results saved to: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"✗ {r.name} {r.metric}: {r.baseline:.4g} → {r.current:.4g} "
+                  f"(+{(r.ratio - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"✓ no regressions over {args.threshold * 100:.0f}% against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
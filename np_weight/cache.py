@@ -0,0 +1,147 @@
+"""
+Persistent cache of parsed rides.
+
+Parsing is the expensive part of every run, yet only the analysis parameters
+(rider_mass, extra_weight, ...) change between runs. RideCache stores each
+parsed Ride as an .npz file keyed by a hash of the TCX file's bytes and the
+reader version, so a re-run loads the columns in milliseconds and never
+touches the XML. Entries are evicted least-recently-used once the cache
+grows past `max_bytes`.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional, Union
+
+from .instrument import count, stage
+from .ride import Ride
+from .tcx import READER_VERSION
+
+DEFAULT_CACHE_DIR = Path(os.environ.get('NP_WEIGHT_CACHE_DIR', '~/.cache/np_weight_analysis')).expanduser()
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_CHUNK = 1 << 20
+
+
+def bytes_digest(data: bytes) -> str:
+    """BLAKE2b digest of in-memory file contents (equal to file_digest of the file)."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """BLAKE2b digest of a file's contents."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RideCache:
+    """Size-bounded LRU cache of parsed rides on disk."""
+
+    def __init__(self, directory: Union[str, Path] = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def __repr__(self) -> str:
+        return f'RideCache({str(self.directory)!r}, max_bytes={self.max_bytes})'
+
+    def key(self, path: Union[str, Path]) -> str:
+        """Cache key for a TCX file: content hash plus reader version."""
+        return self.digest_key(file_digest(path))
+
+    @staticmethod
+    def digest_key(digest: str) -> str:
+        """Cache key for content with the given file_digest()."""
+        return f'{digest}-v{READER_VERSION}'
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / f'{key}.npz'
+
+    def get(self, key: str, source: Optional[str] = None) -> Optional[Ride]:
+        """Cached Ride for `key`, or None on a miss or unreadable entry."""
+        entry = self._entry(key)
+        try:
+            ride = Ride.load(entry)
+            # Mark as recently used for LRU eviction
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            return None
+        if source is not None:
+            ride.source = source
+        return ride
+
+    def put(self, key: str, ride: Ride) -> None:
+        """Store a Ride, then evict old entries if over budget."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so concurrent workers never see
+        # a half-written entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                ride.save(f)
+            os.replace(tmp, self._entry(key))
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def load(self, path: Union[str, Path]) -> Ride:
+        """Ride for a TCX file, parsing and caching it on a miss."""
+        with stage('cache.get'):
+            key = self.key(path)
+            ride = self.get(key, source=str(path))
+        if ride is None:
+            count('cache.miss')
+            ride = Ride.from_tcx(path)
+            with stage('cache.put'):
+                self.put(key, ride)
+        else:
+            count('cache.hit')
+        return ride
+
+    def size(self) -> int:
+        """Total bytes held by cache entries."""
+        return sum(st.st_size for _, st in self._entries())
+
+    def _entries(self):
+        for entry in self.directory.glob('*.npz'):
+            try:
+                yield entry, entry.stat()
+            except OSError:
+                continue
+
+    def evict(self) -> None:
+        """Delete least-recently-used entries until within max_bytes."""
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        for entry, st in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            total -= st.st_size
+
+    def clear(self) -> None:
+        """Remove every cache entry."""
+        for entry, _ in self._entries():
+            try:
+                entry.unlink()
+            except OSError:
+                pass
+
+
+def load_ride(path: Union[str, Path], cache: Optional[RideCache] = None) -> Ride:
+    """Parse a TCX file into a Ride, going through `cache` when given."""
+    if cache is None:
+        return Ride.from_tcx(path)
+    return cache.load(path)
@@ -0,0 +1,238 @@
+"""
+Parquet / Arrow IPC export of rides and their extra-weight cost.
+
+ride_table() turns a Ride into an Arrow table with one row per trackpoint:
+the recorded fields (null where the file had no value) plus the per-step
+extra-weight columns for the step ending at that trackpoint:
+
+    dt, kinetic, potential, extra_power, elevation_delta   (null on the first row)
+
+write_ride() stores it as Parquet (row groups of ten minutes, with min/max
+statistics) or Arrow IPC, so the analysis can run from a data lake instead
+of raw TCX directories. read_ride() turns such a file back into the same
+Ride, so open_ride() and the front-ends accept .parquet/.arrow paths
+directly. read_table() reads only the columns asked for and pushes filters
+down to the row groups, and extra_power_from_table() summarises the stored
+cost columns of whatever rows were read, e.g. climbing sections only:
+
+    python -m np_weight.columnar export lake/ ~/season_2025
+    python -m np_weight.columnar analyze lake/ --climbing
+
+Requires pyarrow (pip install pyarrow); the rest of np_weight does not.
+"""
+
+import argparse
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+from .batch import expand_tcx_inputs
+from .cache import DEFAULT_CACHE_DIR, RideCache, load_ride
+from .physics import ExtraPower, extra_power
+from .resample import resample as resample_ride
+from .ride import (HAS_CADENCE, HAS_DISTANCE, HAS_ELEVATION, HAS_POSITION, HAS_SPEED,
+                   HAS_TIME, HAS_WATTS, Ride)
+from .tcx import READER_VERSION
+
+# File suffix → pyarrow.dataset format
+FORMATS = {'.parquet': 'parquet', '.arrow': 'ipc', '.feather': 'ipc'}
+
+# Ten minutes of 1 Hz data per Parquet row group / IPC record batch
+DEFAULT_ROW_GROUP_SIZE = 600
+
+# Trackpoint columns: (column, HAS_* bit, Arrow type name)
+_TRACKPOINT = (
+    ('latitude', HAS_POSITION, 'float64'),
+    ('longitude', HAS_POSITION, 'float64'),
+    ('elevation', HAS_ELEVATION, 'float64'),
+    ('distance', HAS_DISTANCE, 'float64'),
+    ('speed', HAS_SPEED, 'float64'),
+    ('cadence', HAS_CADENCE, 'int16'),
+    ('watts', HAS_WATTS, 'float64'),
+)
+
+STEP_COLUMNS = ('dt', 'kinetic', 'potential', 'extra_power', 'elevation_delta')
+
+_METADATA_PREFIX = 'np_weight.'
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError('Parquet/Arrow support needs pyarrow (pip install pyarrow)')
+
+
+def is_columnar(path: Union[str, Path]) -> bool:
+    """True for paths this module reads (.parquet, .arrow, .feather)."""
+    return Path(path).suffix.lower() in FORMATS
+
+
+def ride_table(ride: Ride, extra_weight: float = 1.0) -> 'pa.Table':
+    """
+    One row per trackpoint: recorded fields plus the extra-weight cost of
+    the step ending there. The extra weight and source are kept in the
+    schema metadata.
+    """
+    _require_pyarrow()
+    n = len(ride)
+    epoch = ride.epoch
+    timed = ride.has(HAS_TIME) & np.isfinite(epoch)
+    columns = {
+        'ride': pa.array([ride.file_name or ''] * n, pa.string()).dictionary_encode(),
+        'time': pa.array(np.where(timed, epoch * 1000, 0).round().astype(np.int64),
+                         pa.timestamp('ms', tz='UTC'), mask=~timed),
+    }
+    for name, bit, type_name in _TRACKPOINT:
+        columns[name] = pa.array(getattr(ride, name), getattr(pa, type_name)(),
+                                 mask=~ride.has(bit))
+
+    steps = extra_power(ride.speed, ride.elevation, extra_weight, dt=ride.dt())
+    first = np.arange(n) == 0
+    for name, values in zip(STEP_COLUMNS, (steps.dt, steps.kinetic, steps.potential,
+                                           steps.total, steps.elevation_delta)):
+        values = np.broadcast_to(values, steps.total.shape)
+        columns[name] = pa.array(np.r_[np.nan, values][:n], pa.float64(), mask=first)
+
+    metadata = {'extra_weight': repr(float(extra_weight)), 'source': ride.source or '',
+                'reader_version': str(READER_VERSION)}
+    return pa.table(columns, metadata={_METADATA_PREFIX + k: v for k, v in metadata.items()})
+
+
+def write_ride(ride: Ride, path: Union[str, Path], extra_weight: float = 1.0,
+               row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> None:
+    """Write ride_table(ride) as Parquet or Arrow IPC, chosen by the file suffix."""
+    write_table(ride_table(ride, extra_weight), path, row_group_size)
+
+
+def write_table(table: 'pa.Table', path: Union[str, Path],
+                row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> None:
+    """Write any table as Parquet or Arrow IPC, chosen by the file suffix."""
+    _require_pyarrow()
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt == 'parquet':
+        pq.write_table(table, path, row_group_size=row_group_size)
+    elif fmt == 'ipc':
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table, max_chunksize=row_group_size)
+    else:
+        raise ValueError(f'{path}: expected one of {", ".join(FORMATS)}')
+
+
+def read_table(path: Union[str, Path], columns: Optional[Sequence[str]] = None,
+               filter: Optional['ds.Expression'] = None) -> 'pa.Table':
+    """
+    Read an exported file, or a directory of them, reading only `columns`.
+
+    `filter` is a pyarrow.dataset expression (see climbing()); with Parquet,
+    row groups whose statistics rule it out are skipped without being read.
+    """
+    _require_pyarrow()
+    path = Path(path)
+    if path.is_dir():
+        suffixes = {p.suffix.lower() for p in path.iterdir() if is_columnar(p)}
+        if len(suffixes) != 1:
+            raise ValueError(f'{path}: expected files of one format ({", ".join(FORMATS)})')
+        fmt = FORMATS[suffixes.pop()]
+        files = sorted(str(p) for p in path.iterdir() if is_columnar(p))
+        dataset = ds.dataset(files, format=fmt)
+    else:
+        dataset = ds.dataset(str(path), format=FORMATS[path.suffix.lower()])
+    return dataset.to_table(columns=list(columns) if columns is not None else None, filter=filter)
+
+
+def climbing() -> 'ds.Expression':
+    """Filter for steps that gain elevation."""
+    _require_pyarrow()
+    return ds.field('elevation_delta') > 0
+
+
+def read_ride(path: Union[str, Path]) -> Ride:
+    """Ride stored in an exported file (every trackpoint, same values as the original)."""
+    table = read_table(path)
+    if len(table.column('ride').unique()) > 1:
+        raise ValueError(f'{path}: holds more than one ride')
+    source = (table.schema.metadata or {}).get((_METADATA_PREFIX + 'source').encode(), b'')
+
+    epoch = table.column('time').cast(pa.int64()).to_numpy(zero_copy_only=False)
+    epoch = np.where(table.column('time').is_null().to_numpy(zero_copy_only=False),
+                     np.nan, epoch / 1000.0)
+    valid = np.isfinite(epoch)
+    time = np.full(len(epoch), b'', dtype='S24')
+    stamps = np.datetime_as_string(np.round(epoch[valid] * 1000).astype('datetime64[ms]'), unit='ms')
+    time[valid] = np.char.add(stamps.astype('S'), b'Z')
+
+    columns = {name: table.column(name).cast(pa.float64()).to_numpy(zero_copy_only=False)
+               for name, _, _ in _TRACKPOINT}
+    ride = Ride.from_scan(dict(columns, time=time), source=source.decode() or str(path))
+    ride._epoch = epoch
+    return ride
+
+
+def extra_power_from_table(table: 'pa.Table') -> ExtraPower:
+    """
+    ExtraPower over the stored per-step columns of the rows in `table`.
+
+    Rows may come from a filtered read; the first row of each ride (no step)
+    is dropped.
+    """
+    steps = {name: table.column(name).to_numpy(zero_copy_only=False) for name in STEP_COLUMNS}
+    keep = np.isfinite(steps['dt'])
+    return ExtraPower(kinetic=steps['kinetic'][keep], potential=steps['potential'][keep],
+                      total=steps['extra_power'][keep],
+                      elevation_delta=steps['elevation_delta'][keep], dt=steps['dt'][keep])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export rides to Parquet/Arrow and analyze them')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write one file per TCX ride')
+    export.add_argument('output', help='output directory')
+    export.add_argument('inputs', nargs='+', help='TCX files or directories')
+    export.add_argument('--format', choices=('parquet', 'arrow'), default='parquet')
+    export.add_argument('--extra-weight', type=float, default=1.0,
+                        help='extra weight in kg for the cost columns')
+    export.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    export.add_argument('--resample', action='store_true',
+                        help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    analyze = commands.add_parser('analyze', help='extra-weight cost from exported files')
+    analyze.add_argument('path', help='exported file or directory')
+    analyze.add_argument('--climbing', action='store_true',
+                         help='only steps that gain elevation')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        cache = RideCache(args.cache_dir) if args.cache_dir else None
+        output = Path(args.output)
+        output.mkdir(parents=True, exist_ok=True)
+        for tcx_file in expand_tcx_inputs(args.inputs):
+            try:
+                ride = load_ride(tcx_file, cache)
+                if args.resample:
+                    ride = resample_ride(ride)
+                target = output / (Path(tcx_file).stem + '.' + args.format)
+                write_ride(ride, target, args.extra_weight)
+                print(f"✓ {target}")
+            except Exception as e:
+                print(f"✗ {Path(tcx_file).name} (error: {str(e)[:50]})")
+        return
+
+    table = read_table(args.path, columns=('ride', *STEP_COLUMNS),
+                       filter=climbing() if args.climbing else None)
+    rides = table.column('ride').to_numpy(zero_copy_only=False)
+    print(f"{'Ride':<50} {'Minutes':>8} {'Extra avg':>10} {'Extra NP':>9} {'Energy':>9}")
+    for name in sorted(set(rides)):
+        extra = extra_power_from_table(table.filter(pa.array(rides == name)))
+        print(f"{name[:50]:<50} {extra.duration / 60:>8.1f} {extra.average:>8.2f} W "
+              f"{extra.normalized_power:>7.2f} W {extra.energy / 1000:>6.1f} kJ")
+
+
+if __name__ == '__main__':
+    main()
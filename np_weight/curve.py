@@ -0,0 +1,272 @@
+"""
+Mean-maximal power (power-duration) curves.
+
+For every duration d from 1 s to the ride's length, the curve holds the best
+average power over any d consecutive seconds. There is one curve for the
+measured power and one for the measured power plus the extra-weight cost,
+so their difference shows at which durations the weight penalty bites.
+
+Each duration is one vectorised pass over the cumulative sum: the window
+sums csum[d:] - csum[:-d] are formed in a reused buffer and their maximum is
+taken. That is n²/2 additions in NumPy, about 20 ms for an hour at 1 Hz and
+a few seconds for 24 h; `max_duration` caps the work on long rides.
+
+Curves are cached per ride in memory (RideAnalysis.power_curve) and, with a
+RideCache, on disk next to the parsed ride. They merge into a season-best
+curve that records which ride set each best:
+
+    python -m np_weight.curve *.tcx --season --cache-dir
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from functools import reduce
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .cache import DEFAULT_CACHE_DIR, RideCache
+
+# Durations (s) shown in reports
+REPORT_DURATIONS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def mean_max(power: np.ndarray, max_duration: Optional[int] = None) -> np.ndarray:
+    """
+    Best average of `power` over every window of 1..max_duration samples.
+
+    Returns an array whose entry d - 1 is the mean-maximal power for d
+    samples (seconds at 1 Hz). Defaults to every duration up to len(power).
+    """
+    power = np.asarray(power, dtype=np.float64)
+    n = len(power)
+    longest = n if max_duration is None else min(max_duration, n)
+    csum = np.empty(n + 1)
+    csum[0] = 0.0
+    np.cumsum(power, out=csum[1:])
+    best = np.empty(longest)
+    sums = np.empty(n)
+    for d in range(1, longest + 1):
+        window = sums[:n - d + 1]
+        np.subtract(csum[d:], csum[:-d], out=window)
+        best[d - 1] = window.max() / d
+    return best
+
+
+@dataclass
+class PowerCurve:
+    """
+    Mean-maximal power per duration (entry d - 1 is d seconds), with and
+    without the extra weight, and the ride that set each value.
+    """
+    measured: np.ndarray  # W
+    with_extra: np.ndarray  # W, measured + extra-weight cost
+    rides: List[str] = field(default_factory=list)
+    measured_ride: Optional[np.ndarray] = None  # index into rides per duration
+    with_extra_ride: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        if self.measured_ride is None:
+            self.measured_ride = np.zeros(len(self.measured), dtype=np.int32)
+        if self.with_extra_ride is None:
+            self.with_extra_ride = np.zeros(len(self.with_extra), dtype=np.int32)
+
+    def __len__(self) -> int:
+        """Longest duration covered (s)."""
+        return len(self.measured)
+
+    @property
+    def penalty(self) -> np.ndarray:
+        """Extra watts at each duration: with_extra - measured."""
+        return self.with_extra - self.measured
+
+    def at(self, seconds: int) -> Optional[dict]:
+        """Both curves at one duration, None beyond the longest."""
+        if not 1 <= seconds <= len(self):
+            return None
+        i = seconds - 1
+        return {
+            'seconds': seconds,
+            'measured': float(self.measured[i]),
+            'with_extra': float(self.with_extra[i]),
+            'penalty': float(self.with_extra[i] - self.measured[i]),
+            'measured_ride': self.rides[self.measured_ride[i]] if self.rides else None,
+            'with_extra_ride': self.rides[self.with_extra_ride[i]] if self.rides else None,
+        }
+
+    def to_dict(self, durations: Sequence[int] = REPORT_DURATIONS) -> dict:
+        return {'longest': len(self), 'rides': self.rides,
+                'points': [p for p in map(self.at, durations) if p is not None]}
+
+    def merge(self, other: 'PowerCurve') -> 'PowerCurve':
+        """Best of both curves at every duration (the longer one's tail is kept)."""
+        n = max(len(self), len(other))
+        offset = len(self.rides)
+
+        def best(a, a_ride, b, b_ride):
+            values = np.full(n, -np.inf)
+            rides = np.zeros(n, dtype=np.int32)
+            values[:len(a)], rides[:len(a)] = a, a_ride
+            better = np.zeros(n, dtype=bool)
+            better[:len(b)] = b > values[:len(b)]
+            values[better] = b[better[:len(b)]]
+            rides[better] = b_ride[better[:len(b)]] + offset
+            return values, rides
+
+        measured, measured_ride = best(self.measured, self.measured_ride,
+                                       other.measured, other.measured_ride)
+        with_extra, with_extra_ride = best(self.with_extra, self.with_extra_ride,
+                                           other.with_extra, other.with_extra_ride)
+        return PowerCurve(measured, with_extra, self.rides + other.rides,
+                          measured_ride, with_extra_ride)
+
+    def save(self, file) -> None:
+        """Store as .npz (path or binary file object)."""
+        np.savez(file, measured=self.measured, with_extra=self.with_extra,
+                 rides=np.array(self.rides, dtype=str), measured_ride=self.measured_ride,
+                 with_extra_ride=self.with_extra_ride)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'PowerCurve':
+        with np.load(path) as data:
+            return cls(data['measured'], data['with_extra'], data['rides'].tolist(),
+                       data['measured_ride'], data['with_extra_ride'])
+
+
+def power_curve(analysis, max_duration: Optional[int] = None) -> PowerCurve:
+    """
+    Curves of a RideAnalysis (assumes 1 s steps; resample irregular rides).
+
+    Without power data the measured curve is all zeros and the other is the
+    curve of the extra-weight cost alone.
+    """
+    return PowerCurve(mean_max(analysis.measured, max_duration),
+                      mean_max(analysis.with_extra, max_duration),
+                      [analysis.file_name or ''])
+
+
+def season_best(curves: Iterable[PowerCurve]) -> Optional[PowerCurve]:
+    """Merge ride curves into one season-best curve (None for no curves)."""
+    curves = list(curves)
+    return reduce(PowerCurve.merge, curves) if curves else None
+
+
+def load_curve(path: Union[str, Path], cache: Optional[RideCache] = None,
+               extra_weight: float = 1.0, resample: bool = False,
+               max_duration: Optional[int] = None) -> Optional[PowerCurve]:
+    """
+    Power curve of a TCX file, stored in `cache` next to the parsed ride.
+
+    Entries are keyed by the file content and the analysis options, and are
+    evicted with the rides. Returns None for a ride too short to analyze.
+    """
+    # Imported here: analysis builds its curve from this module
+    from .analysis import analyze_ride, open_ride
+
+    entry = None
+    if cache is not None:
+        options = f'{extra_weight!r}-{int(resample)}-{max_duration or 0}'
+        entry = cache.directory / f'{cache.key(path)}-mmp-{options}.npz'
+        try:
+            curve = PowerCurve.load(entry)
+            curve.rides = [Path(path).name]
+            return curve
+        except (OSError, ValueError, KeyError):
+            pass
+
+    analysis = analyze_ride(open_ride(path, cache=cache, resample=resample), extra_weight)
+    if analysis is None:
+        return None
+    curve = power_curve(analysis, max_duration)
+    curve.rides = [Path(path).name]
+    if entry is not None:
+        cache.directory.mkdir(parents=True, exist_ok=True)
+        # Same temp-file-and-rename as RideCache.put, for concurrent workers
+        fd, tmp = tempfile.mkstemp(dir=cache.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                curve.save(f)
+            os.replace(tmp, entry)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        cache.evict()
+    return curve
+
+
+def _duration(seconds: int) -> str:
+    if seconds < 60:
+        return f'{seconds} s'
+    if seconds < 3600:
+        return f'{seconds / 60:g} min'
+    return f'{seconds / 3600:g} h'
+
+
+def format_curve(title: str, curve: PowerCurve,
+                 durations: Sequence[int] = REPORT_DURATIONS) -> str:
+    lines = [title, f"  {'Duration':>9} {'Measured':>10} {'+ extra':>10} {'Penalty':>9}"
+                    + ('  Ride' if len(curve.rides) > 1 else '')]
+    for point in map(curve.at, durations):
+        if point is None:
+            continue
+        line = (f"  {_duration(point['seconds']):>9} {point['measured']:>8.1f} W "
+                f"{point['with_extra']:>8.1f} W {point['penalty']:>7.2f} W")
+        if len(curve.rides) > 1:
+            line += f"  {point['with_extra_ride']}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mean-maximal power curves with extra weight')
+    parser.add_argument('files', nargs='+', help='TCX files')
+    parser.add_argument('--extra-weight', type=float, default=1.0, help='extra weight in kg')
+    parser.add_argument('--durations', type=int, nargs='+', default=list(REPORT_DURATIONS),
+                        metavar='S', help='durations to report, in seconds')
+    parser.add_argument('--max-duration', type=int, default=None, metavar='S',
+                        help='longest duration to compute (default: ride length)')
+    parser.add_argument('--season', action='store_true',
+                        help='also print the season-best curve over all files')
+    parser.add_argument('--json', metavar='PATH', help='write the reported points to a JSON file')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides and curves (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--resample', action='store_true',
+                        help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    args = parser.parse_args(argv)
+
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    curves = []
+    for path in args.files:
+        try:
+            curve = load_curve(path, cache, args.extra_weight, args.resample, args.max_duration)
+        except Exception as e:
+            print(f"✗ {Path(path).name} (error: {str(e)[:50]})\n")
+            continue
+        if curve is None:
+            print(f"✗ {Path(path).name} (insufficient data)\n")
+            continue
+        curves.append(curve)
+        print(format_curve(Path(path).name, curve, args.durations) + '\n')
+
+    season = season_best(curves) if args.season else None
+    if season is not None:
+        print(format_curve(f'Season best ({len(curves)} rides)', season, args.durations))
+
+    if args.json and curves:
+        result = {'rides': [c.to_dict(args.durations) for c in curves]}
+        if season is not None:
+            result['season_best'] = season.to_dict(args.durations)
+        with open(args.json, 'w') as f:
+            json.dump(result, f)
+        print(f"Results saved to: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
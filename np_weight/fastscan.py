@@ -0,0 +1,236 @@
+"""
+Byte-scanning fast path for machine-written TCX files.
+
+Garmin Connect and Sauce for Strava write every <Trackpoint> the same way:
+flat leaf elements holding plain numbers, no comments, CDATA or entities.
+For such files a full XML parse is overkill. scan_tcx() views the <Track>
+bodies as one uint8 array, finds every tag from the positions of '<' and
+'>', and gathers tag names and values into fixed-width byte arrays, so the
+whole file is tokenised and converted with a few vectorised NumPy passes
+and no per-trackpoint Python code.
+
+Tag prefixes are resolved through the file's xmlns declarations, so a field
+counts only in the namespaces np_weight.tcx reads (TrainingCenterDatabase,
+and ActivityExtension for Speed and Watts); an unprefixed field needs the
+TCD namespace or none as the default.
+
+Anything unexpected (attributes on a field, a field holding child elements
+or appearing twice in one trackpoint, a field in another namespace,
+namespace declarations inside a <Track>, entities, comments, a value that
+does not parse) makes scan_tcx() return None, and callers fall back to the
+validating reader in np_weight.tcx. Both paths produce identical rides.
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .tcx import ACTIVITY_EXT_NS, TCD_NS
+
+# Column name for each field's local tag name
+_FIELDS = {
+    b'Time': 'time',
+    b'LatitudeDegrees': 'latitude',
+    b'LongitudeDegrees': 'longitude',
+    b'AltitudeMeters': 'elevation',
+    b'DistanceMeters': 'distance',
+    b'Speed': 'speed',
+    b'Cadence': 'cadence',
+    b'Watts': 'watts',
+}
+
+# Tag kinds tracked by the scanner (Trackpoint plus each field)
+_KIND = {name: i for i, name in enumerate((b'Trackpoint', *_FIELDS), start=1)}
+
+# Namespaces each tracked tag is read in, as in np_weight.tcx (b'' is none)
+_NAMESPACES = {name: {b'', TCD_NS.encode()} for name in _KIND}
+_NAMESPACES[b'Speed'] = _NAMESPACES[b'Watts'] = {b'', TCD_NS.encode(), ACTIVITY_EXT_NS.encode()}
+
+_XMLNS = re.compile(rb'\sxmlns(?::([^\s=]+))?\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+# Longest field value accepted; longer values go to the XML parser
+_VALUE_WIDTH = 64
+
+_LT, _GT, _SLASH = ord('<'), ord('>'), ord('/')
+_ALL_BITS = np.uint64(0xFFFFFFFFFFFFFFFF)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _track_bodies(data: bytes) -> bytes:
+    """Concatenated contents of every <Track> element."""
+    parts = []
+    start = data.find(b'<Track>')
+    while start >= 0:
+        end = data.find(b'</Track>', start)
+        if end < 0:
+            break
+        parts.append(data[start + len(b'<Track>'):end])
+        start = data.find(b'<Track>', end)
+    return b''.join(parts)
+
+
+def _gather(buf: np.ndarray, start: np.ndarray, length: np.ndarray) -> np.ndarray:
+    """Slices buf[start:start + length] as one zero-padded S array."""
+    width = max(int(length.max()), 1) if len(length) else 1
+    offsets = np.arange(width)
+    index = np.minimum(start[:, None] + offsets, len(buf) - 1)
+    chars = buf[index] * (offsets < length[:, None])
+    return np.ascontiguousarray(chars).view(f'S{width}').ravel()
+
+
+def _tag_keys(words: np.ndarray, lt: np.ndarray, gt: np.ndarray):
+    """
+    64-bit key per tag from its length and first and last eight bytes.
+
+    Returns:
+        (key, first, last, length) arrays, one entry per tag
+    """
+    length = gt - lt - 1
+    short = np.minimum(length, 7).astype(np.uint64)
+    first = words[lt + 1] & np.where(length >= 8, _ALL_BITS,
+                                     (np.uint64(1) << (short * np.uint64(8))) - np.uint64(1))
+    last = np.where(length > 8, words[np.maximum(gt - 8, 0)], np.uint64(0))
+    key = first ^ (last * _MIX) ^ (length.astype(np.uint64) << np.uint64(56))
+    return key, first, last, length
+
+
+def _namespaces(data: bytes) -> Optional[Dict[Optional[bytes], bytes]]:
+    """
+    URI of each prefix declared in `data` (None for the default namespace).
+
+    None if a prefix is bound to more than one URI, which would need real
+    scoping to resolve.
+    """
+    bound = {}
+    for prefix, double, single in _XMLNS.findall(data):
+        uri = double or single
+        if bound.setdefault(prefix or None, uri) != uri:
+            return None
+    return bound
+
+
+def _split_name(name: bytes) -> Optional[Tuple[bytes, bytes]]:
+    """
+    (prefix, local name) of an opening tag, with b'' as the local name of
+    any other tag with attributes or written self-closing.
+
+    None for a trackpoint or field tag with attributes or written
+    self-closing, which the scanner does not handle.
+    """
+    word = name.split(None, 1)[0] if name.strip() else name
+    prefix, _, local = word.rstrip(b'/').rpartition(b':')
+    if word != name or word.endswith(b'/'):
+        return None if local in _KIND else (prefix, b'')
+    return prefix, local
+
+
+def scan_tcx(data: bytes) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Extract trackpoint columns from the raw bytes of a TCX file.
+
+    Returns:
+        dict of 'time' (S, b'' where missing), 'latitude', 'longitude',
+        'elevation', 'distance', 'speed', 'cadence' and 'watts' (float64,
+        NaN where missing), or None if the file needs the full XML parser
+    """
+    if b'<!' in data:
+        # Comments, CDATA and DTDs need a real parser
+        return None
+    body = _track_bodies(data)
+    if not body or not body.isascii() or b'&' in body or b'xmlns' in body:
+        return None
+    namespaces = _namespaces(data)
+    if namespaces is None:
+        return None
+
+    # Pad so that 8-byte words and value slices never run off the end
+    buf = np.frombuffer(body + bytes(_VALUE_WIDTH), dtype=np.uint8)
+    words = np.ndarray(shape=(len(body),), dtype='<u8', buffer=buf, strides=(1,))
+    text = buf[:len(body)]
+    lt = np.flatnonzero(text == _LT)
+    gt = np.flatnonzero(text == _GT)
+    if len(lt) != len(gt) or len(lt) == 0:
+        return None
+    # Every '<' must be closed by the next '>' before another '<' opens
+    if (gt < lt).any() or (lt[1:] < gt[:-1]).any():
+        return None
+
+    # Classify opening tags by key; each distinct key is named from one
+    # occurrence. Closing tags are only checked where a field ends.
+    closing = buf[lt + 1] == _SLASH
+    tag_at = np.flatnonzero(~closing)
+    key, first, last, length = _tag_keys(words, lt[tag_at], gt[tag_at])
+    _, sample, code = np.unique(key, return_index=True, return_inverse=True)
+    if ((first != first[sample][code]).any() or (last != last[sample][code]).any()
+            or (length != length[sample][code]).any()):
+        return None  # key collision
+    names = _gather(buf, lt[tag_at[sample]] + 1, length[sample]).tolist()
+    split = [_split_name(name) for name in names]
+    if None in split:
+        return None
+    local = []
+    for prefix, name in split:
+        # An undeclared prefix resolves to None and is rejected with the
+        # namespaces the XML reader does not read
+        uri = namespaces.get(prefix) if prefix else namespaces.get(None, b'')
+        if name in _KIND and uri not in _NAMESPACES[name]:
+            return None
+        local.append(name)
+    for i, name in enumerate(local):
+        # Keys cover names up to 16 bytes exactly; check longer ones in full
+        if name in _KIND and len(names[i]) > 16:
+            at = tag_at[code == i]
+            if (_gather(buf, lt[at] + 1, gt[at] - lt[at] - 1) != names[i]).any():
+                return None
+    # Small integer kind per opening tag: k for field k, 0 for anything else
+    kinds = np.array([_KIND.get(name, 0) for name in local], dtype=np.int8)[code]
+
+    opens = kinds == _KIND[b'Trackpoint']
+    n = int(opens.sum())
+    if n == 0 or body.count(b'</Trackpoint>') != n:
+        return None
+    owner = np.cumsum(opens) - 1
+
+    # Tag positions grouped by kind, in file order within each group
+    order = np.argsort(kinds, kind='stable')
+    bounds = np.searchsorted(kinds[order], np.arange(len(_KIND) + 2))
+
+    columns = {}
+    for tag, column in _FIELDS.items():
+        kind = _KIND[tag]
+        found = order[bounds[kind]:bounds[kind + 1]]
+        if len(found) == 0:
+            columns[column] = np.full(n, b'' if column == 'time' else np.nan)
+            continue
+        # A field must hold plain text: the next tag closes it
+        at = tag_at[found]
+        if at[-1] + 1 >= len(lt) or not closing[at + 1].all():
+            return None
+        index = owner[found]
+        if (index < 0).any() or (np.diff(index) == 0).any():
+            return None
+        length = lt[at + 1] - gt[at] - 1
+        if (length > _VALUE_WIDTH).any():
+            return None
+        values = _gather(buf, gt[at] + 1, length)
+        keep = length > 0
+        index, values = index[keep], values[keep]
+
+        if column == 'time':
+            time = np.zeros(n, dtype=values.dtype if len(values) else 'S1')
+            time[index] = values
+            columns[column] = time
+            continue
+        try:
+            parsed = values.astype(np.int64 if column == 'cadence' else np.float64)
+        except ValueError:
+            return None
+        if column != 'cadence' and np.isnan(parsed).any():
+            # A literal "NaN" in the file would be indistinguishable from a gap
+            return None
+        dense = np.full(n, np.nan)
+        dense[index] = parsed
+        columns[column] = dense
+
+    return columns
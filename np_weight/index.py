@@ -0,0 +1,298 @@
+"""
+Interval index over a ride's per-step power series.
+
+Building the index takes one O(n) pass. It stores prefix sums of:
+- the extra-weight step energy and its potential (climbing) part;
+- the extra, measured and measured + extra power (Σp), each with the 4th
+  power of its 30 s rolling mean (Σp⁴);
+- the positive elevation change;
+- the elapsed time and distance, for lookups.
+
+After that, the energy, average power, NP and climbing of any range of
+trackpoints take a few subtractions. Ranges given in seconds ("the last 10
+minutes") or metres ("km 20 to 30", "lap 3") are found by binary search.
+Segment breakdowns (np_weight.segments) and interactive scrubbing through a
+race therefore never rescan the ride.
+
+analyze_ride(ride).index builds the index once per analysis:
+
+    python -m np_weight.index ride.tcx --last 10 --km 20 30 --lap-length 1.2
+"""
+
+import argparse
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .metrics import NP_WINDOW_SECONDS, rolling_mean
+from .physics import ExtraPower
+
+
+class IntervalCost(NamedTuple):
+    """Extra-weight cost and power of the steps between two trackpoints."""
+    start: int  # first trackpoint
+    end: int  # last trackpoint
+    start_time: float  # s from the start of the ride
+    duration: float  # s
+    distance: float  # m, NaN without distance data
+    energy: float  # J of extra-weight cost
+    potential_energy: float  # J of `energy` spent lifting the weight
+    average: float  # W of extra-weight cost, time-weighted
+    normalized_power: float  # W, NP of the extra-weight cost
+    elevation_gain: float  # m
+    avg_measured: Optional[float]  # W over the power readings, None without any
+    avg_with_extra: Optional[float]  # W at the power readings
+    np_measured: Optional[float]  # W, None for a ride without power data
+    np_with_extra: float  # W, NP of measured + extra (the extra alone without power)
+
+    @property
+    def kinetic_energy(self) -> float:
+        """J of `energy` spent accelerating the weight."""
+        return self.energy - self.potential_energy
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Cumulative sum with a leading 0 (len(values) + 1 entries)."""
+    csum = np.empty(len(values) + 1)
+    csum[0] = 0.0
+    np.cumsum(values, out=csum[1:])
+    return csum
+
+
+class _PowerSums:
+    """Prefix sums of a 1 Hz power series: mean and NP of any step range in O(1)."""
+
+    def __init__(self, power: np.ndarray, window: int = NP_WINDOW_SECONDS):
+        self.window = window
+        self.sum = _prefix(power)
+        if len(power) > window:
+            self.r4 = _prefix(rolling_mean(power, window) ** 4)
+        else:
+            self.r4 = np.zeros(1)
+
+    def mean(self, i: int, j: int) -> float:
+        """Sample mean of steps i..j-1."""
+        return float(self.sum[j] - self.sum[i]) / (j - i) if j > i else 0.0
+
+    def normalized(self, i: int, j: int) -> float:
+        """
+        NP of steps i..j-1, from the rolling windows lying wholly inside them.
+
+        This equals normalized_power(power[i:j]) up to rounding. Like that
+        function, a range no longer than the window gives its mean.
+        """
+        if j - i <= self.window:
+            mean = self.mean(i, j)
+            return mean if mean > 0 else 0.0
+        windows = j - i - self.window + 1
+        mean_r4 = float(self.r4[i + windows] - self.r4[i]) / windows
+        return mean_r4 ** 0.25 if mean_r4 > 0 else 0.0
+
+
+class IntervalIndex:
+    """
+    Prefix sums over a ride for O(1) range and O(log n) time/distance queries.
+
+    Ranges are given as trackpoints start..end, covering steps start..end-1.
+    A step's cost is split into kinetic and potential parts. The potential
+    part is the climbing power, capped at the step's (clipped) total, and
+    the remainder is kinetic.
+
+    Args:
+        extra: per-step extra-weight cost
+        measured: per-step measured power (0 where there is no reading)
+        distance: cumulative distance per trackpoint in m
+        window: NP rolling window in samples
+    """
+
+    def __init__(self, extra: ExtraPower, measured: Optional[np.ndarray] = None,
+                 distance: Optional[np.ndarray] = None, window: int = NP_WINDOW_SECONDS):
+        total = extra.total
+        dt = np.broadcast_to(np.asarray(extra.dt, dtype=np.float64), total.shape)
+        self.elapsed = _prefix(dt)  # s from the start, per trackpoint
+        # Recorded distance can step back slightly; searches need it sorted
+        self.distance = None if distance is None else np.maximum.accumulate(distance)
+        self._energy = _prefix(total * dt)
+        self._potential = _prefix(np.minimum(extra.potential, total) * dt)
+        self._gain = _prefix(np.maximum(extra.elevation_delta, 0.0))
+        self._extra = _PowerSums(total, window)
+
+        if measured is not None and (measured > 0).any():
+            readings = measured > 0
+            self._readings = _prefix(readings)
+            self._extra_at_readings = _prefix(np.where(readings, total, 0.0))
+            self._measured = _PowerSums(measured, window)
+            self._with_extra = _PowerSums(measured + total, window)
+        else:
+            self._measured = None
+            self._with_extra = self._extra
+
+    def __len__(self) -> int:
+        """Number of trackpoints."""
+        return len(self.elapsed)
+
+    @property
+    def duration(self) -> float:
+        return float(self.elapsed[-1])
+
+    def time_bounds(self, start_time: float, end_time: float) -> Tuple[int, int]:
+        """
+        Trackpoints bounding a time range, in seconds from the start.
+
+        Returns the first trackpoint at or after `start_time` and the last
+        one at or before `end_time`. Binary search, O(log n).
+        """
+        return self._bounds(self.elapsed, start_time, end_time)
+
+    def distance_bounds(self, start_m: float, end_m: float) -> Tuple[int, int]:
+        """Trackpoints bounding a distance range in metres, O(log n)."""
+        return self._bounds(self._distances(), start_m, end_m)
+
+    @staticmethod
+    def _bounds(axis: np.ndarray, low: float, high: float) -> Tuple[int, int]:
+        start = min(int(np.searchsorted(axis, low, side='left')), len(axis) - 1)
+        end = int(np.searchsorted(axis, high, side='right')) - 1
+        return start, max(start, end)
+
+    def _distances(self) -> np.ndarray:
+        if self.distance is None:
+            raise ValueError('no distance data')
+        return self.distance
+
+    def query(self, start: int, end: int) -> IntervalCost:
+        """Cost of the steps from trackpoint `start` to trackpoint `end`, O(1)."""
+        if not 0 <= start <= end < len(self):
+            raise IndexError(f'trackpoints {start}..{end} outside 0..{len(self) - 1}')
+        duration = float(self.elapsed[end] - self.elapsed[start])
+        energy = float(self._energy[end] - self._energy[start])
+        distance = (float(self.distance[end] - self.distance[start])
+                    if self.distance is not None else float('nan'))
+
+        avg_measured = avg_with_extra = np_measured = None
+        if self._measured is not None:
+            np_measured = self._measured.normalized(start, end)
+            readings = float(self._readings[end] - self._readings[start])
+            if readings:
+                measured = float(self._measured.sum[end] - self._measured.sum[start])
+                extra = float(self._extra_at_readings[end] - self._extra_at_readings[start])
+                avg_measured = measured / readings
+                avg_with_extra = (measured + extra) / readings
+
+        return IntervalCost(
+            start=start,
+            end=end,
+            start_time=float(self.elapsed[start]),
+            duration=duration,
+            distance=distance,
+            energy=energy,
+            potential_energy=float(self._potential[end] - self._potential[start]),
+            average=energy / duration if duration > 0 else 0.0,
+            normalized_power=self._extra.normalized(start, end),
+            elevation_gain=float(self._gain[end] - self._gain[start]),
+            avg_measured=avg_measured,
+            avg_with_extra=avg_with_extra,
+            np_measured=np_measured,
+            np_with_extra=self._with_extra.normalized(start, end),
+        )
+
+    def between(self, start_time: float, end_time: float) -> IntervalCost:
+        """Cost of a time range in seconds from the start (no rescan)."""
+        return self.query(*self.time_bounds(start_time, end_time))
+
+    def last(self, seconds: float) -> IntervalCost:
+        """Cost of the final `seconds` of the ride."""
+        return self.between(self.duration - seconds, self.duration)
+
+    def along(self, start_m: float, end_m: float) -> IntervalCost:
+        """Cost of a distance range in metres, e.g. along(20000, 30000)."""
+        return self.query(*self.distance_bounds(start_m, end_m))
+
+    def laps(self, length_m: float) -> List[IntervalCost]:
+        """
+        Cost of each `length_m` lap of a circuit, from the start line.
+
+        Consecutive laps share their boundary trackpoint, so the laps add up
+        to the whole ride; a final partial lap is included.
+        """
+        if length_m <= 0:
+            raise ValueError('lap length must be positive')
+        distance = self._distances()
+        marks = np.arange(distance[0], distance[-1], length_m)[1:]
+        bounds = np.r_[0, np.searchsorted(distance, marks, side='left'), len(self) - 1]
+        bounds = np.unique(bounds)
+        return [self.query(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def total(self) -> IntervalCost:
+        """Cost of the whole ride."""
+        return self.query(0, len(self) - 1)
+
+
+def format_clock(seconds: float) -> str:
+    """Seconds from the start of the ride as m:ss."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f'{minutes}:{seconds:02d}'
+
+
+def format_cost(label: str, cost: IntervalCost) -> str:
+    """One table row: window, extra-weight cost and NP with the extra weight."""
+    np_new = (f"{cost.np_measured:.1f} → {cost.np_with_extra:.1f} W"
+              if cost.np_measured is not None else 'N/A')
+    return (f"  {label:<16} {format_clock(cost.start_time):>7} {cost.duration / 60:>6.1f} "
+            f"{cost.distance / 1000:>6.2f} {cost.elevation_gain:>6.1f} "
+            f"{cost.energy:>7.0f} J {cost.average:>6.2f} W {cost.normalized_power:>6.2f} W "
+            f"{np_new:>20}")
+
+
+def main(argv=None):
+    # Imported here: analysis builds its index from this module
+    from .analysis import analyze_ride, open_ride
+    from .cache import DEFAULT_CACHE_DIR, RideCache
+
+    parser = argparse.ArgumentParser(description='Extra-weight cost over windows of a ride')
+    parser.add_argument('files', nargs='+', help='TCX files')
+    parser.add_argument('--extra-weight', type=float, default=1.0, help='extra weight in kg')
+    parser.add_argument('--last', type=float, action='append', default=[], metavar='MIN',
+                        help='the final MIN minutes (repeatable)')
+    parser.add_argument('--minutes', type=float, nargs=2, action='append', default=[],
+                        metavar=('START', 'END'), help='from START to END minutes (repeatable)')
+    parser.add_argument('--km', type=float, nargs=2, action='append', default=[],
+                        metavar=('START', 'END'), help='from km START to km END (repeatable)')
+    parser.add_argument('--lap-length', type=float, metavar='KM',
+                        help='also list every lap of a KM circuit')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--resample', action='store_true',
+                        help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    args = parser.parse_args(argv)
+
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    for path in args.files:
+        try:
+            analysis = analyze_ride(open_ride(path, cache=cache, resample=args.resample),
+                                    args.extra_weight)
+        except Exception as e:
+            print(f"✗ {Path(path).name} (error: {str(e)[:50]})\n")
+            continue
+        if analysis is None:
+            print(f"✗ {Path(path).name} (insufficient data)\n")
+            continue
+        index = analysis.index
+        print(f"{analysis.file_name}")
+        print(f"  {'Window':<16} {'Start':>7} {'Min':>6} {'Km':>6} {'Gain m':>6} "
+              f"{'Energy':>9} {'Extra avg':>8} {'Extra NP':>8} {'NP → NP + extra':>20}")
+        print(format_cost('ride', index.total()))
+        for minutes in args.last:
+            print(format_cost(f'last {minutes:g} min', index.last(minutes * 60)))
+        for start, end in args.minutes:
+            print(format_cost(f'min {start:g}-{end:g}', index.between(start * 60, end * 60)))
+        for start, end in args.km:
+            print(format_cost(f'km {start:g}-{end:g}', index.along(start * 1000, end * 1000)))
+        if args.lap_length:
+            for n, cost in enumerate(index.laps(args.lap_length * 1000), 1):
+                print(format_cost(f'lap {n}', cost))
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Per-stage timing, counters and memory for the analysis pipeline.
+
+The pipeline marks its stages (reading the file, byte scan, XML parse, cache
+lookups, row selection, resampling, physics, NP, JSON output) with stage()
+and its events (trackpoints parsed, skipped or malformed, fast-path
+fallbacks, cache hits) with count(). Both do nothing unless a Recorder has
+been switched on with enable(), so the hooks cost one global lookup when
+instrumentation is off.
+
+With a recorder on, run_batch() records every file separately (in the worker
+process that analyzed it) and merges the per-file reports into the batch
+total. report() gives both as a dict, and write_report() saves them as JSON
+or, for a path ending in .prom, Prometheus text exposition format:
+
+    recorder = instrument.enable()
+    ...                                  # run the batch
+    instrument.write_report(recorder, 'metrics.json')
+
+Peak RSS comes from getrusage(), which only knows the high-water mark of a
+whole process. A file's report therefore has worker_peak_rss_bytes: the peak
+of the process that analyzed it, over its lifetime up to the end of that
+file. Once a pool worker has handled a bigger file, its later files repeat
+that peak. The batch total's peak_rss_bytes is the highest of them all.
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Allocation sites kept per tracemalloc snapshot
+TOP_ALLOCATIONS = 5
+
+_OFF = nullcontext()
+_NOT_IMPORTS = (tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'))
+_active: Optional['Recorder'] = None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Stage:
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder: 'Recorder', name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        stats = self.recorder.stages.setdefault(self.name, [0.0, 0])
+        stats[0] += time.perf_counter() - self.start
+        stats[1] += 1
+
+
+class Recorder:
+    """
+    Stage timings, counters and memory peaks for one file or one batch.
+
+    A `per_file` recorder reports its RSS as worker_peak_rss_bytes (see the
+    module docstring).
+    """
+
+    def __init__(self, trace_memory: bool = False, per_file: bool = False):
+        self.trace_memory = trace_memory
+        self.per_file = per_file
+        self.started = time.perf_counter()
+        self.stages: Dict[str, list] = {}  # name -> [seconds, calls]
+        self.counters: Dict[str, int] = {}
+        self.peak_rss: Optional[int] = None
+        self.tracemalloc_peak: Optional[int] = None
+        self.top_allocations: List[dict] = []
+        self.files: Dict[str, dict] = {}  # per-file reports merged into a batch
+
+    def merge(self, report: dict, name: Optional[str] = None) -> None:
+        """Add a per-file report to this (batch) recorder."""
+        if name is not None:
+            self.files[name] = report
+        for stage_name, stats in report['stages'].items():
+            total = self.stages.setdefault(stage_name, [0.0, 0])
+            total[0] += stats['seconds']
+            total[1] += stats['calls']
+        for counter, value in report['counters'].items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+        for attr, key in (('peak_rss', 'peak_rss_bytes'),
+                          ('peak_rss', 'worker_peak_rss_bytes'),
+                          ('tracemalloc_peak', 'tracemalloc_peak_bytes')):
+            if report.get(key) is not None:
+                setattr(self, attr, max(getattr(self, attr) or 0, report[key]))
+
+    def report(self) -> dict:
+        """JSON-friendly summary; a batch also lists its files."""
+        rss = peak_rss()
+        report = {
+            'seconds': time.perf_counter() - self.started,
+            'stages': {name: {'seconds': seconds, 'calls': calls}
+                       for name, (seconds, calls) in sorted(self.stages.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'worker_peak_rss_bytes' if self.per_file else 'peak_rss_bytes':
+                max(self.peak_rss or 0, rss or 0) or None,
+        }
+        if self.tracemalloc_peak is not None:
+            report['tracemalloc_peak_bytes'] = self.tracemalloc_peak
+        if self.top_allocations:
+            report['top_allocations'] = self.top_allocations
+        if self.files:
+            report['files'] = self.files
+        return report
+
+
+def active() -> Optional[Recorder]:
+    """The recorder in use, or None when instrumentation is off."""
+    return _active
+
+
+def enable(trace_memory: bool = False) -> Recorder:
+    """Switch instrumentation on with a fresh recorder and return it."""
+    global _active
+    _active = Recorder(trace_memory)
+    return _active
+
+
+def disable() -> None:
+    global _active
+    _active = None
+
+
+def stage(name: str):
+    """Context manager timing one stage; a shared no-op when off."""
+    recorder = _active
+    if recorder is None:
+        return _OFF
+    return _Stage(recorder, name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add `n` to a counter (no-op when off)."""
+    recorder = _active
+    if recorder is not None:
+        recorder.counters[name] = recorder.counters.get(name, 0) + n
+
+
+@contextmanager
+def recording(trace_memory: bool = False) -> Iterator[Recorder]:
+    """
+    Record into a new Recorder for the duration of the block (one file),
+    then restore the previous one. With `trace_memory`, tracemalloc runs
+    for the block and its peak and top allocation sites are kept.
+    """
+    global _active
+    previous, recorder = _active, Recorder(trace_memory, per_file=True)
+    _active = recorder
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        yield recorder
+    finally:
+        if tracing:
+            recorder.tracemalloc_peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces(_NOT_IMPORTS)
+            stats = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            recorder.top_allocations = [{'where': str(s.traceback[0]), 'bytes': s.size}
+                                        for s in stats]
+            tracemalloc.stop()
+        recorder.peak_rss = peak_rss()
+        _active = previous
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(report: dict) -> str:
+    """Prometheus text exposition of a report; per-file series carry a file label."""
+    series = {
+        'np_weight_stage_seconds_total': ('counter', 'Time spent in each pipeline stage.', []),
+        'np_weight_stage_calls_total': ('counter', 'Times each pipeline stage ran.', []),
+        'np_weight_events_total': ('counter', 'Pipeline event counters.', []),
+        'np_weight_peak_rss_bytes': ('gauge', 'Peak resident set size.', []),
+        'np_weight_worker_peak_rss_bytes': (
+            'gauge', 'Peak resident set size of the analyzing process, over its lifetime '
+                     'up to the end of the file.', []),
+        'np_weight_tracemalloc_peak_bytes': ('gauge', 'Peak traced Python/NumPy allocation.', []),
+    }
+
+    def add(report, labels):
+        for stage_name, stats in report['stages'].items():
+            stage_labels = dict(labels, stage=stage_name)
+            series['np_weight_stage_seconds_total'][2].append((stage_labels, stats['seconds']))
+            series['np_weight_stage_calls_total'][2].append((stage_labels, stats['calls']))
+        for name, value in report['counters'].items():
+            series['np_weight_events_total'][2].append((dict(labels, event=name), value))
+        for key in ('peak_rss_bytes', 'worker_peak_rss_bytes'):
+            if report.get(key) is not None:
+                series[f'np_weight_{key}'][2].append((labels, report[key]))
+        if report.get('tracemalloc_peak_bytes') is not None:
+            series['np_weight_tracemalloc_peak_bytes'][2].append(
+                (labels, report['tracemalloc_peak_bytes']))
+
+    add(report, {})
+    for file_name, file_report in report.get('files', {}).items():
+        add(file_report, {'file': file_name})
+
+    lines = []
+    for metric, (kind, help_text, samples) in series.items():
+        if not samples:
+            continue
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for labels, value in samples:
+            text = ','.join(f'{k}="{_label(str(v))}"' for k, v in sorted(labels.items()))
+            lines.append(f'{metric}{{{text}}} {value}' if text else f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(recorder: Union[Recorder, dict], path: Union[str, Path]) -> None:
+    """Save a report as JSON, or as Prometheus text if `path` ends in .prom."""
+    report = recorder.report() if isinstance(recorder, Recorder) else recorder
+    with open(path, 'w') as f:
+        if str(path).endswith('.prom'):
+            f.write(to_prometheus(report))
+        else:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,219 @@
+"""
+Incremental extra-weight analysis for trackpoints that arrive one at a time.
+
+A head unit streaming to the team car delivers a trackpoint every second;
+re-running analyze_ride() over the whole ride after each one costs O(n) per
+point. LiveAnalyzer instead keeps running sums (energy, elevation gain, max
+speed, and for NP the last 30 samples plus Σ rolling⁴), so each update is
+O(1) and metrics() returns the same figures analyze_ride() gives for the ride
+so far.
+
+Run as a script to replay a TCX file through the analyzer:
+
+    python -m np_weight.live ride.tcx --every 300
+"""
+
+import argparse
+import math
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Iterable, Optional
+
+from .metrics import NP_WINDOW_SECONDS
+from .physics import G
+from .ride import NOMINAL_DT, parse_time
+from .tcx import TrackpointRecord, iter_trackpoints
+
+
+class _RunningNP:
+    """Normalized power of a series fed one sample at a time."""
+
+    def __init__(self, window: int = NP_WINDOW_SECONDS):
+        self.window = window
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0  # sum of all samples
+        self.window_sum = 0.0  # sum of self.recent
+        self.sum_r4 = 0.0  # Σ (30 s average)⁴ over complete windows
+        self.windows = 0
+
+    def push(self, value: float) -> None:
+        if len(self.recent) == self.window:
+            self.window_sum -= self.recent[0]
+        self.recent.append(value)
+        self.window_sum += value
+        self.count += 1
+        self.total += value
+        if self.count % self.window == 0:
+            # Re-add the window from scratch now and then so that the
+            # running difference cannot drift
+            self.window_sum = math.fsum(self.recent)
+        if self.count >= self.window:
+            self.sum_r4 += (self.window_sum / self.window) ** 4
+            self.windows += 1
+
+    @property
+    def value(self) -> float:
+        """NP so far; the plain mean until the first window fills (as normalized_power())."""
+        if self.count == 0:
+            return 0.0
+        if self.windows:
+            mean_r4 = self.sum_r4 / self.windows
+        else:
+            mean_r4 = (self.total / self.count) ** 4
+        return mean_r4 ** 0.25 if mean_r4 > 0 else 0.0
+
+
+@dataclass
+class LiveMetrics:
+    """Running extra-weight figures for the ride so far (cf. RideAnalysis)."""
+    trackpoints: int
+    duration: float  # s, elapsed
+    distance: float  # m, NaN without distance data
+    elevation_gain: float  # m
+    avg_speed: float  # m/s, mean per step
+    max_speed: float  # m/s
+    extra_energy: float  # J
+    extra_avg: float  # W, time-weighted
+    extra_max: float  # W
+    extra_np: float  # W
+    avg_measured: Optional[float]  # W, None until the first power reading
+    avg_with_extra: Optional[float]  # W
+    np_measured: Optional[float]  # W
+    np_with_extra: float  # W, NP of the extra cost alone without power data
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class LiveAnalyzer:
+    """
+    Stateful extra-weight analysis fed with TrackpointRecords as they arrive.
+
+    Trackpoints without a timestamp or elevation are ignored, as open_ride()
+    does for the batch reports. Missing speed and power count as 0.
+    """
+
+    def __init__(self, extra_weight: float = 1.0, window: int = NP_WINDOW_SECONDS):
+        self.extra_weight = extra_weight
+        self.trackpoints = 0
+        self.duration = 0.0
+        self.distance = float('nan')
+        self.elevation_gain = 0.0
+        self.speed_sum = 0.0
+        self.max_speed = 0.0
+        self.extra_energy = 0.0
+        self.extra_max = 0.0
+        self.measured_readings = 0
+        self.measured_sum = 0.0
+        self.with_extra_sum = 0.0
+        self._extra_np = _RunningNP(window)
+        self._measured_np = _RunningNP(window)
+        self._with_extra_np = _RunningNP(window)
+        self._last = None  # (epoch, speed, elevation) of the previous trackpoint
+
+    def add(self, record: TrackpointRecord) -> Optional[LiveMetrics]:
+        """
+        Take one trackpoint, O(1).
+
+        Returns:
+            metrics() after the update (None until two usable trackpoints)
+        """
+        if record.time is None or record.elevation is None:
+            return self.metrics()
+        epoch = parse_time(record.time)
+        speed = record.speed or 0.0
+        elevation = record.elevation
+        self.trackpoints += 1
+        self.distance = record.distance if record.distance is not None else float('nan')
+
+        last, self._last = self._last, (epoch, speed, elevation)
+        if last is None:
+            return None
+        last_epoch, last_speed, last_elevation = last
+        dt = epoch - last_epoch
+        if not dt > 0:
+            dt = NOMINAL_DT
+
+        # Same terms as physics.extra_power() for one step
+        dh = elevation - last_elevation
+        kinetic = 0.5 * self.extra_weight * (speed * speed - last_speed * last_speed) / dt
+        potential = self.extra_weight * G * max(dh, 0.0) / dt
+        extra = max(kinetic + potential, 0.0)
+        measured = record.watts or 0.0
+
+        self.duration += dt
+        if dh > 0:
+            self.elevation_gain += dh
+        self.speed_sum += speed
+        self.max_speed = max(self.max_speed, speed)
+        self.extra_energy += extra * dt
+        self.extra_max = max(self.extra_max, extra)
+        if measured > 0:
+            self.measured_readings += 1
+            self.measured_sum += measured
+            self.with_extra_sum += measured + extra
+        self._extra_np.push(extra)
+        self._measured_np.push(measured)
+        self._with_extra_np.push(measured + extra)
+        return self.metrics()
+
+    def extend(self, records: Iterable[TrackpointRecord]) -> Optional[LiveMetrics]:
+        """Take a batch of trackpoints; returns the metrics after the last one."""
+        for record in records:
+            self.add(record)
+        return self.metrics()
+
+    def metrics(self) -> Optional[LiveMetrics]:
+        """Current figures, O(1); None until two usable trackpoints have arrived."""
+        steps = self._extra_np.count
+        if steps == 0:
+            return None
+        has_power = self.measured_readings > 0
+        return LiveMetrics(
+            trackpoints=self.trackpoints,
+            duration=self.duration,
+            distance=self.distance,
+            elevation_gain=self.elevation_gain,
+            avg_speed=self.speed_sum / steps,
+            max_speed=self.max_speed,
+            extra_energy=self.extra_energy,
+            extra_avg=self.extra_energy / self.duration if self.duration > 0 else 0.0,
+            extra_max=self.extra_max,
+            extra_np=self._extra_np.value,
+            avg_measured=self.measured_sum / self.measured_readings if has_power else None,
+            avg_with_extra=self.with_extra_sum / self.measured_readings if has_power else None,
+            np_measured=self._measured_np.value if has_power else None,
+            np_with_extra=(self._with_extra_np.value if has_power else self._extra_np.value),
+        )
+
+
+def format_metrics(m: LiveMetrics) -> str:
+    """One status line for a running ride."""
+    line = (f"{m.duration / 60:6.1f} min  {m.elevation_gain:5.0f} m  "
+            f"+{m.extra_avg:.2f} W avg  +{m.extra_np:.2f} W NP  {m.extra_energy / 1000:.1f} kJ")
+    if m.np_measured is not None:
+        line += f"  NP {m.np_measured:.0f} → {m.np_with_extra:.1f} W"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a TCX file through the live analyzer')
+    parser.add_argument('file', help='TCX file')
+    parser.add_argument('--extra-weight', type=float, default=1.0, help='extra weight in kg')
+    parser.add_argument('--every', type=int, default=60,
+                        help='print the running figures every N trackpoints')
+    args = parser.parse_args(argv)
+
+    live = LiveAnalyzer(args.extra_weight)
+    for i, record in enumerate(iter_trackpoints(args.file), start=1):
+        metrics = live.add(record)
+        if metrics is not None and i % args.every == 0:
+            print(format_metrics(metrics))
+    metrics = live.metrics()
+    if metrics is not None:
+        print(format_metrics(metrics))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Batch manifest: which inputs of a batch run are finished.
+
+A long batch that dies partway through used to start over and re-parse
+everything. A BatchManifest is an append-only NDJSON file with one line per
+analyzed file:
+
+    {"path": ..., "size": ..., "mtime_ns": ..., "digest": ..., "params": {...},
+     "status": "done" | "failed", "error": ..., "finished_at": ..., "result": {...}}
+
+Lines are flushed as files finish, so a crash loses at most the file being
+written. For each path and set of params the last line wins, so runs with
+different params can share one manifest. On a restart, plan() splits the
+inputs:
+
+- done: status "done" with the same params, and the same size and mtime. A
+  file whose mtime changed but whose size and content digest did not (a
+  copy, a touch) also counts as done. Its result comes from the manifest;
+- to do: new, changed or failed files, and files analyzed with other
+  params.
+
+Rides too short to analyze are "done" with a null result. Only errors
+(including a worker killed mid-file) are retried. From the command line:
+
+    python weight_power_analysis.py races/ --manifest
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .batch import BatchResult
+from .cache import file_digest
+from .results import NDJSONSink, read_results
+
+MANIFEST_NAME = 'weight_analysis_manifest.ndjson'
+
+DONE = 'done'
+FAILED = 'failed'
+
+Signature = Tuple[int, int]  # (size, mtime_ns)
+
+
+def _key(path: Union[str, Path]) -> str:
+    return os.path.abspath(path)
+
+
+def _signature(path: Union[str, Path]) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class BatchManifest:
+    """
+    Completion record of a batch run for one set of analysis `params`.
+
+    Use as a context manager around the run: plan() the inputs, then
+    record() each BatchResult as it arrives.
+    """
+
+    def __init__(self, path: Union[str, Path], params: dict):
+        self.path = Path(path)
+        self.params = dict(params)
+        self.entries: Dict[str, dict] = {}
+        for entry in read_results(self.path):
+            # Runs with other params share the file but not their progress
+            if isinstance(entry, dict) and 'path' in entry and entry.get('params') == self.params:
+                self.entries[entry['path']] = entry
+        self._planned: Dict[str, Optional[Signature]] = {}
+        self._sink = NDJSONSink(self.path, resume=True)
+
+    def __enter__(self) -> 'BatchManifest':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._sink.close()
+
+    def is_done(self, path: Union[str, Path]) -> bool:
+        """Whether `path` is finished with these params and unchanged since."""
+        entry = self.entries.get(_key(path))
+        if entry is None or entry.get('status') != DONE:
+            return False
+        signature = _signature(path)
+        if signature is None:
+            return False
+        if signature == (entry.get('size'), entry.get('mtime_ns')):
+            return True
+        if signature[0] != entry.get('size') or entry.get('digest') is None:
+            return False
+        # Same size, new mtime: compare content before redoing the work
+        if file_digest(path) != entry['digest']:
+            return False
+        entry = dict(entry, mtime_ns=signature[1])
+        self.entries[_key(path)] = entry
+        self._sink.write(entry)
+        return True
+
+    def plan(self, paths: Iterable[Union[str, Path]]) -> Tuple[List, List[dict]]:
+        """
+        Split `paths` into (files still to analyze, manifest entries of the
+        finished ones). The sizes and mtimes of the files to analyze are
+        taken now, before any work starts.
+        """
+        todo, done = [], []
+        for path in paths:
+            if self.is_done(path):
+                done.append(self.entries[_key(path)])
+            else:
+                todo.append(path)
+                self._planned[_key(path)] = _signature(path)
+        return todo, done
+
+    def status(self, path: Union[str, Path]) -> Optional[str]:
+        """Latest status of `path` with these params (DONE, FAILED or None)."""
+        entry = self.entries.get(_key(path))
+        return entry.get('status') if entry is not None else None
+
+    def record(self, item: BatchResult) -> dict:
+        """Append the outcome of one file and return its entry."""
+        path = _key(item.path)
+        signature = self._planned.pop(path, None) or _signature(path)
+        digest = None
+        if signature is not None and _signature(path) == signature:
+            # Left unset if the file changed during the run, so it is redone
+            try:
+                digest = file_digest(path)
+            except OSError:
+                pass
+        size, mtime_ns = signature or (None, None)
+        entry = {'path': path, 'size': size, 'mtime_ns': mtime_ns, 'digest': digest,
+                 'params': self.params, 'status': DONE if item.ok else FAILED,
+                 'error': item.error, 'finished_at': time.time(), 'result': item.result}
+        self.entries[path] = entry
+        self._sink.write(entry)
+        return entry
@@ -0,0 +1,105 @@
+"""
+Vectorised extra-mass power kernel.
+
+Computes, for every step between consecutive trackpoints, the extra power
+needed to accelerate and lift `extra_weight` kg, in a handful of NumPy
+operations instead of a per-trackpoint Python loop:
+
+    ΔKE = ½m(v₂² - v₁²)                  → P_kinetic   = ΔKE / Δt
+    ΔPE = mg·Δh  (uphill only, worst-case) → P_potential = ΔPE / Δt
+    P_extra = max(0, P_kinetic + P_potential)
+"""
+
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+
+from .metrics import normalized_power
+
+# Physical constants
+G = 9.81  # gravitational acceleration (m/s²)
+RHO_AIR = 1.225  # air density at sea level (kg/m³)
+CD = 1.1  # drag coefficient for road bike
+A = 0.4  # frontal area (m²)
+CRR = 0.004  # coefficient of rolling resistance
+
+J_PER_KCAL = 4184
+
+
+@dataclass
+class ExtraPower:
+    """Per-step extra power series (one entry per trackpoint after the first)."""
+    kinetic: np.ndarray  # W, signed
+    potential: np.ndarray  # W, uphill only
+    total: np.ndarray  # W, clipped at 0 (no downhill/braking benefit)
+    elevation_delta: np.ndarray  # m, signed
+    dt: Union[float, np.ndarray] = 1.0  # s, per step
+
+    def __len__(self) -> int:
+        return len(self.total)
+
+    @property
+    def elevation_gain(self) -> float:
+        """Sum of positive elevation changes (m)."""
+        return float(self.elevation_delta[self.elevation_delta > 0].sum())
+
+    @property
+    def duration(self) -> float:
+        """Seconds covered by the steps."""
+        return float(np.broadcast_to(self.dt, self.total.shape).sum())
+
+    @property
+    def energy(self) -> float:
+        """Total extra energy (J): Σ P·Δt."""
+        return float((self.total * self.dt).sum())
+
+    @property
+    def average(self) -> float:
+        """Time-weighted average extra power (W)."""
+        duration = self.duration
+        return self.energy / duration if duration > 0 else 0.0
+
+    @property
+    def maximum(self) -> float:
+        return float(self.total.max()) if len(self.total) else 0.0
+
+    @property
+    def normalized_power(self) -> float:
+        """
+        30 s rolling normalized power of the extra power.
+
+        Assumes 1 s steps; resample irregular rides first (np_weight.resample).
+        """
+        return normalized_power(self.total)
+
+
+def extra_power(speed: np.ndarray, elevation: np.ndarray,
+                extra_weight: float = 1.0,
+                dt: Union[float, np.ndarray] = 1.0) -> ExtraPower:
+    """
+    Extra power needed to carry `extra_weight` kg over a ride.
+
+    Args:
+        speed: m/s per trackpoint
+        elevation: m per trackpoint
+        extra_weight: additional mass in kg
+        dt: seconds between trackpoints, scalar or per step (Ride.dt())
+
+    Returns:
+        ExtraPower with len(speed) - 1 entries per series
+    """
+    speed = np.asarray(speed, dtype=np.float64)
+    elevation = np.asarray(elevation, dtype=np.float64)
+
+    dv2 = np.diff(speed * speed)
+    dh = np.diff(elevation)
+    climb = np.where(dh > 0, dh, 0.0)
+
+    kinetic = 0.5 * extra_weight * dv2 / dt
+    potential = extra_weight * G * climb / dt
+    total = np.maximum(kinetic + potential, 0.0)
+
+    return ExtraPower(kinetic=kinetic, potential=potential, total=total,
+                      elevation_delta=dh, dt=dt)
+
@@ -0,0 +1,208 @@
+"""
+Full power-balance model: aerodynamic drag, rolling resistance, kinetic and
+potential energy, vectorised over a whole ride.
+
+    P_aero    = ½ ρ CdA v³
+    P_rolling = Crr m g v
+    P_kinetic = ½ m (v₂² - v₁²) / Δt
+    P_gravity = m g Δh / Δt
+    P_pedal   = max(0, P_aero + P_rolling + P_kinetic + P_gravity)
+
+Unlike the worst-case KE/PE cost in np_weight.physics, descents and braking
+are part of the balance here, and rolling resistance adds a mass-dependent
+cost at every second. Everything except aero is linear in mass, which gives
+the cost of extra weight directly and lets CdA/Crr be fitted per rider by
+linear least squares on rides with a power meter.
+"""
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from .cache import load_ride
+from .metrics import normalized_power, rolling_mean
+from .physics import A, CD, CRR, G, RHO_AIR
+from .ride import REQUIRE_PROFILE
+
+CDA = CD * A  # m², a solo rider on the hoods (no drafting)
+
+# Below this speed (m/s) samples are ignored when fitting: track stands,
+# walking the bike and GPS drift say nothing about drag or rolling losses
+MIN_FIT_SPEED = 3.0
+
+# Physically plausible ranges for a fitted CdA (m²) and Crr. A fit outside
+# them says more about the data (drafting in a bunch, a wrong mass, a
+# miscalibrated power meter, bad elevation) than about the rider
+CDA_BOUNDS = (0.15, 0.60)
+CRR_BOUNDS = (0.002, 0.015)
+
+
+@dataclass
+class ModelledPower:
+    """Per-step modelled power components (one entry per trackpoint after the first)."""
+    aero: np.ndarray  # W
+    rolling: np.ndarray  # W
+    kinetic: np.ndarray  # W, signed
+    potential: np.ndarray  # W, signed
+    system_mass: float  # kg
+    dt: Union[float, np.ndarray] = 1.0  # s, per step
+
+    @property
+    def total(self) -> np.ndarray:
+        """Net power balance (W); negative when coasting or braking."""
+        return self.aero + self.rolling + self.kinetic + self.potential
+
+    @property
+    def pedal(self) -> np.ndarray:
+        """Power the rider has to produce (W), clipped at 0."""
+        return np.maximum(self.total, 0.0)
+
+    @property
+    def mass_sensitive(self) -> np.ndarray:
+        """Part of the balance that scales with mass: rolling + KE + PE (W)."""
+        return self.rolling + self.kinetic + self.potential
+
+    @property
+    def per_kg(self) -> np.ndarray:
+        """Mass-sensitive power per kg of system mass (W/kg)."""
+        return self.mass_sensitive / self.system_mass
+
+    def extra_weight_cost(self, extra_weight: float = 1.0) -> np.ndarray:
+        """
+        Extra pedal power (W) needed when carrying `extra_weight` more kg.
+
+        Seconds where the rider was already coasting only cost anything if
+        the extra weight tips the balance above zero.
+        """
+        heavier = np.maximum(self.total + extra_weight * self.per_kg, 0.0)
+        return heavier - self.pedal
+
+    def summary(self, extra_weight: float = 1.0) -> dict:
+        """Averages, NP and the extra-weight cost as a JSON-friendly dict."""
+        pedal = self.pedal
+        cost = self.extra_weight_cost(extra_weight)
+        dt = np.broadcast_to(self.dt, pedal.shape)
+        duration = float(dt.sum())
+
+        def average(power):
+            return float((power * dt).sum()) / duration if duration > 0 else 0.0
+
+        return {
+            'system_mass': self.system_mass,
+            'average_power': average(pedal),
+            'normalized_power': normalized_power(pedal),
+            'average_aero': average(self.aero),
+            'average_rolling': average(self.rolling),
+            'average_mass_sensitive': average(np.maximum(self.mass_sensitive, 0.0)),
+            'extra_weight': extra_weight,
+            'extra_average_power': average(cost),
+            'extra_normalized_power': normalized_power(pedal + cost) - normalized_power(pedal),
+            'extra_energy_joules': float((cost * dt).sum()),
+        }
+
+
+def model_power(speed: np.ndarray, elevation: np.ndarray, system_mass: float,
+                cda: float = CDA, crr: float = CRR, rho: float = RHO_AIR,
+                dt: Union[float, np.ndarray] = 1.0) -> ModelledPower:
+    """
+    Model the power balance over a ride.
+
+    Args:
+        speed: m/s per trackpoint
+        elevation: m per trackpoint
+        system_mass: rider + bike mass in kg
+        cda: drag area in m² (default CD × A)
+        crr: rolling resistance coefficient
+        rho: air density in kg/m³
+        dt: seconds between trackpoints, scalar or per step (Ride.dt())
+
+    Returns:
+        ModelledPower with len(speed) - 1 entries per component
+    """
+    speed = np.asarray(speed, dtype=np.float64)
+    elevation = np.asarray(elevation, dtype=np.float64)
+
+    # Aero and rolling use the mean speed over each step
+    v = 0.5 * (speed[1:] + speed[:-1])
+    aero = 0.5 * rho * cda * v ** 3
+    rolling = crr * system_mass * G * v
+    kinetic = 0.5 * system_mass * np.diff(speed * speed) / dt
+    potential = system_mass * G * np.diff(elevation) / dt
+
+    return ModelledPower(aero=aero, rolling=rolling, kinetic=kinetic,
+                         potential=potential, system_mass=system_mass, dt=dt)
+
+
+@dataclass
+class DragFit:
+    """Least-squares CdA/Crr estimate for one rider."""
+    cda: float  # m²
+    crr: float
+    rmse: float  # W, on the smoothed samples used for the fit
+    samples: int
+
+
+def fit_cda_crr(speed: np.ndarray, elevation: np.ndarray, watts: np.ndarray,
+                system_mass: float, rho: float = RHO_AIR, window: int = 30,
+                dt: Union[float, np.ndarray] = 1.0) -> Optional[DragFit]:
+    """
+    Fit CdA and Crr from measured power.
+
+    Measured power minus the KE/PE terms is regressed on ½ρv³ and m·g·v.
+    Every term is smoothed with the same `window`-second rolling mean first,
+    which keeps the problem linear while averaging out 1 s power and GPS
+    noise. Only windows moving at >= MIN_FIT_SPEED with power data are used.
+
+    Returns:
+        DragFit, or None if there are too few usable samples or the fitted
+        CdA or Crr falls outside CDA_BOUNDS / CRR_BOUNDS
+    """
+    speed = np.asarray(speed, dtype=np.float64)
+    watts = np.asarray(watts, dtype=np.float64)[1:]
+    components = model_power(speed, elevation, system_mass, cda=1.0, crr=1.0,
+                             rho=rho, dt=dt)
+
+    residual = rolling_mean(watts - components.kinetic - components.potential, window)
+    aero_basis = rolling_mean(components.aero, window)  # ½ρv³ (CdA = 1)
+    rolling_basis = rolling_mean(components.rolling, window)  # m·g·v (Crr = 1)
+    moving = rolling_mean(0.5 * (speed[1:] + speed[:-1]), window) >= MIN_FIT_SPEED
+    powered = rolling_mean((watts > 0).astype(np.float64), window) >= 0.5
+    keep = moving & powered
+    if keep.sum() < 2:
+        return None
+
+    basis = np.column_stack([aero_basis[keep], rolling_basis[keep]])
+    target = residual[keep]
+    coef, *_ = np.linalg.lstsq(basis, target, rcond=None)
+    cda, crr = (float(c) for c in coef)
+    if not (CDA_BOUNDS[0] <= cda <= CDA_BOUNDS[1] and CRR_BOUNDS[0] <= crr <= CRR_BOUNDS[1]):
+        return None
+    predicted = basis @ coef
+    rmse = float(np.sqrt(np.mean((target - predicted) ** 2)))
+    return DragFit(cda=cda, crr=crr, rmse=rmse, samples=int(keep.sum()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit CdA/Crr from rides with power data')
+    parser.add_argument('files', nargs='+', help='TCX files')
+    parser.add_argument('--rider-mass', type=float, default=75.0,
+                        help='rider + bike mass in kg (default 75)')
+    args = parser.parse_args(argv)
+
+    for tcx_file in args.files:
+        ride = load_ride(tcx_file).select(REQUIRE_PROFILE)
+        fit = fit_cda_crr(ride.speed, ride.elevation, ride.watts, args.rider_mass,
+                          dt=ride.dt())
+        if fit is None:
+            print(f"{Path(tcx_file).name}: no plausible fit (too few powered, moving "
+                  f"samples, or CdA/Crr outside {CDA_BOUNDS} / {CRR_BOUNDS})")
+        else:
+            print(f"{Path(tcx_file).name}: CdA {fit.cda:.3f} m², Crr {fit.crr:.4f} "
+                  f"(RMSE {fit.rmse:.0f} W over {fit.samples} windows)")
+
+
+if __name__ == '__main__':
+    main()
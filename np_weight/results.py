@@ -0,0 +1,309 @@
+"""
+Streaming results sinks.
+
+The batch scripts used to collect every result and write one pretty-printed
+JSON document at the end. A crash near the end of a long run lost
+everything, and readers had to parse the whole document. A ResultSink
+instead writes one compact record per ride as soon as it is finished:
+
+    .ndjson / .jsonl   one JSON object per line, flushed per record
+    .csv               nested keys flattened to dotted columns, flushed per record
+    .parquet           a directory of part files, one per `batch_size`
+                       records, each written atomically (requires pyarrow)
+
+Consumers can tail the NDJSON and CSV files while a run is going. Opening a
+sink with resume=True keeps what is already there (cutting off a record
+torn by a crash), and completed() lists the rides it holds, so an
+interrupted batch carries on where it stopped:
+
+    with open_results('results.ndjson', resume=True) as sink:
+        done = sink.completed('file_name')
+        for result in ...:
+            sink.write(result)
+
+JSON goes through orjson when it is installed and the json module
+otherwise. Non-finite floats are written as null either way.
+"""
+
+import csv
+import json
+import math
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator, Set, Union
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# File suffix → sink format
+FORMATS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv', '.parquet': 'parquet'}
+
+DEFAULT_BATCH_SIZE = 100  # records per Parquet part file
+
+
+def _plain(value):
+    """JSON-safe copy: NumPy values as Python ones, NaN/inf as None."""
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def dumps(record: dict) -> str:
+    """Compact one-line JSON for a record."""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(_plain(record), separators=(',', ':'), allow_nan=False)
+
+
+def flatten(record: dict, prefix: str = '') -> dict:
+    """{'a': {'b': 1}} → {'a.b': 1}."""
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def unflatten(row: dict) -> dict:
+    """{'a.b': 1} → {'a': {'b': 1}}."""
+    record: dict = {}
+    for key, value in row.items():
+        *parents, leaf = key.split('.')
+        node = record
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[leaf] = value
+    return record
+
+
+def _truncate_torn_line(path: Path) -> None:
+    """Drop a last line left without its newline by a crash."""
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # Scan back in blocks for the last newline
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            cut = f.read(end - start).rfind(b'\n')
+            if cut >= 0:
+                f.truncate(start + cut + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+class ResultSink(ABC):
+    """A results file written one record at a time (see open_results())."""
+
+    def __init__(self, path: Union[str, Path], resume: bool = False):
+        self.path = Path(path)
+        self.resume = resume
+
+    def __enter__(self) -> 'ResultSink':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @abstractmethod
+    def write(self, record: dict) -> None:
+        """Append one result record."""
+
+    def close(self) -> None:
+        pass
+
+    def records(self) -> Iterator[dict]:
+        """Every record written so far (including earlier runs when resuming)."""
+        return read_results(self.path)
+
+    def completed(self, key: str) -> Set:
+        """Values of field `key` (e.g. 'file_name') over the records written so far."""
+        return {record.get(key) for record in self.records()}
+
+
+class NDJSONSink(ResultSink):
+    def __init__(self, path: Union[str, Path], resume: bool = False):
+        super().__init__(path, resume)
+        if resume and self.path.exists():
+            _truncate_torn_line(self.path)
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def write(self, record: dict) -> None:
+        self._file.write(dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CSVSink(ResultSink):
+    """
+    CSV with a header row. The columns come from the first record, or from
+    the existing header when resuming. Keys missing from a record are left
+    empty, and keys not in the header are dropped.
+    """
+
+    def __init__(self, path: Union[str, Path], resume: bool = False):
+        super().__init__(path, resume)
+        fields = None
+        if resume and self.path.exists():
+            _truncate_torn_line(self.path)
+            with open(self.path, newline='', encoding='utf-8') as f:
+                fields = next(csv.reader(f), None)
+        self._file = open(self.path, 'a' if fields else 'w', newline='', encoding='utf-8')
+        self._writer = (csv.DictWriter(self._file, fields, extrasaction='ignore')
+                        if fields else None)
+
+    def write(self, record: dict) -> None:
+        row = {k: ('' if v is None else v) for k, v in flatten(_plain(record)).items()}
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, list(row), extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink(ResultSink):
+    """
+    Directory of Parquet part files, each holding up to `batch_size`
+    flattened records. A part is written to a temp file and renamed into
+    place, so a crash loses at most the records not yet written out.
+    """
+
+    def __init__(self, path: Union[str, Path], resume: bool = False,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        if pa is None:
+            raise ImportError('Parquet results need pyarrow (pip install pyarrow)')
+        super().__init__(path, resume)
+        self.batch_size = batch_size
+        self._pending = []
+        if self.path.exists() and not resume:
+            for part in self._parts():
+                part.unlink()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._next = len(self._parts())
+
+    def _parts(self) -> list:
+        return sorted(self.path.glob('part-*.parquet'))
+
+    def write(self, record: dict) -> None:
+        self._pending.append(flatten(_plain(record)))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the pending records as a new part file."""
+        if not self._pending:
+            return
+        table = pa.Table.from_pylist(self._pending)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pq.write_table(table, f)
+            os.replace(tmp, self.path / f'part-{self._next:05d}.parquet')
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._next += 1
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+
+    def records(self) -> Iterator[dict]:
+        yield from read_results(self.path)
+        yield from map(unflatten, self._pending)
+
+
+def _format(path: Union[str, Path]) -> str:
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f'{path}: expected one of {", ".join(FORMATS)}')
+    return fmt
+
+
+def open_results(path: Union[str, Path], resume: bool = False, **options) -> ResultSink:
+    """
+    Sink for `path`, chosen by its suffix.
+
+    Without `resume` any existing results are replaced. With it they are
+    kept and new records are appended.
+    """
+    sinks = {'ndjson': NDJSONSink, 'csv': CSVSink, 'parquet': ParquetSink}
+    return sinks[_format(path)](path, resume, **options)
+
+
+def _csv_value(text: str):
+    if text == '':
+        return None
+    if text in ('True', 'False'):
+        return text == 'True'
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+
+def read_results(path: Union[str, Path]) -> Iterator[dict]:
+    """
+    Records from a results file (missing files give none).
+
+    CSV and Parquet rows come back nested again. Values in CSV are parsed as
+    numbers, booleans or None (empty cells). A torn last NDJSON line is
+    skipped.
+    """
+    path = Path(path)
+    fmt = _format(path)
+    if not path.exists():
+        return
+    if fmt == 'ndjson':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    elif fmt == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield unflatten({k: _csv_value(v) for k, v in row.items()})
+    else:
+        if pq is None:
+            raise ImportError('Parquet results need pyarrow (pip install pyarrow)')
+        for part in sorted(path.glob('part-*.parquet')):
+            for row in pq.read_table(part).to_pylist():
+                yield unflatten(row)
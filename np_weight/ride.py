@@ -0,0 +1,300 @@
+"""
+Columnar trackpoint store.
+
+A Ride keeps every trackpoint field as one contiguous typed NumPy array
+instead of a list of per-second objects, which is ~10x smaller and lets the
+analysis run as vectorised array operations. A per-row bit mask records which
+fields were actually present in the file.
+"""
+
+from array import array
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Dict, Iterable, Optional, Union
+
+import numpy as np
+
+from .fastscan import scan_tcx
+from .instrument import count, stage
+from .tcx import TrackpointRecord, iter_trackpoints
+
+# Validity mask bits: set when the field was present in the trackpoint
+HAS_TIME = 1 << 0
+HAS_POSITION = 1 << 1
+HAS_ELEVATION = 1 << 2
+HAS_DISTANCE = 1 << 3
+HAS_SPEED = 1 << 4
+HAS_CADENCE = 1 << 5
+HAS_WATTS = 1 << 6
+
+# Fields each front-end needs for a trackpoint to be usable
+REQUIRE_TRACK = HAS_TIME | HAS_POSITION | HAS_ELEVATION | HAS_DISTANCE
+REQUIRE_PROFILE = HAS_TIME | HAS_ELEVATION
+
+COLUMNS = ('time', 'latitude', 'longitude', 'elevation', 'distance',
+           'speed', 'cadence', 'watts', 'mask')
+
+# Step length assumed where timestamps are missing, repeated or go backwards
+NOMINAL_DT = 1.0
+
+
+def parse_time(value: Union[str, bytes]) -> float:
+    """
+    Decode one ISO-8601 timestamp to float seconds since the Unix epoch.
+
+    The scalar counterpart of parse_times() for one trackpoint at a time
+    (np_weight.live). A trailing 'Z' is UTC; NaN if the value does not parse.
+    """
+    try:
+        if isinstance(value, bytes):
+            value = value.decode('ascii')
+        if value.endswith('Z'):
+            # fromisoformat() only accepts 'Z' from Python 3.11
+            value = value[:-1] + '+00:00'
+        return datetime.fromisoformat(value).timestamp()
+    except (UnicodeDecodeError, ValueError):
+        return float('nan')
+
+
+def parse_times(times: np.ndarray) -> np.ndarray:
+    """
+    Decode ISO-8601 timestamps to float seconds since the Unix epoch.
+
+    The usual TCX form ('2025-06-27T19:59:34.000Z') is converted in one
+    vectorised datetime64 cast; strings with a UTC offset or that do not
+    parse fall back to datetime.fromisoformat per element. Missing or
+    invalid timestamps become NaN.
+    """
+    times = np.asarray(times, dtype='S')
+    if len(times) == 0:
+        return np.empty(0)
+    if np.char.endswith(times, b'Z').all():
+        try:
+            parsed = np.char.rstrip(times, b'Z').astype('datetime64[ms]')
+            return parsed.astype(np.int64) / 1000.0
+        except ValueError:
+            pass
+    return np.array([parse_time(t) for t in times.tolist()])
+
+
+class Ride:
+    """
+    Trackpoints of one ride held as parallel typed arrays.
+
+    Missing values are stored as NaN for latitude/longitude/elevation/distance
+    and as 0 for speed, cadence and watts (matching how the analysis treats
+    them); `mask` says which fields were really present.
+    """
+
+    def __init__(self, time: np.ndarray, latitude: np.ndarray, longitude: np.ndarray,
+                 elevation: np.ndarray, distance: np.ndarray, speed: np.ndarray,
+                 cadence: np.ndarray, watts: np.ndarray, mask: np.ndarray,
+                 source: Optional[str] = None):
+        self.time = time            # ISO-8601 strings as bytes (S)
+        self.latitude = latitude    # float64, degrees
+        self.longitude = longitude  # float64, degrees
+        self.elevation = elevation  # float64, m
+        self.distance = distance    # float64, m
+        self.speed = speed          # float64, m/s
+        self.cadence = cadence      # int16, rpm
+        self.watts = watts          # float64, W
+        self.mask = mask            # uint8, HAS_* bits
+        self.source = source
+        self._epoch = None
+
+    @classmethod
+    def from_records(cls, records: Iterable[TrackpointRecord],
+                     source: Optional[str] = None) -> 'Ride':
+        """Build a Ride from TrackpointRecords, appending into typed buffers."""
+        nan = float('nan')
+        times = []
+        lat, lon, elev, dist = array('d'), array('d'), array('d'), array('d')
+        speed, watts = array('d'), array('d')
+        cadence = array('h')
+        mask = array('B')
+
+        for rec in records:
+            bits = 0
+            if rec.time is not None:
+                bits |= HAS_TIME
+                times.append(rec.time.encode('ascii'))
+            else:
+                times.append(b'')
+            if rec.latitude is not None and rec.longitude is not None:
+                bits |= HAS_POSITION
+                lat.append(rec.latitude)
+                lon.append(rec.longitude)
+            else:
+                lat.append(nan)
+                lon.append(nan)
+            if rec.elevation is not None:
+                bits |= HAS_ELEVATION
+                elev.append(rec.elevation)
+            else:
+                elev.append(nan)
+            if rec.distance is not None:
+                bits |= HAS_DISTANCE
+                dist.append(rec.distance)
+            else:
+                dist.append(nan)
+            if rec.speed is not None:
+                bits |= HAS_SPEED
+                speed.append(rec.speed)
+            else:
+                speed.append(0.0)
+            if rec.cadence is not None:
+                bits |= HAS_CADENCE
+                cadence.append(rec.cadence)
+            else:
+                cadence.append(0)
+            if rec.watts is not None:
+                bits |= HAS_WATTS
+                watts.append(rec.watts)
+            else:
+                watts.append(0.0)
+            mask.append(bits)
+
+        return cls(
+            time=np.array(times, dtype='S') if times else np.empty(0, dtype='S24'),
+            latitude=np.frombuffer(lat, dtype=np.float64),
+            longitude=np.frombuffer(lon, dtype=np.float64),
+            elevation=np.frombuffer(elev, dtype=np.float64),
+            distance=np.frombuffer(dist, dtype=np.float64),
+            speed=np.frombuffer(speed, dtype=np.float64),
+            cadence=np.frombuffer(cadence, dtype=np.int16),
+            watts=np.frombuffer(watts, dtype=np.float64),
+            mask=np.frombuffer(mask, dtype=np.uint8),
+            source=source,
+        )
+
+    @classmethod
+    def from_scan(cls, columns: Dict[str, np.ndarray], source: Optional[str] = None) -> 'Ride':
+        """Build a Ride from np_weight.fastscan columns (NaN / b'' where missing)."""
+        present = {name: ~np.isnan(columns[name]) for name in
+                   ('latitude', 'longitude', 'elevation', 'distance', 'speed', 'cadence', 'watts')}
+        position = present['latitude'] & present['longitude']
+        mask = ((columns['time'] != b'') * HAS_TIME
+                | position * HAS_POSITION
+                | present['elevation'] * HAS_ELEVATION
+                | present['distance'] * HAS_DISTANCE
+                | present['speed'] * HAS_SPEED
+                | present['cadence'] * HAS_CADENCE
+                | present['watts'] * HAS_WATTS).astype(np.uint8)
+
+        def fill(name, value, where=None):
+            where = present[name] if where is None else where
+            return np.where(where, columns[name], value)
+
+        return cls(
+            time=columns['time'],
+            latitude=fill('latitude', np.nan, position),
+            longitude=fill('longitude', np.nan, position),
+            elevation=columns['elevation'],
+            distance=columns['distance'],
+            speed=fill('speed', 0.0),
+            cadence=fill('cadence', 0).astype(np.int16),
+            watts=fill('watts', 0.0),
+            mask=mask,
+            source=source,
+        )
+
+    @classmethod
+    def from_tcx(cls, path: str, fast: bool = True) -> 'Ride':
+        """
+        Read a TCX file into a Ride.
+
+        With `fast`, the file is first tried with the byte-scanning reader
+        (np_weight.fastscan), falling back to the streaming XML reader for
+        files it does not recognise. Both give the same Ride.
+        """
+        if not fast:
+            with stage('xml'):
+                ride = cls.from_records(iter_trackpoints(path), source=str(path))
+            count('trackpoints.parsed', len(ride))
+            return ride
+        with stage('read'):
+            with open(path, 'rb') as f:
+                data = f.read()
+        return cls.from_tcx_bytes(data, source=str(path))
+
+    @classmethod
+    def from_tcx_bytes(cls, data: bytes, source: Optional[str] = None) -> 'Ride':
+        """Ride from the contents of a TCX file (e.g. an upload), fast reader first."""
+        with stage('scan'):
+            columns = scan_tcx(data)
+            if columns is not None:
+                ride = cls.from_scan(columns, source=source)
+        if columns is None:
+            count('fastscan.fallback')
+            with stage('xml'):
+                ride = cls.from_records(iter_trackpoints(BytesIO(data)), source=source)
+        count('trackpoints.parsed', len(ride))
+        return ride
+
+    def save(self, file: Union[str, Path, IO[bytes]]) -> None:
+        """Write the columns to an uncompressed .npz file (path or binary file object)."""
+        np.savez(file, source=np.array(self.source or ''),
+                 **{col: getattr(self, col) for col in COLUMNS})
+
+    @classmethod
+    def load(cls, path: Union[str, Path, IO[bytes]]) -> 'Ride':
+        """Read a Ride written by save()."""
+        with np.load(path) as data:
+            columns = {col: data[col] for col in COLUMNS}
+            source = str(data['source']) or None
+        return cls(**columns, source=source)
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+    def __repr__(self) -> str:
+        name = Path(self.source).name if self.source else None
+        return f'Ride({name!r}, {len(self)} trackpoints)'
+
+    @property
+    def file_name(self) -> Optional[str]:
+        """Base name of the source file, if known."""
+        return Path(self.source).name if self.source else None
+
+    @property
+    def epoch(self) -> np.ndarray:
+        """Timestamps as float seconds since the Unix epoch (NaN if missing)."""
+        if self._epoch is None:
+            self._epoch = parse_times(self.time)
+        return self._epoch
+
+    def dt(self) -> np.ndarray:
+        """
+        Seconds between consecutive trackpoints (len(self) - 1 entries).
+
+        Steps whose timestamps are missing, repeated or out of order count
+        as NOMINAL_DT.
+        """
+        steps = np.diff(self.epoch)
+        return np.where(steps > 0, steps, NOMINAL_DT)
+
+    @property
+    def duration(self) -> float:
+        """Elapsed seconds from the first to the last trackpoint."""
+        return float(self.dt().sum())
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the column arrays in bytes."""
+        return sum(getattr(self, col).nbytes for col in COLUMNS)
+
+    def has(self, fields: int) -> np.ndarray:
+        """Boolean array: rows where every bit in `fields` is present."""
+        return (self.mask & fields) == fields
+
+    def take(self, index) -> 'Ride':
+        """New Ride with the rows selected by a boolean mask, slice or index array."""
+        return Ride(*(getattr(self, col)[index] for col in COLUMNS), source=self.source)
+
+    def select(self, fields: int) -> 'Ride':
+        """New Ride holding only the rows where all of `fields` are present."""
+        keep = self.has(fields)
+        if keep.all():
+            return self
+        return self.take(keep)
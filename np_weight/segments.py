@@ -0,0 +1,206 @@
+"""
+Climb and acceleration segments and their share of the extra-weight cost.
+
+Segments are the rising legs of a smoothed profile:
+- climbs come from the elevation, smoothed over CLIMB_SMOOTHING samples;
+- accelerations come from the speed, smoothed over ACCEL_SMOOTHING samples,
+  i.e. stretches where its derivative stays positive.
+
+A dip smaller than the tolerance does not end a leg, and a leg is kept only
+if it rises by at least the minimum (metres of elevation, or m/s of speed).
+Turning points are found with NumPy and the walk visits only those points.
+Each segment's extra energy, average, NP and climbing are queried from the
+ride's IntervalIndex (RideAnalysis.index), so breaking a ride into hundreds
+of segments costs one prefix-sum pass:
+
+    python -m np_weight.segments "Dawlish_GP_-_back_yo-yoing.tcx" --top 10
+"""
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .analysis import RideAnalysis, analyze_ride, open_ride
+from .cache import DEFAULT_CACHE_DIR, RideCache
+from .index import IntervalCost, IntervalIndex, format_clock
+
+# Climbs: elevation smoothed over 15 s, dips under 1 m ignored, at least 3 m gained
+CLIMB_SMOOTHING = 15
+CLIMB_TOLERANCE = 1.0
+MIN_CLIMB = 3.0
+
+# Accelerations: speed smoothed over 3 s, dips under 0.3 m/s ignored,
+# at least 2 m/s (7.2 km/h) gained
+ACCEL_SMOOTHING = 3
+ACCEL_TOLERANCE = 0.3
+MIN_ACCELERATION = 2.0
+
+
+@dataclass
+class Segment:
+    """A climb or acceleration and what the extra weight cost over it."""
+    kind: str  # 'climb' or 'acceleration'
+    rise: float  # m of smoothed elevation, or m/s of smoothed speed
+    cost: IntervalCost
+    share: float  # fraction of the ride's extra energy
+
+    def to_dict(self) -> dict:
+        return dict(kind=self.kind, rise=self.rise, share=self.share, **self.cost._asdict())
+
+
+def smooth(values: np.ndarray, window: int) -> np.ndarray:
+    """Centred moving average over `window` samples (shrinking at the ends), O(n)."""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if window <= 1 or n == 0:
+        return values
+    csum = np.empty(n + 1)
+    csum[0] = 0.0
+    np.cumsum(values, out=csum[1:])
+    idx = np.arange(n)
+    lo = np.maximum(idx - window // 2, 0)
+    hi = np.minimum(idx + (window + 1) // 2, n)
+    return (csum[hi] - csum[lo]) / (hi - lo)
+
+
+def rising_legs(values: np.ndarray, min_rise: float,
+                tolerance: float) -> List[Tuple[int, int]]:
+    """
+    (start, end) index pairs of the rises in `values` of at least `min_rise`.
+
+    A fall of no more than `tolerance` inside a rise does not end it.
+    """
+    if len(values) < 2:
+        return []
+    changes = np.flatnonzero(np.diff(values))
+    direction = np.sign(np.diff(values)[changes])
+    turns = changes[1:][direction[1:] != direction[:-1]]
+    points = np.r_[0, turns, len(values) - 1]
+    levels = values[points]
+
+    legs = []
+    low = high = 0  # positions in points
+    for k in range(1, len(points)):
+        level = levels[k]
+        if level > levels[high]:
+            high = k
+        elif levels[high] - level > tolerance or level < levels[low]:
+            if levels[high] - levels[low] >= min_rise:
+                legs.append((int(points[low]), int(points[high])))
+            low = high = k
+    if levels[high] - levels[low] >= min_rise:
+        legs.append((int(points[low]), int(points[high])))
+    return legs
+
+
+def _segments(kind: str, legs, rises, index: IntervalIndex, offset: int = 0) -> List[Segment]:
+    total = index.total().energy
+    segments = []
+    for (start, end), rise in zip(legs, rises):
+        cost = index.query(start + offset, end + offset)
+        segments.append(Segment(kind, float(rise), cost,
+                                cost.energy / total if total > 0 else 0.0))
+    return segments
+
+
+def find_climbs(analysis: RideAnalysis, index: Optional[IntervalIndex] = None,
+                min_gain: float = MIN_CLIMB, smoothing: int = CLIMB_SMOOTHING,
+                tolerance: float = CLIMB_TOLERANCE) -> List[Segment]:
+    """Climbs gaining at least `min_gain` m of smoothed elevation."""
+    index = index or analysis.index
+    elevation = smooth(analysis.elevation, smoothing)
+    legs = rising_legs(elevation, min_gain, tolerance)
+    return _segments('climb', legs, [elevation[b] - elevation[a] for a, b in legs], index)
+
+
+def find_accelerations(analysis: RideAnalysis, index: Optional[IntervalIndex] = None,
+                       min_gain: float = MIN_ACCELERATION, smoothing: int = ACCEL_SMOOTHING,
+                       tolerance: float = ACCEL_TOLERANCE) -> List[Segment]:
+    """Accelerations gaining at least `min_gain` m/s of smoothed speed."""
+    index = index or analysis.index
+    speed = smooth(analysis.speed, smoothing)
+    legs = rising_legs(speed, min_gain, tolerance)
+    # analysis.speed[k] is the speed at trackpoint k + 1
+    return _segments('acceleration', legs, [speed[b] - speed[a] for a, b in legs], index,
+                     offset=1)
+
+
+def segment_ride(analysis: RideAnalysis, index: Optional[IntervalIndex] = None,
+                 min_climb: float = MIN_CLIMB,
+                 min_acceleration: float = MIN_ACCELERATION) -> List[Segment]:
+    """
+    Climbs and accelerations in ride order.
+
+    The two kinds can overlap (a surge up a rise), so their shares may add
+    up to more than the segments' part of the ride.
+    """
+    index = index or analysis.index
+    segments = (find_climbs(analysis, index, min_climb)
+                + find_accelerations(analysis, index, min_acceleration))
+    segments.sort(key=lambda s: (s.cost.start, s.kind))
+    return segments
+
+
+def format_segments(analysis: RideAnalysis, segments: List[Segment],
+                    top: Optional[int] = None) -> str:
+    """Per-kind totals, then the segments (the `top` costliest, in ride order)."""
+    lines = [f"{analysis.file_name}: {analysis.extra.energy / 1000:.2f} kJ extra "
+             f"over {analysis.duration / 60:.1f} min"]
+    for kind in ('climb', 'acceleration'):
+        of_kind = [s for s in segments if s.kind == kind]
+        energy = sum(s.cost.energy for s in of_kind)
+        share = sum(s.share for s in of_kind)
+        lines.append(f"  {len(of_kind):>4} {kind + 's':<14} {energy / 1000:>6.2f} kJ "
+                     f"({share * 100:.0f}% of the extra energy)")
+    if top is not None:
+        keep = sorted(segments, key=lambda s: s.cost.energy, reverse=True)[:top]
+        segments = sorted(keep, key=lambda s: s.cost.start)
+    lines.append(f"  {'Kind':<13} {'Start':>6} {'Time':>6} {'Rise':>10} {'Energy':>8} "
+                 f"{'Share':>6} {'Avg':>8} {'NP':>8}")
+    for s in segments:
+        rise = f"{s.rise:.1f} m" if s.kind == 'climb' else f"{s.rise * 3.6:.1f} km/h"
+        lines.append(f"  {s.kind:<13} {format_clock(s.cost.start_time):>6} "
+                     f"{s.cost.duration:>5.0f}s {rise:>10} {s.cost.energy:>6.0f} J "
+                     f"{s.share * 100:>5.1f}% {s.cost.average:>6.2f} W "
+                     f"{s.cost.normalized_power:>6.2f} W")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Break rides into climbs and accelerations with their extra-weight cost')
+    parser.add_argument('files', nargs='+', help='TCX files')
+    parser.add_argument('--extra-weight', type=float, default=1.0, help='extra weight in kg')
+    parser.add_argument('--min-climb', type=float, default=MIN_CLIMB,
+                        help=f'smallest climb in m (default {MIN_CLIMB:g})')
+    parser.add_argument('--min-acceleration', type=float, default=MIN_ACCELERATION,
+                        help=f'smallest acceleration in m/s (default {MIN_ACCELERATION:g})')
+    parser.add_argument('--top', type=int, default=None, metavar='N',
+                        help='list only the N costliest segments')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--resample', action='store_true',
+                        help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    args = parser.parse_args(argv)
+
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    for path in args.files:
+        try:
+            analysis = analyze_ride(open_ride(path, cache=cache, resample=args.resample),
+                                    args.extra_weight)
+        except Exception as e:
+            print(f"✗ {Path(path).name} (error: {str(e)[:50]})\n")
+            continue
+        if analysis is None:
+            print(f"✗ {Path(path).name} (insufficient data)\n")
+            continue
+        segments = segment_ride(analysis, min_climb=args.min_climb,
+                                min_acceleration=args.min_acceleration)
+        print(format_segments(analysis, segments, args.top) + '\n')
+
+
+if __name__ == '__main__':
+    main()
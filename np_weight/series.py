@@ -0,0 +1,122 @@
+"""
+Per-step series of a ride analysis, for plots and further analysis.
+
+The batch results hold only aggregates. Anything that needs the series
+itself (the notebook's plots, custom window statistics) used to rebuild it
+by hand, or went through a JSON list of a million floats. step_series()
+instead returns the arrays the analysis already holds, one entry per step
+(trackpoint after the first):
+
+    time             s since the epoch at the end of the step (needs the ride)
+    elapsed          s since the start of the ride
+    speed            m/s
+    elevation        m
+    elevation_delta  m, signed
+    kinetic          W, extra-weight KE cost (signed)
+    potential        W, extra-weight PE cost (uphill only)
+    extra_power      W, clipped at 0
+    measured         W, 0 where the file has no power
+    dt               s
+
+Every column except `elapsed` is a view of the analysis or ride arrays, so
+no data is copied. Treat them as read-only. write_series() stores them as
+.npz (uncompressed float64, 8 bytes a value) or, with pyarrow, as Parquet or
+Arrow IPC through the columnar writer. read_series() reads them back:
+
+    python -m np_weight.series ride.tcx --out ride-series.parquet
+"""
+
+import argparse
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+
+from . import columnar
+from .analysis import RideAnalysis, analyze_ride, open_ride
+from .cache import DEFAULT_CACHE_DIR, RideCache
+from .ride import Ride
+
+SERIES = ('time', 'elapsed', 'speed', 'elevation', 'elevation_delta', 'kinetic',
+          'potential', 'extra_power', 'measured', 'dt')
+
+# File suffix → series format (.parquet/.arrow/.feather as in columnar)
+FORMATS = {'.npz': 'npz', **dict.fromkeys(columnar.FORMATS, 'columnar')}
+
+
+def step_series(analysis: RideAnalysis, ride: Optional[Ride] = None) -> Dict[str, np.ndarray]:
+    """
+    Per-step columns of `analysis` (see the module docstring), as views.
+
+    `time` is included only when the analysed `ride` is given.
+    """
+    extra = analysis.extra
+    dt = np.broadcast_to(extra.dt, extra.total.shape)
+    series = {}
+    if ride is not None:
+        series['time'] = ride.epoch[1:]
+    series.update(
+        elapsed=np.cumsum(dt),
+        speed=analysis.speed,
+        elevation=analysis.elevation[1:],
+        elevation_delta=extra.elevation_delta,
+        kinetic=extra.kinetic,
+        potential=extra.potential,
+        extra_power=extra.total,
+        measured=analysis.measured,
+        dt=dt,
+    )
+    return series
+
+
+def _format(path: Union[str, Path]) -> str:
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f'{path}: expected one of {", ".join(FORMATS)}')
+    return fmt
+
+
+def write_series(series: Dict[str, np.ndarray], path: Union[str, Path]) -> None:
+    """Write step_series() output as .npz, or as .parquet/.arrow (requires pyarrow)."""
+    if _format(path) == 'npz':
+        np.savez(path, **series)
+    else:
+        columnar._require_pyarrow()
+        columnar.write_table(columnar.pa.table(
+            {name: np.ascontiguousarray(values) for name, values in series.items()}), path)
+
+
+def read_series(path: Union[str, Path],
+                columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    """Columns stored by write_series() (all of them by default)."""
+    if _format(path) == 'npz':
+        with np.load(path) as data:
+            return {name: data[name] for name in (columns or data.files)}
+    table = columnar.read_table(path, columns)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the per-step extra-weight series of a ride')
+    parser.add_argument('file', help='TCX file')
+    parser.add_argument('--out', required=True,
+                        help='output file (.npz, or .parquet/.arrow with pyarrow)')
+    parser.add_argument('--extra-weight', type=float, default=1.0, help='extra weight in kg')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--resample', action='store_true',
+                        help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    args = parser.parse_args(argv)
+
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    ride = open_ride(args.file, cache=cache, resample=args.resample)
+    analysis = analyze_ride(ride, args.extra_weight)
+    if analysis is None:
+        print(f"✗ {Path(args.file).name} (insufficient data)")
+        return
+    write_series(step_series(analysis, ride), args.out)
+    print(f"✓ {Path(args.file).name}: {len(analysis.extra)} steps → {args.out}")
+
+
+if __name__ == '__main__':
+    main()
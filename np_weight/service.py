@@ -0,0 +1,345 @@
+"""
+Local HTTP/JSON analysis service.
+
+A web front-end that shells out to weight_power_analysis.py pays for
+interpreter start-up, imports and a directory scan on every request. This
+service stays up instead. It keeps parsed rides warm in memory, as a
+SweepBasis (np_weight.sweep), so an analysis for any rider_mass/extra_weight
+is a few arithmetic operations.
+
+Concurrent requests for the same ride are batched. The first request to
+arrive computes one vectorised mass sweep over every (rider_mass,
+extra_weight) queued for that ride, and the requests that queued meanwhile
+take their cells from it. Under no load, nothing waits for a batch to fill.
+
+Endpoints (all responses are JSON):
+
+    POST /rides?name=ride.tcx                TCX file as the request body
+                                             → {"ride_id", "file_name", "trackpoints"}
+    GET  /rides/<ride_id>?rider_mass=75&extra_weight=1
+                                             → analysis of a warm or cached ride
+    POST /analyze?rider_mass=75&extra_weight=1&name=ride.tcx
+                                             TCX body → upload and analysis in one
+    GET  /health
+
+The ride ID is the content digest used by RideCache. With --cache-dir, rides
+evicted from memory, or parsed by an earlier run or the batch scripts, are
+reloaded from disk. Only the standard library is used; the server binds to
+localhost by default:
+
+    python -m np_weight.service --port 8750 --cache-dir
+    curl --data-binary @ride.tcx 'localhost:8750/analyze?extra_weight=1'
+"""
+
+import argparse
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import DEFAULT_CACHE_DIR, RideCache, bytes_digest
+from .ride import Ride
+from .sweep import SweepBasis, sweep_basis
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+DEFAULT_MAX_RIDES = 256  # warm rides kept in memory (a SweepBasis is a few hundred bytes)
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+
+_RIDE_ID = re.compile(r'^[0-9a-f]{40}$')
+
+
+class RequestError(Exception):
+    """A request the service rejects, with its HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _SweepBatcher:
+    """
+    Coalesces concurrent (rider_mass, extra_weight) requests on one ride.
+
+    Whoever finds the batcher idle becomes the leader. It sweeps everything
+    queued so far in one call, and keeps doing so until the queue is empty.
+    The other requests just wait for their result.
+    """
+
+    def __init__(self, basis: SweepBasis):
+        self.basis = basis
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[float, float, Future]] = []
+        self._running = False
+
+    def submit(self, rider_mass: float, extra_weight: float) -> dict:
+        future: Future = Future()
+        with self._lock:
+            self._queue.append((rider_mass, extra_weight, future))
+            lead = not self._running
+            self._running = True
+        if lead:
+            while True:
+                with self._lock:
+                    batch, self._queue = self._queue, []
+                    if not batch:
+                        self._running = False
+                        break
+                self._run(batch)
+        return future.result()
+
+    def _run(self, batch: List[Tuple[float, float, Future]]) -> None:
+        masses = sorted({m for m, _, _ in batch})
+        extras = sorted({e for _, e, _ in batch})
+        try:
+            sweep = self.basis.sweep(masses, extras)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        row = {m: i for i, m in enumerate(masses)}
+        col = {e: j for j, e in enumerate(extras)}
+        for mass, extra, future in batch:
+            i, j = row[mass], col[extra]
+            with_extra = sweep.has_measured_power
+            future.set_result({
+                'file_name': sweep.file_name,
+                'rider_mass': mass,
+                'extra_weight': extra,
+                'has_measured_power': sweep.has_measured_power,
+                'extra_np': float(sweep.extra_np[i, j]),
+                'extra_avg': float(sweep.extra_avg[i, j]),
+                'extra_max': float(sweep.extra_max[i, j]),
+                'extra_energy_j': float(sweep.extra_energy_j[i, j]),
+                'np_original': sweep.np_original,
+                'np_with_extra': float(sweep.np_with_extra[i, j]) if with_extra else None,
+                'w_per_kg_original':
+                    float(sweep.w_per_kg_original[i]) if with_extra else None,
+                'w_per_kg_with_extra':
+                    float(sweep.w_per_kg_with_extra[i, j]) if with_extra else None,
+                'batch_size': len(batch),
+            })
+
+
+class WarmRide:
+    """A ride held in memory, ready for sweeps."""
+
+    def __init__(self, ride_id: str, ride: Ride, basis: SweepBasis):
+        self.ride_id = ride_id
+        self.file_name = ride.file_name
+        self.trackpoints = len(ride)
+        self.batcher = _SweepBatcher(basis)
+
+    def summary(self) -> dict:
+        return {'ride_id': self.ride_id, 'file_name': self.file_name,
+                'trackpoints': self.trackpoints}
+
+    def analyze(self, rider_mass: float, extra_weight: float) -> dict:
+        return dict(self.batcher.submit(rider_mass, extra_weight), ride_id=self.ride_id)
+
+
+class RideStore:
+    """LRU set of warm rides, backed by an optional on-disk RideCache."""
+
+    def __init__(self, cache: Optional[RideCache] = None, max_rides: int = DEFAULT_MAX_RIDES):
+        self.cache = cache
+        self.max_rides = max_rides
+        self._rides: 'OrderedDict[str, WarmRide]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rides)
+
+    def _warm(self, ride_id: str, ride: Ride) -> WarmRide:
+        basis = sweep_basis(ride)
+        if basis is None:
+            raise RequestError(422, 'ride has fewer than two usable trackpoints')
+        warm = WarmRide(ride_id, ride, basis)
+        with self._lock:
+            # A concurrent upload of the same ride may have won the race
+            warm = self._rides.setdefault(ride_id, warm)
+            self._rides.move_to_end(ride_id)
+            while len(self._rides) > self.max_rides:
+                self._rides.popitem(last=False)
+        return warm
+
+    def get(self, ride_id: str) -> Optional[WarmRide]:
+        """Warm ride by ID, reloading it from the cache if it was evicted."""
+        with self._lock:
+            warm = self._rides.get(ride_id)
+            if warm is not None:
+                self._rides.move_to_end(ride_id)
+                return warm
+        if self.cache is None or not _RIDE_ID.match(ride_id):
+            return None
+        ride = self.cache.get(RideCache.digest_key(ride_id))
+        return self._warm(ride_id, ride) if ride is not None else None
+
+    def add(self, data: bytes, name: Optional[str] = None) -> WarmRide:
+        """Parse an uploaded TCX file (unless already known) and keep it warm."""
+        ride_id = bytes_digest(data)
+        warm = self.get(ride_id)
+        if warm is not None:
+            return warm
+        try:
+            ride = Ride.from_tcx_bytes(data, source=name)
+        except Exception as e:
+            raise RequestError(400, f'could not parse TCX: {type(e).__name__}: {e}')
+        if self.cache is not None:
+            self.cache.put(RideCache.digest_key(ride_id), ride)
+        return self._warm(ride_id, ride)
+
+
+def _number(query: dict, name: str, default: float) -> float:
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = float(values[-1])
+    except ValueError:
+        raise RequestError(400, f'{name} must be a number')
+    if not math.isfinite(value):
+        raise RequestError(400, f'{name} must be finite')
+    return value
+
+
+def _analysis_params(query: dict) -> Tuple[float, float]:
+    rider_mass = _number(query, 'rider_mass', 75.0)
+    extra_weight = _number(query, 'extra_weight', 1.0)
+    if rider_mass <= 0:
+        raise RequestError(400, 'rider_mass must be positive')
+    if extra_weight < 0:
+        raise RequestError(400, 'extra_weight must be non-negative')
+    return rider_mass, extra_weight
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so clients skip a TCP handshake per request
+    # Headers and body are separate writes; with Nagle on, a keep-alive
+    # client's delayed ACK would hold the body back by ~40 ms
+    disable_nagle_algorithm = True
+    server_version = 'np_weight'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method: str) -> None:
+        try:
+            status, body = self._route(method)
+        except RequestError as e:
+            status, body = e.status, {'error': str(e)}
+        except Exception as e:
+            status, body = 500, {'error': f'{type(e).__name__}: {e}'}
+        if status >= 400:
+            # The request body may be unread (a rejected upload), and on a
+            # keep-alive connection it would be parsed as the next request
+            self.close_connection = True
+        self._send(status, body)
+
+    def _route(self, method: str) -> Tuple[int, dict]:
+        store: RideStore = self.server.store
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = parse_qs(url.query)
+
+        if method == 'GET' and parts == ['health']:
+            return 200, {'status': 'ok', 'rides': len(store)}
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'rides':
+            params = _analysis_params(query)
+            warm = store.get(parts[1])
+            if warm is None:
+                raise RequestError(404, f'unknown ride {parts[1]}')
+            return 200, warm.analyze(*params)
+        if method == 'POST' and parts in (['rides'], ['analyze']):
+            params = _analysis_params(query) if parts == ['analyze'] else None
+            name = query.get('name', [None])[-1]
+            warm = store.add(self._body(), name)
+            if params is None:
+                return 201, warm.summary()
+            return 200, warm.analyze(*params)
+        raise RequestError(404, f'no route for {method} {url.path}')
+
+    def _body(self) -> bytes:
+        length = self.headers.get('Content-Length')
+        if length is None:
+            raise RequestError(400, 'Content-Length required')
+        try:
+            length = int(length)
+        except ValueError:
+            raise RequestError(400, 'Content-Length must be an integer')
+        if length < 0:
+            # rfile.read(-1) would wait for the client to close the connection
+            raise RequestError(400, 'Content-Length must be non-negative')
+        if length > MAX_UPLOAD_BYTES:
+            raise RequestError(413, f'upload larger than {MAX_UPLOAD_BYTES} bytes')
+        return self.rfile.read(length)
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(store: RideStore, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                verbose: bool = False) -> ThreadingHTTPServer:
+    """HTTP server over `store` (port 0 picks a free port; see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.store = store
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve extra-weight analyses over local HTTP')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'bind address (default {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'port (default {DEFAULT_PORT})')
+    parser.add_argument('--max-rides', type=int, default=DEFAULT_MAX_RIDES,
+                        help=f'warm rides kept in memory (default {DEFAULT_MAX_RIDES})')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--preload', nargs='*', default=[], metavar='FILE',
+                        help='TCX files to parse and keep warm at start-up')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    store = RideStore(RideCache(args.cache_dir) if args.cache_dir else None, args.max_rides)
+    for path in args.preload:
+        try:
+            warm = store.add(Path(path).read_bytes(), Path(path).name)
+            print(f"✓ {warm.file_name}: {warm.ride_id}")
+        except Exception as e:
+            print(f"✗ {Path(path).name} (error: {str(e)[:50]})")
+
+    server = make_server(store, args.host, args.port, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
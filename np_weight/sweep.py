@@ -0,0 +1,236 @@
+"""
+Mass sweep: evaluate many rider_mass/extra_weight combinations in one pass.
+
+The KE and uphill PE terms are linear in mass, so the clipped extra power for
+m kg is m times the extra power for 1 kg. One per-second 1 kg cost series per
+ride therefore serves the whole grid:
+
+    avg, max, energy and NP of the extra power   scale by m
+    NP of (measured + m · cost)                   is a quartic in m whose five
+                                                  coefficients are moments of
+                                                  the 30 s rolling averages
+
+so every grid point after the first costs O(1) instead of a full pass.
+
+Run as a script to sweep TCX files from the command line:
+
+    python -m np_weight.sweep *.tcx --rider-mass 65 70 75 80 85 --extra 0.25 0.5 1 2 3
+"""
+
+import argparse
+import json
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .batch import run_batch
+from .cache import DEFAULT_CACHE_DIR, RideCache, load_ride
+from .metrics import normalized_power, rolling_mean
+from .physics import extra_power
+from .ride import REQUIRE_PROFILE, Ride
+
+DEFAULT_RIDER_MASSES = (65.0, 70.0, 75.0, 80.0, 85.0)
+DEFAULT_EXTRA_WEIGHTS = (0.25, 0.5, 1.0, 2.0, 3.0)
+
+
+@dataclass
+class MassSweep:
+    """
+    Results over a rider_mass × extra_weight grid for one ride.
+
+    Matrices have shape (len(rider_masses), len(extra_weights)). The KE/PE
+    cost of the extra weight does not depend on the rider's own mass, so the
+    extra_* rows are identical; rider mass enters through W/kg.
+    """
+    file_name: Optional[str]
+    rider_masses: np.ndarray
+    extra_weights: np.ndarray
+    extra_np: np.ndarray  # W, NP of the extra power alone
+    extra_avg: np.ndarray  # W
+    extra_max: np.ndarray  # W
+    extra_energy_j: np.ndarray  # J
+    has_measured_power: bool
+    np_original: Optional[float]  # W, NP of measured power
+    np_with_extra: Optional[np.ndarray]  # W, NP of measured + extra
+    w_per_kg_original: Optional[np.ndarray]  # NP / rider_mass, shape (R,)
+    w_per_kg_with_extra: Optional[np.ndarray]  # NP with extra / (rider_mass + extra)
+
+    def to_dict(self) -> dict:
+        """JSON-friendly dict (matrices as nested lists)."""
+        def plain(value):
+            return value.tolist() if isinstance(value, np.ndarray) else value
+        return {name: plain(getattr(self, name)) for name in self.__dataclass_fields__}
+
+
+@dataclass
+class SweepBasis:
+    """
+    Per-ride quantities the whole grid is computed from: the statistics of
+    the 1 kg cost series and the five NP moments. Once built, sweep() costs
+    O(1) per grid point, so a warm ride answers any grid immediately.
+    """
+    file_name: Optional[str]
+    unit_np: float  # W, NP of the 1 kg cost
+    unit_avg: float  # W
+    unit_max: float  # W
+    unit_energy: float  # J
+    has_measured_power: bool
+    np_original: Optional[float]  # W, NP of measured power
+    moments: Optional[list]  # mean(Rw^(4-k) · Ru^k) for k = 0..4
+
+    def sweep(self, rider_masses: Sequence[float] = DEFAULT_RIDER_MASSES,
+              extra_weights: Sequence[float] = DEFAULT_EXTRA_WEIGHTS) -> MassSweep:
+        """Evaluate the rider_mass × extra_weight grid."""
+        masses = np.asarray(rider_masses, dtype=np.float64)
+        extras = np.asarray(extra_weights, dtype=np.float64)
+        if (extras < 0).any():
+            raise ValueError('extra_weights must be non-negative')
+
+        grid = np.ones((len(masses), 1))
+        extra_np = grid * (extras * self.unit_np)
+        extra_avg = grid * (extras * self.unit_avg)
+        extra_max = grid * (extras * self.unit_max)
+        extra_energy = grid * (extras * self.unit_energy)
+
+        np_with = wkg_original = wkg_with = None
+        if self.has_measured_power:
+            # NP(measured + m·unit)⁴ = Σₖ C(4,k) mᵏ mean(Rw^(4-k) · Ru^k)
+            binom = (1, 4, 6, 4, 1)
+            mean_r4 = sum(binom[k] * self.moments[k] * extras ** k for k in range(5))
+            np_with = grid * np.where(mean_r4 > 0, np.abs(mean_r4) ** 0.25, 0.0)
+            wkg_original = self.np_original / masses
+            wkg_with = np_with / (masses[:, None] + extras[None, :])
+
+        return MassSweep(
+            file_name=self.file_name,
+            rider_masses=masses,
+            extra_weights=extras,
+            extra_np=extra_np,
+            extra_avg=extra_avg,
+            extra_max=extra_max,
+            extra_energy_j=extra_energy,
+            has_measured_power=self.has_measured_power,
+            np_original=self.np_original,
+            np_with_extra=np_with,
+            w_per_kg_original=wkg_original,
+            w_per_kg_with_extra=wkg_with,
+        )
+
+
+def sweep_basis(ride: Ride) -> Optional[SweepBasis]:
+    """
+    One pass over a ride for later sweeps.
+
+    Returns:
+        SweepBasis, or None if the ride has fewer than two usable trackpoints
+    """
+    ride = ride.select(REQUIRE_PROFILE)
+    if len(ride) < 2:
+        return None
+
+    # Per-step cost of 1 kg; the cost of m kg is m times this
+    unit_power = extra_power(ride.speed, ride.elevation, 1.0, dt=ride.dt())
+    unit = unit_power.total
+
+    measured = ride.watts[1:]
+    has_power = bool((measured > 0).any())
+    np_original = moments = None
+    if has_power:
+        np_original = normalized_power(measured)
+        r_w = rolling_mean(measured)
+        r_u = rolling_mean(unit)
+        moments = [float(np.mean(r_w ** (4 - k) * r_u ** k)) for k in range(5)]
+
+    return SweepBasis(
+        file_name=ride.file_name,
+        unit_np=normalized_power(unit),
+        unit_avg=unit_power.average,
+        unit_max=float(unit.max()),
+        unit_energy=unit_power.energy,
+        has_measured_power=has_power,
+        np_original=np_original,
+        moments=moments,
+    )
+
+
+def mass_sweep(ride: Ride, rider_masses: Sequence[float] = DEFAULT_RIDER_MASSES,
+               extra_weights: Sequence[float] = DEFAULT_EXTRA_WEIGHTS) -> Optional[MassSweep]:
+    """
+    Sweep a ride over a grid of rider masses and extra weights.
+
+    Args:
+        ride: parsed ride (rows without time/elevation are ignored)
+        rider_masses: rider + bike masses in kg
+        extra_weights: additional weights in kg, all >= 0
+
+    Returns:
+        MassSweep, or None if the ride has fewer than two usable trackpoints
+    """
+    basis = sweep_basis(ride)
+    return basis.sweep(rider_masses, extra_weights) if basis is not None else None
+
+
+def sweep_file(tcx_file: str, rider_masses: Sequence[float] = DEFAULT_RIDER_MASSES,
+               extra_weights: Sequence[float] = DEFAULT_EXTRA_WEIGHTS,
+               cache: Optional[RideCache] = None) -> Optional[dict]:
+    """Parse one TCX file and sweep it (batch worker entry point)."""
+    result = mass_sweep(load_ride(tcx_file, cache), rider_masses, extra_weights)
+    return result.to_dict() if result else None
+
+
+def format_sweep(result: dict) -> str:
+    """Text table of one ride's sweep: extra weight rows × rider mass columns."""
+    masses = result['rider_masses']
+    lines = [result['file_name'] or '(unnamed ride)']
+    header = f"{'extra kg':>9} {'NP cost':>9}"
+    if result['has_measured_power']:
+        lines.append(f"  NP {result['np_original']:.1f} W")
+        header += ''.join(f"  {f'W/kg@{m:g}kg':>12}" for m in masses)
+    lines.append(header)
+    for j, extra in enumerate(result['extra_weights']):
+        row = f"{extra:>9g} {result['extra_np'][0][j]:>8.2f}W"
+        if result['has_measured_power']:
+            row += ''.join(f"  {result['w_per_kg_with_extra'][i][j]:>12.3f}"
+                           for i in range(len(masses)))
+        lines.append(row)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep TCX rides over rider mass and extra weight')
+    parser.add_argument('files', nargs='+', help='TCX files')
+    parser.add_argument('--rider-mass', type=float, nargs='+', default=list(DEFAULT_RIDER_MASSES),
+                        help='rider + bike masses in kg')
+    parser.add_argument('--extra', type=float, nargs='+', default=list(DEFAULT_EXTRA_WEIGHTS),
+                        help='extra weights in kg')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU, 1 = no pool)')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--json', metavar='PATH', help='write the result matrices to a JSON file')
+    args = parser.parse_args(argv)
+
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    sweep = partial(sweep_file, rider_masses=args.rider_mass, extra_weights=args.extra,
+                    cache=cache)
+
+    results = []
+    for item in run_batch(args.files, sweep, workers=args.workers):
+        if not item.ok:
+            print(f"✗ {Path(item.path).name}: {item.error}\n")
+        elif item.result:
+            results.append(item.result)
+            print(format_sweep(item.result) + '\n')
+
+    if args.json and results:
+        results.sort(key=lambda r: r['file_name'] or '')
+        with open(args.json, 'w') as f:
+            json.dump(results, f)
+        print(f"Results saved to: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
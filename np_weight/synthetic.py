@@ -0,0 +1,313 @@
+"""
+Deterministic synthetic rides for scale and memory testing.
+
+synthetic_ride() builds a physically plausible ride from a seed: a terrain
+profile over distance (a sum of random hills sized by the terrain type), a
+target power series with slow and fast variation, and the speed at which
+that power balances aero drag, rolling resistance and gravity on the local
+grade. Position follows a wandering heading, cadence follows power, and
+each optional field can be dropped at a given rate to exercise the
+missing-value paths. write_tcx() writes any Ride in the Garmin layout the
+readers expect (TCD namespace plus the ns3 TPX extension for speed and
+power), streaming in chunks so that multi-day files need no big buffers.
+
+    python -m np_weight.synthetic corpus/ --count 100 --hours 8 --terrain hilly
+
+The same arguments and seed always give byte-identical files.
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Union
+
+import numpy as np
+
+from .physics import CRR, G, RHO_AIR
+from .power_model import CDA
+from .ride import (HAS_CADENCE, HAS_DISTANCE, HAS_ELEVATION, HAS_POSITION, HAS_SPEED,
+                   HAS_TIME, HAS_WATTS, Ride)
+from .tcx import ACTIVITY_EXT_NS, TCD_NS
+
+# Terrain: (peak elevation swing in m, shortest and longest hill wavelength in m)
+TERRAIN = {
+    'flat': (3.0, 400.0, 3000.0),
+    'rolling': (25.0, 1500.0, 8000.0),
+    'hilly': (90.0, 2000.0, 15000.0),
+    'mountain': (450.0, 8000.0, 40000.0),
+}
+
+# Fields that missing= can drop (the timestamp is always written)
+OPTIONAL_FIELDS = {
+    'position': HAS_POSITION,
+    'elevation': HAS_ELEVATION,
+    'distance': HAS_DISTANCE,
+    'speed': HAS_SPEED,
+    'cadence': HAS_CADENCE,
+    'watts': HAS_WATTS,
+}
+
+_ALL_FIELDS = HAS_TIME | sum(OPTIONAL_FIELDS.values())
+
+_HILLS = 8
+_MIN_SPEED, _MAX_SPEED = 1.0, 25.0  # m/s
+_METRES_PER_DEGREE = 111_320.0
+
+# Trackpoints rendered per write() in write_tcx()
+_CHUNK = 20_000
+
+
+def _smooth_noise(rng: np.random.Generator, n: int, scale: float) -> np.ndarray:
+    """Unit-variance noise low-pass filtered to vary over about `scale` samples."""
+    if n < 2:
+        return np.zeros(n)
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    freq = np.fft.rfftfreq(n)
+    spectrum /= 1.0 + (freq * scale) ** 2
+    noise = np.fft.irfft(spectrum, n)
+    std = noise.std()
+    return noise / std if std > 0 else noise
+
+
+def _speed_for_power(power: np.ndarray, grade: np.ndarray, mass: float) -> np.ndarray:
+    """Steady speed where power = ½ρCdA·v³ + m·g·(Crr + grade)·v, by bisection."""
+    aero = 0.5 * RHO_AIR * CDA
+    resist = mass * G * (CRR + grade)
+    low = np.full(len(power), _MIN_SPEED)
+    high = np.full(len(power), _MAX_SPEED)
+    for _ in range(30):
+        v = 0.5 * (low + high)
+        over = aero * v ** 3 + resist * v > power
+        high = np.where(over, v, high)
+        low = np.where(over, low, v)
+    return 0.5 * (low + high)
+
+
+def synthetic_ride(hours: float = 1.0, rate_hz: float = 1.0, terrain: str = 'rolling',
+                   power: float = 220.0, power_noise: float = 0.15,
+                   missing: Union[float, Dict[str, float]] = 0.0, rider_mass: float = 75.0,
+                   seed: int = 0, start: str = '2025-06-01T08:00:00',
+                   name: Optional[str] = None) -> Ride:
+    """
+    Generate a ride.
+
+    Args:
+        hours: ride length
+        rate_hz: samples per second (1 for 1 Hz recording, 0.2 for "smart")
+        terrain: one of TERRAIN
+        power: average target power (W)
+        power_noise: relative power variability (0.15 = ±15 % typical swing)
+        missing: fraction of trackpoints missing each optional field, or
+                 {field: fraction} for fields in OPTIONAL_FIELDS
+        rider_mass: rider + bike mass (kg) used to turn power into speed
+        seed: random seed; equal arguments give an identical ride
+        start: UTC start time
+        name: Ride.source
+    """
+    if terrain not in TERRAIN:
+        raise ValueError(f'terrain must be one of {", ".join(TERRAIN)}')
+    if rate_hz <= 0:
+        raise ValueError('rate_hz must be positive')
+    rng = np.random.default_rng(seed)
+    n = int(round(hours * 3600 * rate_hz))
+    dt = 1.0 / rate_hz
+
+    # Target power: slow changes of pace plus second-to-second surges
+    slow = _smooth_noise(rng, n, 300 * rate_hz)
+    fast = _smooth_noise(rng, n, 5 * rate_hz)
+    target = np.maximum(power * (1 + power_noise * (0.6 * slow + fast)), 0.0)
+
+    # Terrain as a sum of hills over distance; amplitude ∝ wavelength keeps
+    # the steepest grades similar across terrain types
+    swing, shortest, longest = TERRAIN[terrain]
+    wavelengths = np.exp(rng.uniform(np.log(shortest), np.log(longest), _HILLS))
+    amplitudes = wavelengths / wavelengths.sum() * swing
+    phases = rng.uniform(0, 2 * np.pi, _HILLS)
+    k = 2 * np.pi / wavelengths
+
+    def profile(distance):
+        height, slope = np.zeros(n), np.zeros(n)
+        for a, kk, phase in zip(amplitudes, k, phases):
+            angle = kk * distance + phase
+            height += a * np.sin(angle)
+            slope += a * kk * np.cos(angle)
+        return height, slope
+
+    # Speed and position depend on each other through the grade; two passes
+    # are enough for the speeds to settle
+    distance = np.zeros(n)
+    grade = np.zeros(n)
+    for _ in range(2):
+        speed = _speed_for_power(target, grade, rider_mass)
+        # Soften ±2 s of speed change as the bike's inertia would
+        speed = np.convolve(np.pad(speed, 2, mode='edge'), np.full(5, 0.2), mode='valid')
+        distance = np.r_[0.0, np.cumsum(speed[1:] * dt)]
+        _, grade = profile(distance)
+    elevation = 50.0 + swing + profile(distance)[0]
+    # Freewheel on fast descents
+    watts = np.where(grade < -0.04, 0.0, target)
+
+    heading = rng.uniform(0, 2 * np.pi) + 1.5 * _smooth_noise(rng, n, 600 * rate_hz)
+    step = np.r_[0.0, speed[1:] * dt]
+    lat0, lon0 = rng.uniform(50.0, 53.0), rng.uniform(-4.0, 1.0)
+    latitude = lat0 + np.cumsum(step * np.cos(heading)) / _METRES_PER_DEGREE
+    longitude = lon0 + np.cumsum(step * np.sin(heading)) / (
+        _METRES_PER_DEGREE * np.cos(np.radians(lat0)))
+    cadence = np.where(watts > 0, 88 + 6 * _smooth_noise(rng, n, 30 * rate_hz), 0)
+
+    millis = np.round(np.arange(n) * dt * 1000).astype('timedelta64[ms]')
+    stamps = np.datetime_as_string(np.datetime64(start, 'ms') + millis, unit='ms')
+
+    ride = Ride(
+        time=np.char.add(stamps.astype('S'), b'Z'),
+        latitude=latitude.round(6),
+        longitude=longitude.round(6),
+        elevation=elevation.round(1),
+        distance=distance.round(2),
+        speed=speed.round(3),
+        cadence=np.rint(cadence).astype(np.int16),
+        watts=np.rint(watts),
+        mask=np.full(n, _ALL_FIELDS, dtype=np.uint8),
+        source=name,
+    )
+
+    rates = missing if isinstance(missing, dict) else dict.fromkeys(OPTIONAL_FIELDS, missing)
+    for field, rate in rates.items():
+        bit = OPTIONAL_FIELDS[field]
+        if rate <= 0:
+            continue
+        drop = rng.random(n) < rate
+        ride.mask[drop] &= ~bit & 0xFF
+        if bit == HAS_POSITION:
+            ride.latitude[drop] = ride.longitude[drop] = np.nan
+        elif bit in (HAS_ELEVATION, HAS_DISTANCE):
+            getattr(ride, field)[drop] = np.nan
+        else:
+            getattr(ride, field)[drop] = 0
+    return ride
+
+
+def _trackpoints(ride: Ride, rows: slice) -> str:
+    """<Trackpoint> elements for one chunk of rows."""
+    ext = 'ns3:'
+    columns = (ride.time[rows].astype('U').tolist(), ride.latitude[rows].tolist(),
+               ride.longitude[rows].tolist(), ride.elevation[rows].tolist(),
+               ride.distance[rows].tolist(), ride.cadence[rows].tolist(),
+               ride.speed[rows].tolist(), ride.watts[rows].tolist(),
+               ride.mask[rows].tolist())
+    parts = []
+    for time, lat, lon, elev, dist, cadence, speed, watts, bits in zip(*columns):
+        if bits == _ALL_FIELDS:
+            parts.append(
+                f'<Trackpoint><Time>{time}</Time><Position>'
+                f'<LatitudeDegrees>{lat!r}</LatitudeDegrees>'
+                f'<LongitudeDegrees>{lon!r}</LongitudeDegrees></Position>'
+                f'<AltitudeMeters>{elev!r}</AltitudeMeters>'
+                f'<DistanceMeters>{dist!r}</DistanceMeters><Cadence>{cadence}</Cadence>'
+                f'<Extensions><{ext}TPX><{ext}Speed>{speed!r}</{ext}Speed>'
+                f'<{ext}Watts>{watts!r}</{ext}Watts></{ext}TPX></Extensions></Trackpoint>')
+            continue
+        point = ['<Trackpoint>']
+        if bits & HAS_TIME:
+            point.append(f'<Time>{time}</Time>')
+        if bits & HAS_POSITION:
+            point.append(f'<Position><LatitudeDegrees>{lat!r}</LatitudeDegrees>'
+                         f'<LongitudeDegrees>{lon!r}</LongitudeDegrees></Position>')
+        if bits & HAS_ELEVATION:
+            point.append(f'<AltitudeMeters>{elev!r}</AltitudeMeters>')
+        if bits & HAS_DISTANCE:
+            point.append(f'<DistanceMeters>{dist!r}</DistanceMeters>')
+        if bits & HAS_CADENCE:
+            point.append(f'<Cadence>{cadence}</Cadence>')
+        if bits & (HAS_SPEED | HAS_WATTS):
+            point.append(f'<Extensions><{ext}TPX>')
+            if bits & HAS_SPEED:
+                point.append(f'<{ext}Speed>{speed!r}</{ext}Speed>')
+            if bits & HAS_WATTS:
+                point.append(f'<{ext}Watts>{watts!r}</{ext}Watts>')
+            point.append(f'</{ext}TPX></Extensions>')
+        point.append('</Trackpoint>')
+        parts.append(''.join(point))
+    return ''.join(parts)
+
+
+def write_tcx(ride: Ride, file: Union[str, Path, IO[bytes]], namespaced: bool = True) -> None:
+    """
+    Write a Ride as TCX; fields whose mask bit is unset are left out.
+
+    Args:
+        ride: ride to write
+        file: path or binary file object
+        namespaced: declare the TCD namespace as the default, as Garmin
+                    Connect does (False leaves it undeclared, like the Sauce
+                    for Strava exports)
+    """
+    if not hasattr(file, 'write'):
+        with open(file, 'wb') as f:
+            write_tcx(ride, f, namespaced)
+        return
+    first = ride.time[0].decode('ascii') if len(ride) else ''
+    distance = ride.distance[ride.has(HAS_DISTANCE)]
+    total = float(distance[-1]) if len(distance) else 0.0
+    default_ns = f' xmlns="{TCD_NS}"' if namespaced else ''
+    file.write(
+        f'<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<TrainingCenterDatabase{default_ns} xmlns:ns3="{ACTIVITY_EXT_NS}">'
+        f'<Activities><Activity Sport="Biking"><Id>{first}</Id>'
+        f'<Lap StartTime="{first}"><TotalTimeSeconds>{ride.duration:g}</TotalTimeSeconds>'
+        f'<DistanceMeters>{total!r}</DistanceMeters><TriggerMethod>Manual</TriggerMethod>'
+        f'<Track>'.encode('utf-8'))
+    for start in range(0, len(ride), _CHUNK):
+        file.write(_trackpoints(ride, slice(start, start + _CHUNK)).encode('ascii'))
+    file.write(b'</Track></Lap></Activity></Activities></TrainingCenterDatabase>\n')
+
+
+def generate_corpus(directory: Union[str, Path], count: int, seed: int = 0,
+                    namespaced: bool = True, **options) -> List[Path]:
+    """
+    Write `count` rides named synthetic_00000.tcx, ... to `directory`.
+
+    Ride i uses seed + i; `options` go to synthetic_ride().
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = directory / f'synthetic_{i:05d}.tcx'
+        write_tcx(synthetic_ride(seed=seed + i, name=str(path), **options), path, namespaced)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write deterministic synthetic TCX rides')
+    parser.add_argument('directory', help='output directory')
+    parser.add_argument('-n', '--count', type=int, default=1, help='number of rides')
+    parser.add_argument('--hours', type=float, default=1.0, help='ride length in hours')
+    parser.add_argument('--rate', type=float, default=1.0, help='samples per second')
+    parser.add_argument('--terrain', choices=sorted(TERRAIN), default='rolling')
+    parser.add_argument('--power', type=float, default=220.0, help='average target power in W')
+    parser.add_argument('--power-noise', type=float, default=0.15,
+                        help='relative power variability')
+    parser.add_argument('--missing', type=float, default=0.0,
+                        help='fraction of trackpoints missing each optional field')
+    parser.add_argument('--rider-mass', type=float, default=75.0, help='rider + bike mass in kg')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first ride')
+    parser.add_argument('--plain', action='store_true',
+                        help='no default namespace (Sauce for Strava layout)')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    paths = generate_corpus(args.directory, args.count, seed=args.seed,
+                            namespaced=not args.plain, hours=args.hours,
+                            rate_hz=args.rate, terrain=args.terrain, power=args.power,
+                            power_noise=args.power_noise, missing=args.missing,
+                            rider_mass=args.rider_mass)
+    size = sum(path.stat().st_size for path in paths)
+    elapsed = time.perf_counter() - started
+    print(f"✓ {len(paths)} rides, {size / 1e6:.1f} MB in {elapsed:.1f} s "
+          f"({size / 1e6 / elapsed:.0f} MB/s) → {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Streaming TCX trackpoint reader.
+
+Feeds a TCX file to an ``XMLPullParser`` (end events only) and yields one
+record per <Trackpoint> as soon as its closing tag is seen. Each
+trackpoint's children are cleared once read and the emptied elements are
+released when their <Track> closes (well under 100 bytes a trackpoint until
+then), and the large <Notes> blobs never accumulate in a DOM.
+
+Tags are matched as ElementTree reports them, with and without the
+TrainingCenterDatabase namespace, through set and dict lookups, so files
+written by Garmin Connect and by Sauce for Strava (like the bundled race
+files) are read the same way with no per-tag string work.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+from itertools import chain
+from typing import IO, Iterator, NamedTuple, Optional, Union
+
+from .instrument import count
+
+# Bump whenever parsing changes what ends up in a record, so that cached
+# parses (see np_weight.cache) are invalidated
+READER_VERSION = 1
+
+TCD_NS = 'http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2'
+ACTIVITY_EXT_NS = 'http://www.garmin.com/xmlschemas/ActivityExtension/v2'
+
+_CHUNK = 1 << 14  # bytes fed to the parser at a time; small chunks keep its events in cache
+
+
+class TrackpointRecord(NamedTuple):
+    """Raw values of one <Trackpoint>; fields missing from the file are None."""
+    time: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    elevation: Optional[float]
+    distance: Optional[float]
+    speed: Optional[float]
+    cadence: Optional[int]
+    watts: Optional[float]
+
+
+def _tags(local: str, *namespaces: str) -> frozenset:
+    """A tag with and without each namespace, as ElementTree reports it."""
+    return frozenset([local] + [f'{{{ns}}}{local}' for ns in namespaces])
+
+
+# What to do at the end of an element: read a trackpoint, or clear a finished
+# <Track> (releasing its emptied trackpoints) and the bulky <Notes>/<Lap>/<Activity>
+_READ, _CLEAR = 'read', 'clear'
+_ACTIONS = {
+    **dict.fromkeys(_tags('Trackpoint', TCD_NS), _READ),
+    **dict.fromkeys(_tags('Track', TCD_NS) | _tags('Notes', TCD_NS) | _tags('Lap', TCD_NS)
+                    | _tags('Activity', TCD_NS), _CLEAR),
+}
+
+# Fully qualified tag of each field inside a <Trackpoint> → its record index
+# (Speed and Watts sit in <Extensions><ns3:TPX>, the coordinates in <Position>)
+_FIELDS = {
+    **dict.fromkeys(_tags('Time', TCD_NS), 0),
+    **dict.fromkeys(_tags('LatitudeDegrees', TCD_NS), 1),
+    **dict.fromkeys(_tags('LongitudeDegrees', TCD_NS), 2),
+    **dict.fromkeys(_tags('AltitudeMeters', TCD_NS), 3),
+    **dict.fromkeys(_tags('DistanceMeters', TCD_NS), 4),
+    **dict.fromkeys(_tags('Speed', ACTIVITY_EXT_NS, TCD_NS), 5),
+    **dict.fromkeys(_tags('Cadence', TCD_NS), 6),
+    **dict.fromkeys(_tags('Watts', ACTIVITY_EXT_NS, TCD_NS), 7),
+}
+
+
+def _read_trackpoint(elem: ET.Element) -> TrackpointRecord:
+    """Pull the fields we use out of a single <Trackpoint> element."""
+    texts = [None] * 8
+    for child in elem.iter():
+        i = _FIELDS.get(child.tag)
+        if i is not None:
+            texts[i] = child.text
+    time, lat, lon, elev, dist, speed, cadence, watts = texts
+    return TrackpointRecord(
+        time,
+        float(lat) if lat else None,
+        float(lon) if lon else None,
+        float(elev) if elev else None,
+        float(dist) if dist else None,
+        float(speed) if speed else None,
+        int(cadence) if cadence else None,
+        float(watts) if watts else None,
+    )
+
+
+def iter_trackpoints(source: Union[str, IO[bytes]]) -> Iterator[TrackpointRecord]:
+    """
+    Stream trackpoints from a TCX file.
+
+    Args:
+        source: path to a TCX file or a binary file object
+
+    Yields:
+        TrackpointRecord for every well-formed <Trackpoint>, in file order.
+        Trackpoints with unparseable numeric values are skipped.
+    """
+    # The same end events as iterparse, without its extra generator layer
+    # per element
+    parser = ET.XMLPullParser(events=('end',))
+    file = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    try:
+        # The final None closes the parser and flushes its last events
+        for chunk in chain(iter(lambda: file.read(_CHUNK), b''), [None]):
+            if chunk is None:
+                parser.close()
+            else:
+                parser.feed(chunk)
+            for _, elem in parser.read_events():
+                action = _ACTIONS.get(elem.tag)
+                if action is None:
+                    continue
+                if action is _CLEAR:
+                    elem.clear()
+                    continue
+                try:
+                    record = _read_trackpoint(elem)
+                except ValueError:
+                    record = None
+                    count('trackpoints.malformed')
+
+                # Drop its children; the emptied element goes with its <Track>
+                elem.clear()
+
+                if record is not None:
+                    yield record
+    finally:
+        if file is not source:
+            file.close()
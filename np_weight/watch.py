@@ -0,0 +1,221 @@
+"""
+Watch a directory and analyze TCX uploads as they land.
+
+Instead of re-globbing and re-analyzing every file from cron, watch() runs
+one asyncio event loop that:
+
+- polls the directory every `interval` seconds (one os.scandir, so an idle
+  watcher costs next to no CPU) for .tcx files that are new or whose size
+  or mtime changed;
+- waits until a file has kept the same size and mtime for one poll and
+  was last written at least `settle` seconds ago, so files still being
+  uploaded are not picked up;
+- queues it on a bounded asyncio.Queue. When the queue is full, polling
+  waits (back-pressure), so a flood of uploads cannot pile up unboundedly;
+- analyzes files in a bounded process pool with the batch runner's per-file
+  error isolation. A worker that dies is logged as that file's error and
+  the pool is replaced, so the watch carries on;
+- appends one JSON line per file to the results log as soon as it finishes,
+  instead of rewriting a whole JSON document.
+
+The log records each file's size and mtime, so a restarted watcher skips
+everything it has already analyzed. From the command line:
+
+    python weight_power_analysis.py ~/uploads --watch
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from .batch import BatchResult, default_workers, run_one
+from .results import dumps, read_results
+
+DEFAULT_INTERVAL = 1.0  # s between directory polls
+DEFAULT_SETTLE = 2.0  # s a file must be left unwritten before it is analyzed
+DEFAULT_QUEUE_SIZE = 64  # files waiting for a worker before polling pauses
+RESULTS_LOG = 'weight_analysis_results.ndjson'
+
+Signature = Tuple[int, int]  # (size, mtime_ns)
+
+
+def scan(directory: Union[str, Path]) -> Dict[str, Signature]:
+    """Size and mtime of every .tcx file in `directory` (not recursive)."""
+    found = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.tcx') and entry.is_file():
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found[entry.path] = (st.st_size, st.st_mtime_ns)
+    return found
+
+
+class ResultLog:
+    """
+    Append-only NDJSON results file, one line per analyzed file version.
+
+    Each line holds the file's path, size and mtime_ns, the time it was
+    analyzed, and its result or error.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def done(self) -> Dict[str, Signature]:
+        """Latest recorded (size, mtime_ns) per path; unreadable lines are skipped."""
+        done = {}
+        for record in read_results(self.path):
+            try:
+                done[record['path']] = (record['size'], record['mtime_ns'])
+            except (KeyError, TypeError):
+                continue
+        return done
+
+    def append(self, item: BatchResult, signature: Signature) -> dict:
+        record = {'path': item.path, 'size': signature[0], 'mtime_ns': signature[1],
+                  'analyzed_at': time.time(), 'result': item.result, 'error': item.error}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(dumps(record) + '\n')
+        return record
+
+
+async def watch_directory(directory: Union[str, Path],
+                          analyze: Callable[[str], Optional[dict]],
+                          log: ResultLog, workers: Optional[int] = None,
+                          interval: float = DEFAULT_INTERVAL,
+                          settle: float = DEFAULT_SETTLE,
+                          queue_size: int = DEFAULT_QUEUE_SIZE,
+                          on_result: Optional[Callable[[BatchResult], None]] = None,
+                          stop: Optional[asyncio.Event] = None,
+                          once: bool = False) -> int:
+    """
+    Analyze new and changed .tcx files in `directory` until `stop` is set.
+
+    Args:
+        analyze: picklable callable mapping a path to a result dict, as for
+                 run_batch()
+        log: where results are appended; files it already holds are skipped
+        workers: pool size; None uses every CPU, 1 runs on a thread here
+        interval: seconds between directory polls
+        settle: seconds since its last write before a file is analyzed
+        queue_size: files queued before polling pauses for the workers
+        on_result: called with each BatchResult once it is logged; an
+                   exception it raises is reported on stderr and ignored
+        stop: event that ends the watch (finishing the files already queued)
+        once: analyze the files present now, without waiting for them to
+              settle, then return (a one-shot incremental run)
+
+    Returns:
+        number of files analyzed
+    """
+    loop = asyncio.get_running_loop()
+    stop = stop or asyncio.Event()
+    workers = workers or default_workers()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    done = log.done()
+    pending: Dict[str, Signature] = {}  # queued or running
+    analyzed = 0
+
+    def new_pool():
+        return ThreadPoolExecutor(1) if workers == 1 else ProcessPoolExecutor(workers)
+
+    pool = new_pool()
+
+    async def run(path) -> BatchResult:
+        nonlocal pool
+        current = pool
+        try:
+            return await loop.run_in_executor(current, run_one, analyze, path)
+        except Exception as e:
+            # Worker died (e.g. killed by the OOM killer); the first task to
+            # notice replaces the broken pool for everyone
+            if isinstance(e, BrokenExecutor) and pool is current:
+                pool = new_pool()
+                current.shutdown(wait=False, cancel_futures=True)
+            return BatchResult(path, None, f'{type(e).__name__}: {e}')
+
+    async def work():
+        nonlocal analyzed
+        while True:
+            path, signature = await queue.get()
+            try:
+                item = await run(path)
+                try:
+                    log.append(item, signature)
+                    done[path] = signature
+                except Exception as e:
+                    # Left out of `done`, so a later poll queues the file again
+                    item = item._replace(error=f'not logged: {type(e).__name__}: {e}')
+                analyzed += 1
+                if on_result is not None:
+                    try:
+                        on_result(item)
+                    except Exception as e:
+                        # A failing callback must not take this worker task
+                        # with it: once all have died, queue.join() never returns
+                        print(f"✗ {Path(path).name}: on_result failed: {type(e).__name__}: {e}",
+                              file=sys.stderr)
+            finally:
+                del pending[path]
+                queue.task_done()
+
+    async def poll():
+        previous: Dict[str, Signature] = {}
+        while not stop.is_set():
+            current = await asyncio.to_thread(scan, directory)
+            written_before = time.time_ns() - int(settle * 1e9)
+            for path in sorted(current):
+                signature = current[path]
+                settled = once or (previous.get(path) == signature
+                                   and signature[1] <= written_before)
+                if settled and done.get(path) != signature and path not in pending:
+                    pending[path] = signature
+                    await queue.put((path, signature))  # waits while the queue is full
+            previous = current
+            if once:
+                return
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    tasks = [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        await poll()
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pool.shutdown()
+    return analyzed
+
+
+def watch(directory: Union[str, Path], analyze: Callable[[str], Optional[dict]],
+          log_path: Optional[Union[str, Path]] = None, **options) -> int:
+    """
+    Run watch_directory() until SIGINT/SIGTERM (or, with once=True, until
+    the current files are done). The log defaults to RESULTS_LOG in
+    `directory`. Returns the number of files analyzed.
+    """
+    log = ResultLog(log_path or Path(directory) / RESULTS_LOG)
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):  # Windows, non-main thread
+                pass
+        return await watch_directory(directory, analyze, log, stop=stop, **options)
+
+    return asyncio.run(run())
@@ -4,190 +4,91 @@ Precise Race-by-Race Weight Analysis
 Calculates exact energy costs, power changes, and normalized power for each TCX file.
 """
 
-import xml.etree.ElementTree as ET
 from pathlib import Path
+from functools import partial
+from contextlib import nullcontext
+import argparse
 import json
 
-# Physical constants
-G = 9.81
-
-class TrackPoint:
-    def __init__(self, time, elevation, speed, power=None):
-        self.time = time
-        self.elevation = elevation
-        self.speed = speed
-        self.power = power if power is not None else 0
+from np_weight import instrument
+from np_weight.analysis import analyze_ride, open_ride
+from np_weight.batch import find_tcx_files, run_batch
+from np_weight.cache import DEFAULT_CACHE_DIR, RideCache
+from np_weight.metrics import intensity_factor, training_stress_score
+from np_weight.physics import J_PER_KCAL
+from np_weight.results import open_results
+from np_weight.ride import REQUIRE_PROFILE
 
 class TCXParser:
-    def __init__(self, filepath):
+    def __init__(self, filepath, cache=None, resample=False):
         self.filepath = filepath
+        self.cache = cache
+        self.resample = resample
         self.filename = Path(filepath).name
-        self.trackpoints = []
+        self.ride = None
         self.parse()
     
     def parse(self):
-        """Parse TCX file and extract trackpoints."""
-        tree = ET.parse(self.filepath)
-        root = tree.getroot()
-        
-        ns = {
-            'ns': 'http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2',
-            'ns3': 'http://www.garmin.com/xmlschemas/ActivityExtension/v2'
-        }
-        
-        for tp_elem in root.findall('.//ns:Trackpoint', ns):
-            try:
-                time_elem = tp_elem.find('ns:Time', ns)
-                elev_elem = tp_elem.find('ns:AltitudeMeters', ns)
-                
-                speed = 0.0
-                tpx = tp_elem.find('.//ns3:TPX', ns)
-                if tpx is not None:
-                    speed_elem = tpx.find('ns3:Speed', ns)
-                    if speed_elem is not None and speed_elem.text:
-                        speed = float(speed_elem.text)
-                
-                # Try to get power
-                power = None
-                if tpx is not None:
-                    power_elem = tpx.find('ns3:Watts', ns)
-                    if power_elem is not None and power_elem.text:
-                        power = float(power_elem.text)
-                
-                if time_elem is not None and elev_elem is not None:
-                    tp = TrackPoint(
-                        time=time_elem.text,
-                        elevation=float(elev_elem.text),
-                        speed=speed,
-                        power=power
-                    )
-                    self.trackpoints.append(tp)
-            except (ValueError, AttributeError):
-                pass
+        """Parse TCX file into a columnar Ride of usable trackpoints (1 Hz grid with `resample`)."""
+        self.ride = open_ride(self.filepath, REQUIRE_PROFILE, self.cache, self.resample)
 
-def calculate_race_analysis(parser, rider_mass=75.0, extra_kg=1.0):
+def calculate_race_analysis(parser, rider_mass=75.0, extra_kg=1.0, ftp=None):
     """
     Calculate complete race analysis including exact energy costs and normalized power.
+    
+    Normalized power is the standard 30 s rolling NP. When `ftp` is given,
+    intensity factor and TSS are reported for both NP values.
     """
-    if len(parser.trackpoints) < 2:
+    analysis = analyze_ride(parser.ride, extra_kg)
+    if analysis is None:
         return None
     
-    total_mass = rider_mass
-    total_mass_plus = rider_mass + extra_kg
+    # Per-step KE/PE cost of the extra kg (worst-case: no downhill benefit),
+    # using the real time between trackpoints
+    extra = analysis.extra
+    total_elev_gain = extra.elevation_gain
     
-    # Arrays to store calculations
-    speeds = []
-    elevations = []
-    measured_powers = []
-    ke_costs = []
-    pe_costs = []
-    total_extra_power_costs = []
-    new_total_powers = []
-    
-    total_elev_gain = 0
-    
-    # First pass: calculate per-second costs and collect data
-    for i in range(1, len(parser.trackpoints)):
-        curr = parser.trackpoints[i]
-        prev = parser.trackpoints[i-1]
-        
-        # Velocity change
-        v_curr = curr.speed
-        v_prev = prev.speed
-        speeds.append(v_curr)
-        
-        # Elevation change
-        elev_delta = curr.elevation - prev.elevation
-        elevations.append(curr.elevation)
-        if elev_delta > 0:
-            total_elev_gain += elev_delta
-        
-        # Kinetic energy cost for extra kg
-        # ΔKE = ½m(v₂² - v₁²), Power = ΔKE/Δt (where Δt = 1 sec)
-        ke_delta = 0.5 * extra_kg * (v_curr**2 - v_prev**2)
-        ke_costs.append(ke_delta)
-        
-        # Potential energy cost for extra kg (uphill only, worst-case)
-        pe_delta = 0
-        if elev_delta > 0:
-            pe_delta = extra_kg * G * elev_delta
-        pe_costs.append(pe_delta)
-        
-        # Total extra power for 1kg (worst-case: no downhill benefit)
-        extra_power = max(0, ke_delta + pe_delta)
-        total_extra_power_costs.append(extra_power)
-        
-        # Measured power (if available)
-        if curr.power:
-            measured_powers.append(curr.power)
-            # New total power = old + extra cost
-            new_power = curr.power + extra_power
-            new_total_powers.append(new_power)
-        else:
-            measured_powers.append(0)
-            new_total_powers.append(extra_power)
-    
-    # Remove first point (no measurement yet)
-    speeds = speeds[1:] if len(speeds) > 1 else speeds
-    elevations = elevations[1:] if len(elevations) > 1 else elevations
+    # Skip the first step (no measurement yet)
+    speeds = analysis.speed[1:] if analysis.trackpoints > 2 else analysis.speed
+    n_elevations = max(analysis.trackpoints - 2, 1)
     
     # Calculate summary statistics
-    duration_sec = len(parser.trackpoints) - 1
+    duration_sec = analysis.duration
     duration_min = duration_sec / 60
     duration_hr = duration_min / 60
     
     # Total energy costs
-    total_energy_cost_joules = sum(total_extra_power_costs)
-    total_energy_cost_kcal = total_energy_cost_joules / 4184
-    
-    # Average power (only for measured power points)
-    has_measured_power = any(p > 0 for p in measured_powers)
+    total_energy_cost_joules = extra.energy
+    total_energy_cost_kcal = total_energy_cost_joules / J_PER_KCAL
     
+    # Averages are over the measured power readings; NP is the 30 s rolling
+    # NP over the full 1 Hz series so coasting seconds count as they do on
+    # a head unit
+    has_measured_power = analysis.has_measured_power
+    np_new = analysis.np_with_extra
     if has_measured_power:
-        # Calculate original and new average power
-        measured_power_with_data = [p for p in measured_powers if p > 0]
-        avg_original_power = sum(measured_power_with_data) / len(measured_power_with_data) if measured_power_with_data else 0
-        
-        # New powers corresponding to measured power readings
-        new_powers_with_data = [new_total_powers[i] for i in range(len(measured_powers)) if measured_powers[i] > 0]
-        avg_new_power = sum(new_powers_with_data) / len(new_powers_with_data) if new_powers_with_data else 0
-        
-        # Increase in average power
+        avg_original_power = analysis.avg_measured
+        avg_new_power = analysis.avg_with_extra
         avg_power_increase = avg_new_power - avg_original_power
-        
-        # Calculate normalized power for original
-        if measured_power_with_data:
-            power_4 = [p**4 for p in measured_power_with_data]
-            mean_p4 = sum(power_4) / len(power_4)
-            np_original = mean_p4 ** 0.25
-        else:
-            np_original = 0
-        
-        # Calculate normalized power for new (1kg heavier)
-        if new_powers_with_data:
-            new_power_4 = [p**4 for p in new_powers_with_data]
-            mean_new_p4 = sum(new_power_4) / len(new_power_4)
-            np_new = mean_new_p4 ** 0.25
-        else:
-            np_new = 0
+        np_original = analysis.np_measured
     else:
         # No measured power data - use calculated extra cost only
         avg_original_power = None
         avg_new_power = None
-        avg_power_increase = sum(total_extra_power_costs) / len(total_extra_power_costs) if total_extra_power_costs else 0
-        
-        # NP from pure extra cost (won't have measured power baseline)
-        if total_extra_power_costs:
-            power_4 = [p**4 for p in total_extra_power_costs]
-            mean_p4 = sum(power_4) / len(power_4)
-            np_original = 0  # Not applicable
-            np_new = mean_p4 ** 0.25
-        else:
-            np_original = 0
-            np_new = 0
+        avg_power_increase = extra.average
+        np_original = 0  # Not applicable
+    
+    if ftp:
+        if_original = intensity_factor(np_original, ftp) if has_measured_power else None
+        if_new = intensity_factor(np_new, ftp)
+        tss_original = training_stress_score(duration_sec, np_original, ftp) if has_measured_power else None
+        tss_new = training_stress_score(duration_sec, np_new, ftp)
+    else:
+        if_original = if_new = tss_original = tss_new = None
     
     return {
         'filename': parser.filename,
+        'trackpoints': analysis.trackpoints,
         'duration': {
             'seconds': duration_sec,
             'minutes': duration_min,
@@ -195,13 +96,13 @@ def calculate_race_analysis(parser, rider_mass=75.0, extra_kg=1.0):
         },
         'elevation': {
             'gain_total': total_elev_gain,
-            'samples': len(elevations)
+            'samples': n_elevations
         },
         'speed': {
-            'max_ms': max(speeds) if speeds else 0,
-            'max_kmh': max(speeds) * 3.6 if speeds else 0,
-            'avg_ms': sum(speeds) / len(speeds) if speeds else 0,
-            'avg_kmh': (sum(speeds) / len(speeds) * 3.6) if speeds else 0
+            'max_ms': float(speeds.max()),
+            'max_kmh': float(speeds.max()) * 3.6,
+            'avg_ms': float(speeds.mean()),
+            'avg_kmh': float(speeds.mean()) * 3.6
         },
         'energy': {
             'total_cost_joules': total_energy_cost_joules,
@@ -213,6 +114,10 @@ def calculate_race_analysis(parser, rider_mass=75.0, extra_kg=1.0):
             'avg_increase': avg_power_increase,
             'np_original': np_original,
             'np_with_1kg': np_new,
+            'if_original': if_original,
+            'if_with_1kg': if_new,
+            'tss_original': tss_original,
+            'tss_with_1kg': tss_new,
             'has_measured_power': has_measured_power
         }
     }
@@ -231,7 +136,7 @@ def format_summary_table(results):
         print(f"\n{filename}")
         print("-" * 100)
         
-        print(f"Duration: {dur_min:.1f} minutes ({dur_sec} seconds)")
+        print(f"Duration: {dur_min:.1f} minutes ({dur_sec:.0f} seconds)")
         
         speed_result = result['speed']
         print(f"Speed: {speed_result['avg_kmh']:.1f} km/h average (max {speed_result['max_kmh']:.1f} km/h)")
@@ -256,14 +161,48 @@ def format_summary_table(results):
             if result['power']['np_original'] > 0:
                 pct_increase = (result['power']['np_with_1kg'] - result['power']['np_original']) / result['power']['np_original'] * 100
                 print(f"  Percentage increase:      {pct_increase:.2f}%")
+            
+            if result['power']['tss_original'] is not None:
+                print(f"\n  Intensity factor:         {result['power']['if_original']:.3f} → {result['power']['if_with_1kg']:.3f}")
+                print(f"  TSS:                      {result['power']['tss_original']:.1f} → {result['power']['tss_with_1kg']:.1f}")
         else:
             print(f"\nNO MEASURED POWER DATA (speed-based calculation only):")
             print(f"  Estimated extra NP from KE/PE: {result['power']['np_with_1kg']:.1f} W")
 
-def main():
+def analyze_file(tcx_file, cache=None, resample=False):
+    """Parse and analyze one TCX file (batch worker entry point)."""
+    return calculate_race_analysis(TCXParser(tcx_file, cache, resample=resample))
+
+def main(argv=None):
     """Main analysis."""
-    tcx_dir = Path('/workspaces/np_weight_analysis')
-    tcx_files = sorted(tcx_dir.glob('*.tcx'))
+    arg_parser = argparse.ArgumentParser(description='Precise race-by-race weight analysis')
+    arg_parser.add_argument('directory', nargs='?', default='.',
+                            help='directory containing .tcx files (default: current)')
+    arg_parser.add_argument('-j', '--workers', type=int, default=None,
+                            help='worker processes (default: one per CPU, 1 = no pool)')
+    arg_parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                            help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    arg_parser.add_argument('--resample', action='store_true',
+                            help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    arg_parser.add_argument('--metrics', metavar='PATH',
+                            help='record stage timings, counters and memory per file and per batch '
+                                 'to PATH (JSON, or Prometheus text for a .prom file)')
+    arg_parser.add_argument('--trace-memory', action='store_true',
+                            help='with --metrics, also record tracemalloc peaks and top allocation sites')
+    arg_parser.add_argument('--stream', metavar='PATH',
+                            help='write each result to PATH as soon as it is ready '
+                                 '(.ndjson, .csv or .parquet) instead of the summary and '
+                                 'detailed_race_analysis.json')
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='with --stream, keep the results already in PATH and skip those files')
+    args = arg_parser.parse_args(argv)
+    if args.resume and not args.stream:
+        arg_parser.error('--resume requires --stream')
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    recorder = instrument.enable(args.trace_memory) if args.metrics else None
+    
+    tcx_dir = Path(args.directory)
+    tcx_files = find_tcx_files(tcx_dir)
     
     if not tcx_files:
         print("No TCX files found!")
@@ -273,19 +212,30 @@ def main():
     
     results = []
     
-    for tcx_file in tcx_files:
-        print(f"Processing: {tcx_file.name}...", end=" ")
-        try:
-            parser = TCXParser(str(tcx_file))
-            analysis = calculate_race_analysis(parser)
-            
-            if analysis:
-                results.append(analysis)
-                print(f"✓ ({len(parser.trackpoints)} trackpoints)")
+    with open_results(args.stream, args.resume) if args.stream else nullcontext() as sink:
+        if sink is not None and args.resume:
+            done = sink.completed('filename')
+            tcx_files = [f for f in tcx_files if f.name not in done]
+            print(f"Resuming: {len(done)} already in {args.stream}, {len(tcx_files)} to analyze\n")
+        analyze = partial(analyze_file, cache=cache, resample=args.resample)
+        for item in run_batch(tcx_files, analyze, workers=args.workers):
+            print(f"Processed: {Path(item.path).name}...", end=" ")
+            if not item.ok:
+                print(f"✗ (error: {item.error})")
+            elif item.result:
+                if sink is not None:
+                    sink.write(item.result)
+                else:
+                    results.append(item.result)
+                print(f"✓ ({item.result['trackpoints']} trackpoints)")
             else:
                 print("✗ (parsing failed)")
-        except Exception as e:
-            print(f"✗ (error: {e})")
+    
+    if args.stream:
+        # The stream is the output; nothing was kept to summarize
+        print(f"\nResults streamed to: {args.stream}")
+    
+    results.sort(key=lambda r: r['filename'])
     
     # Display summary table
     if results:
@@ -312,12 +262,16 @@ def main():
             })
         
         output_file = tcx_dir / 'detailed_race_analysis.json'
-        with open(output_file, 'w') as f:
+        with open(output_file, 'w') as f, instrument.stage('json'):
             json.dump(json_output, f, indent=2)
         
         print(f"\n{'='*100}")
         print(f"Detailed results saved to: detailed_race_analysis.json")
         print("="*100)
 
+    if recorder is not None:
+        instrument.write_report(recorder, args.metrics)
+        print(f"\nMetrics saved to: {args.metrics}")
+
 if __name__ == '__main__':
     main()
@@ -5,182 +5,99 @@ This tool analyzes the impact of an additional 1kg on normalized power output
 by examining kinetic and gravitational potential energy changes.
 """
 
-import xml.etree.ElementTree as ET
 from pathlib import Path
-from dataclasses import dataclass
-from datetime import datetime
+from contextlib import nullcontext
+from functools import partial
+import argparse
 import json
-import statistics
 
-# Physical constants
-G = 9.81  # gravitational acceleration (m/s²)
-RHO_AIR = 1.225  # air density at sea level (kg/m³)
-CD = 1.1  # drag coefficient for road bike
-A = 0.4  # frontal area (m²)
-CRR = 0.004  # coefficient of rolling resistance
+from np_weight import instrument
+from np_weight.analysis import analyze_ride, open_ride
+from np_weight.batch import find_tcx_files, run_batch
+from np_weight.cache import DEFAULT_CACHE_DIR, RideCache
+from np_weight.manifest import FAILED, MANIFEST_NAME, BatchManifest
+from np_weight.physics import CRR, J_PER_KCAL
+from np_weight.power_model import CDA, model_power
+from np_weight.results import open_results
+from np_weight.series import step_series, write_series
+from np_weight.ride import REQUIRE_TRACK
+from np_weight.watch import DEFAULT_INTERVAL, RESULTS_LOG, watch
 
-@dataclass
-class TrackPoint:
-    """A single trackpoint from the TCX file."""
-    time: str
-    latitude: float
-    longitude: float
-    elevation: float
-    distance: float
-    speed: float
-    cadence: int = None
-    
 class TCXAnalyzer:
     """Parses and analyzes TCX bike race files."""
     
-    def __init__(self, tcx_file_path: str):
-        """Initialize the analyzer with a TCX file."""
+    def __init__(self, tcx_file_path: str, cache: RideCache = None, resample: bool = False):
+        """
+        Initialize the analyzer with a TCX file, optionally via a parsed-ride cache.
+        
+        With `resample`, the ride is put on a strict 1 Hz grid first (gaps
+        longer than 10 s are kept as gaps).
+        """
         self.file_path = tcx_file_path
-        self.trackpoints = []
+        self.cache = cache
+        self.resample = resample
+        self.ride = None
         self.parse_tcx()
         
     def parse_tcx(self):
-        """Parse TCX file and extract trackpoints."""
-        tree = ET.parse(self.file_path)
-        root = tree.getroot()
-        
-        # Define namespaces
-        ns = {
-            'ns': 'http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2',
-            'ns3': 'http://www.garmin.com/xmlschemas/ActivityExtension/v2'
-        }
-        
-        # Find all trackpoints
-        for tp in root.findall('.//ns:Trackpoint', ns):
-            try:
-                time_elem = tp.find('ns:Time', ns)
-                position = tp.find('ns:Position', ns)
-                elev_elem = tp.find('ns:AltitudeMeters', ns)
-                dist_elem = tp.find('ns:DistanceMeters', ns)
-                cadence_elem = tp.find('ns:Cadence', ns)
-                
-                # Get speed from extensions
-                speed = 0
-                tpx = tp.find('.//ns3:TPX', ns)
-                if tpx is not None:
-                    speed_elem = tpx.find('ns3:Speed', ns)
-                    if speed_elem is not None and speed_elem.text:
-                        speed = float(speed_elem.text)
-                
-                if (time_elem is not None and position is not None and 
-                    elev_elem is not None and dist_elem is not None):
-                    
-                    lat = float(position.find('ns:LatitudeDegrees', ns).text)
-                    lon = float(position.find('ns:LongitudeDegrees', ns).text)
-                    
-                    tp_obj = TrackPoint(
-                        time=time_elem.text,
-                        latitude=lat,
-                        longitude=lon,
-                        elevation=float(elev_elem.text),
-                        distance=float(dist_elem.text),
-                        speed=speed,
-                        cadence=int(cadence_elem.text) if cadence_elem is not None and cadence_elem.text else None
-                    )
-                    self.trackpoints.append(tp_obj)
-            except (ValueError, AttributeError) as e:
-                continue
+        """Parse TCX file into a columnar Ride of usable trackpoints."""
+        self.ride = open_ride(self.file_path, REQUIRE_TRACK, self.cache, self.resample)
     
-    def calculate_power_impact(self, rider_mass: float = 75.0, extra_weight: float = 1.0):
+    def calculate_power_impact(self, rider_mass: float = 75.0, extra_weight: float = 1.0,
+                               cda: float = CDA, crr: float = CRR, power_model: bool = False,
+                               series: bool = False):
         """
         Calculate the power impact of extra weight due to kinetic and gravitational PE changes.
         
+        The 'extra_1kg_power' section is the worst-case KE/PE cost. With
+        `power_model`, a 'power_model' section adds aero and rolling
+        resistance to a full power balance (descents included) and reports
+        the modelled total power and the cost of the extra weight under that
+        model. It assumes a solo rider with no drafting (default CdA 0.44 m²),
+        so in a bunch race it overstates the modelled power by a lot; it is
+        off by default.
+        
         Args:
             rider_mass: rider + bike mass in kg (default 75 kg)
             extra_weight: additional weight in kg (default 1 kg)
+            cda: drag area in m² for the power model (default CD × A)
+            crr: rolling resistance coefficient for the power model
+            power_model: also report the modelled power balance under
+                         'power_model' (solo, no-draft estimate)
+            series: also return the per-step KE/PE/extra-power, time, speed
+                    and elevation arrays under 'series' (views, see
+                    np_weight.series; not JSON-serializable)
         
         Returns:
             dict containing analysis results
         """
-        if len(self.trackpoints) < 2:
+        ride = self.ride
+        analysis = analyze_ride(ride, extra_weight)
+        if analysis is None:
             return None
         
-        total_mass = rider_mass + extra_weight
-        base_mass = rider_mass
-        
-        # Initialize tracking variables
-        kinetic_energy_extra = []  # watts needed for kinetic energy
-        potential_energy_extra = []  # watts needed for gravitational PE
-        total_extra_power = []  # total watts needed
-        timestamps = []
-        velocities = []
-        elevation_gains = []
-        
-        prev_tp = self.trackpoints[0]
-        total_elev_gain = 0
-        
-        for i, tp in enumerate(self.trackpoints[1:], start=1):
-            # Time difference (should be 1 second for most TCX files)
-            dt = 1.0  # assuming 1 second intervals
-            
-            # Current state
-            v_current = tp.speed  # m/s
-            v_prev = prev_tp.speed  # m/s
-            elev_current = tp.elevation
-            elev_prev = prev_tp.elevation
-            
-            # Calculate elevation gain (only count gains, worst case)
-            elev_delta = elev_current - elev_prev
-            if elev_delta > 0:
-                total_elev_gain += elev_delta
-            
-            # Kinetic energy change: ½m(v² - v₀²)
-            # Power = ΔKE / Δt
-            ke_base = 0.5 * base_mass * (v_current**2 - v_prev**2) / dt if dt > 0 else 0
-            ke_with_extra = 0.5 * total_mass * (v_current**2 - v_prev**2) / dt if dt > 0 else 0
-            ke_delta = ke_with_extra - ke_base
-            
-            # Gravitational PE change: mg*Δh
-            # Power = ΔPE / Δt (only count gains in worst case)
-            if elev_delta > 0:
-                pe_base = base_mass * G * elev_delta / dt
-                pe_with_extra = total_mass * G * elev_delta / dt
-                pe_delta = pe_with_extra - pe_base
-            else:
-                pe_delta = 0
-            
-            # Total extra power needed
-            total_delta = max(0, ke_delta + pe_delta)  # worst case: no benefiting from descents
-            
-            kinetic_energy_extra.append(ke_delta)
-            potential_energy_extra.append(pe_delta)
-            total_extra_power.append(total_delta)
-            timestamps.append(tp.time)
-            velocities.append(v_current)
-            elevation_gains.append(elev_delta)
-            
-            prev_tp = tp
-        
-        # Calculate statistics
-        total_extra_power_arr = total_extra_power
-        
-        # Normalized Power (similar to TrainingPeaks algorithm, simplified)
-        # NP = (avg(power^4))^(1/4)
-        if len(total_extra_power_arr) > 0:
-            power_4 = [p**4 for p in total_extra_power_arr]
-            mean_power_4 = sum(power_4) / len(power_4)
-            np_extra = mean_power_4**0.25 if mean_power_4 > 0 else 0
-        else:
-            np_extra = 0
+        # Per-step KE/PE cost of the extra mass (worst case: no benefit
+        # from descents or braking), computed over the whole ride at once
+        # using the real time between trackpoints
+        extra = analysis.extra
+        velocities = analysis.speed
+        total_elev_gain = extra.elevation_gain
         
-        # Average power
-        avg_power_extra = sum(total_extra_power_arr) / len(total_extra_power_arr) if len(total_extra_power_arr) > 0 else 0
-        max_power_extra = max(total_extra_power_arr) if len(total_extra_power_arr) > 0 else 0
+        # Normalized Power (TrainingPeaks algorithm)
+        # NP = (avg(rolling_30s(power)^4))^(1/4)
+        np_extra = extra.normalized_power
+        avg_power_extra = extra.average
+        max_power_extra = extra.maximum
         
         # Total energy (Joules)
-        total_energy = sum(total_extra_power_arr) if len(total_extra_power_arr) > 0 else 0
+        total_energy = extra.energy
         
-        # Duration
-        duration_seconds = len(self.trackpoints) - 1
+        # Duration (elapsed time, including any recording gaps)
+        duration_seconds = analysis.duration
         duration_minutes = duration_seconds / 60
         duration_hours = duration_minutes / 60
         
-        return {
+        result = {
             'file_name': Path(self.file_path).name,
             'duration': {
                 'seconds': duration_seconds,
@@ -188,66 +105,165 @@ class TCXAnalyzer:
                 'hours': duration_hours
             },
             'distance': {
-                'meters': self.trackpoints[-1].distance,
-                'km': self.trackpoints[-1].distance / 1000
+                'meters': analysis.distance,
+                'km': analysis.distance / 1000
             },
             'elevation': {
                 'total_gain': total_elev_gain,
-                'max_elevation': max([tp.elevation for tp in self.trackpoints]),
-                'min_elevation': min([tp.elevation for tp in self.trackpoints])
+                'max_elevation': float(ride.elevation.max()),
+                'min_elevation': float(ride.elevation.min())
             },
             'speed': {
-                'max': max(velocities) if velocities else 0,
-                'average': sum(velocities) / len(velocities) if velocities else 0
+                'max': float(velocities.max()),
+                'average': float(velocities.mean())
             },
             'extra_1kg_power': {
                 'normalized_power': np_extra,
                 'average_power': avg_power_extra,
                 'max_power': max_power_extra,
                 'total_energy_joules': total_energy,
-                'total_energy_kilocalories': total_energy / 4184
+                'total_energy_kilocalories': total_energy / J_PER_KCAL
             },
             'rider_mass_assumed': rider_mass,
             'extra_weight': extra_weight,
             'description': f'Worst-case scenario: extra {extra_weight}kg requires avg {avg_power_extra:.1f}W, NP {np_extra:.1f}W, max {max_power_extra:.1f}W'
         }
+        if power_model:
+            # Full power balance (aero + rolling + KE + PE) of a solo rider
+            modelled = model_power(ride.speed, ride.elevation, rider_mass, cda=cda, crr=crr,
+                                   dt=extra.dt)
+            result['power_model'] = {
+                'assumption': 'solo rider, no drafting',
+                'cda': cda,
+                'crr': crr,
+                **modelled.summary(extra_weight)
+            }
+        if series:
+            result['series'] = step_series(analysis, ride)
+        return result
 
 
-def analyze_all_tcx_files(directory: str = '/workspaces/np_weight_analysis'):
-    """Analyze all TCX files in a directory."""
+def analyze_file(tcx_file: str, rider_mass: float = 75.0, extra_weight: float = 1.0,
+                 cache: RideCache = None, resample: bool = False, series_dir: str = None,
+                 series_format: str = 'npz', power_model: bool = False):
+    """
+    Parse and analyze one TCX file (batch worker entry point).
+    
+    With `series_dir`, the per-step series are written there as
+    <file stem>.<series_format> and the path is kept under 'series_file'.
+    With `power_model`, the solo, no-draft modelled power is included.
+    """
+    analyzer = TCXAnalyzer(tcx_file, cache, resample=resample)
+    result = analyzer.calculate_power_impact(rider_mass, extra_weight, power_model=power_model,
+                                             series=bool(series_dir))
+    if result is not None and series_dir:
+        series_file = Path(series_dir) / f"{Path(tcx_file).stem}.{series_format}"
+        with instrument.stage('series'):
+            write_series(result.pop('series'), series_file)
+        result['series_file'] = str(series_file)
+    return result
+
+
+def analyze_all_tcx_files(directory: str = '.',
+                          workers: int = None, rider_mass: float = 75.0,
+                          extra_weight: float = 1.0, cache: RideCache = None,
+                          resample: bool = False, stream: str = None,
+                          resume: bool = False, manifest: str = None,
+                          series_dir: str = None, series_format: str = 'npz',
+                          power_model: bool = False):
+    """
+    Analyze all TCX files in a directory.
+    
+    Files are spread across `workers` processes (default: one per CPU) and
+    reported as each one finishes; a failing file is logged and skipped.
+    With a `cache`, files parsed on an earlier run are loaded from it.
+    With `resample`, every ride is put on a 1 Hz grid before analysis.
+    With `stream` (a .ndjson, .csv or .parquet path), each result is
+    written there as soon as it is ready instead of being kept: no
+    weight_analysis_results.json is written and an empty list is returned
+    (np_weight.results.read_results() loads the stream). With `resume`,
+    files already in the stream are skipped.
+    With a `manifest` path, every file's outcome is recorded there; files
+    finished with the same parameters on an earlier run are skipped (their
+    results come from the manifest) and failed ones are retried.
+    With `series_dir`, each ride's per-step series are written there as a
+    `series_format` file (npz, parquet or arrow).
+    With `power_model`, each result also has the solo, no-draft modelled
+    power balance.
+    """
     results = []
-    tcx_files = list(Path(directory).glob('*.tcx'))
+    tcx_files = find_tcx_files(directory)
     
     print(f"Found {len(tcx_files)} TCX files")
     print("=" * 80)
     
-    for tcx_file in tcx_files:
-        try:
-            print(f"\nAnalyzing: {tcx_file.name}")
-            analyzer = TCXAnalyzer(str(tcx_file))
-            result = analyzer.calculate_power_impact()
-            
+    params = {'rider_mass': rider_mass, 'extra_weight': extra_weight, 'resample': resample}
+    if series_dir:
+        Path(series_dir).mkdir(parents=True, exist_ok=True)
+        params.update(series_dir=str(series_dir), series_format=series_format)
+    if power_model:
+        params['power_model'] = True
+    with open_results(stream, resume) if stream else nullcontext() as sink, \
+            BatchManifest(manifest, params) if manifest else nullcontext() as batch:
+        if batch is not None:
+            tcx_files, finished = batch.plan(tcx_files)
+            retry = sum(batch.status(f) == FAILED for f in tcx_files)
+            if sink is None:
+                results.extend(e['result'] for e in finished if e['result'])
+            print(f"Manifest {manifest}: {len(finished)} done, {len(tcx_files)} to analyze "
+                  f"({retry} failed before)")
+        if sink is not None and resume:
+            done = sink.completed('file_name')
+            tcx_files = [f for f in tcx_files if f.name not in done]
+            print(f"Resuming: {len(done)} already in {stream}, {len(tcx_files)} to analyze")
+        analyze = partial(analyze_file, rider_mass=rider_mass, extra_weight=extra_weight,
+                          cache=cache, resample=resample, series_dir=series_dir,
+                          series_format=series_format, power_model=power_model)
+        for item in run_batch(tcx_files, analyze, workers=workers):
+            name = Path(item.path).name
+            print(f"\nAnalyzed: {name}")
+            if batch is not None:
+                batch.record(item)
+            if not item.ok:
+                print(f"  Error processing {name}: {item.error}")
+                continue
+        
+            result = item.result
             if result:
-                results.append(result)
-                
+                if sink is not None:
+                    sink.write(result)
+                else:
+                    results.append(result)
+            
                 # Print summary
                 print(f"  Duration: {result['duration']['hours']:.2f}h ({result['duration']['minutes']:.0f}m)")
                 print(f"  Distance: {result['distance']['km']:.1f} km")
                 print(f"  Elevation gain: {result['elevation']['total_gain']:.0f}m")
                 print(f"  Avg speed: {result['speed']['average']:.1f} m/s ({result['speed']['average']*3.6:.1f} km/h)")
                 print(f"  Max speed: {result['speed']['max']:.1f} m/s ({result['speed']['max']*3.6:.1f} km/h)")
-                print(f"\n  Extra 1kg impact (worst-case):")
+                print(f"\n  Extra {extra_weight}kg impact (worst-case):")
                 print(f"    Normalized Power: {result['extra_1kg_power']['normalized_power']:.1f} W")
                 print(f"    Average Power: {result['extra_1kg_power']['average_power']:.1f} W")
                 print(f"    Max Power: {result['extra_1kg_power']['max_power']:.1f} W")
                 print(f"    Total Energy: {result['extra_1kg_power']['total_energy_kilocalories']:.1f} kcal")
-        except Exception as e:
-            print(f"  Error processing {tcx_file.name}: {e}")
+                model = result.get('power_model')
+                if model:
+                    print(f"\n  Power model (solo, no draft; aero + rolling + KE + PE):")
+                    print(f"    Modelled NP: {model['normalized_power']:.0f} W (avg {model['average_power']:.0f} W)")
+                    print(f"    Extra {extra_weight}kg incl. rolling: avg {model['extra_average_power']:.2f} W, NP +{model['extra_normalized_power']:.2f} W")
+    
+    if stream:
+        print(f"\n{'='*80}")
+        print(f"Results streamed to: {stream}")
+        return results
+    
+    # Keep the JSON in a stable order regardless of completion order
+    results.sort(key=lambda r: r['file_name'])
     
     # Save results to JSON
     if results:
         output_file = Path(directory) / 'weight_analysis_results.json'
-        with open(output_file, 'w') as f:
+        with open(output_file, 'w') as f, instrument.stage('json'):
             json.dump(results, f, indent=2)
         print(f"\n{'='*80}")
         print(f"Results saved to: {output_file}")
@@ -255,8 +271,94 @@ def analyze_all_tcx_files(directory: str = '/workspaces/np_weight_analysis'):
     return results
 
 
-if __name__ == '__main__':
-    results = analyze_all_tcx_files()
+def report_upload(item):
+    """One line per file analyzed in --watch mode."""
+    name = Path(item.path).name
+    if not item.ok:
+        print(f"✗ {name}: {item.error}")
+    elif item.result is None:
+        print(f"✗ {name} (insufficient data)")
+    else:
+        result = item.result
+        print(f"✓ {name}: NP cost of {result['extra_weight']}kg "
+              f"{result['extra_1kg_power']['normalized_power']:.1f}W, "
+              f"avg {result['extra_1kg_power']['average_power']:.1f}W")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('directory', nargs='?', default='.',
+                        help='directory containing .tcx files (default: current)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU, 1 = no pool)')
+    parser.add_argument('--rider-mass', type=float, default=75.0,
+                        help='rider + bike mass in kg (default 75)')
+    parser.add_argument('--extra-weight', type=float, default=1.0,
+                        help='additional weight in kg (default 1)')
+    parser.add_argument('--cache-dir', nargs='?', const=str(DEFAULT_CACHE_DIR), default=None,
+                        help=f'cache parsed rides on disk (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--resample', action='store_true',
+                        help='resample rides to 1 Hz before analysis (keeps gaps > 10 s)')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='record stage timings, counters and memory per file and per batch '
+                             'to PATH (JSON, or Prometheus text for a .prom file)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='with --metrics, also record tracemalloc peaks and top allocation sites')
+    parser.add_argument('--stream', metavar='PATH',
+                        help='also write each result to PATH as soon as it is ready '
+                             '(.ndjson, .csv or .parquet)')
+    parser.add_argument('--resume', action='store_true',
+                        help='with --stream, keep the results already in PATH and skip those files')
+    parser.add_argument('--manifest', nargs='?', const='', default=None, metavar='PATH',
+                        help='record each file\'s outcome in a batch manifest and skip files '
+                             f'finished on an earlier run (default: {MANIFEST_NAME} in the directory)')
+    parser.add_argument('--series', metavar='DIR',
+                        help='write each ride\'s per-second KE/PE/extra-power, time, speed and '
+                             'elevation series to DIR')
+    parser.add_argument('--series-format', choices=('npz', 'parquet', 'arrow'), default='npz',
+                        help='file format for --series (default npz; parquet/arrow need pyarrow)')
+    parser.add_argument('--power-model', action='store_true',
+                        help='also report the modelled aero + rolling + KE + PE power balance '
+                             '(assumes a solo rider with no drafting, so it overstates '
+                             'bunch-race power)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and analyze new or changed .tcx files as they land, '
+                             f'appending one JSON line each to {RESULTS_LOG} (Ctrl-C to stop)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'seconds between directory polls with --watch (default {DEFAULT_INTERVAL:g})')
+    args = parser.parse_args(argv)
+    if args.resume and not args.stream:
+        parser.error('--resume requires --stream')
+    
+    cache = RideCache(args.cache_dir) if args.cache_dir else None
+    recorder = instrument.enable(args.trace_memory) if args.metrics else None
+
+    if args.watch:
+        if args.series:
+            Path(args.series).mkdir(parents=True, exist_ok=True)
+        analyze = partial(analyze_file, rider_mass=args.rider_mass,
+                          extra_weight=args.extra_weight, cache=cache, resample=args.resample,
+                          series_dir=args.series, series_format=args.series_format,
+                          power_model=args.power_model)
+        print(f"Watching {args.directory}, appending results to "
+              f"{Path(args.directory) / RESULTS_LOG} (Ctrl-C to stop)")
+        analyzed = watch(args.directory, analyze, workers=args.workers,
+                         interval=args.interval, on_result=report_upload)
+        print(f"\nAnalyzed {analyzed} files")
+        if recorder is not None:
+            instrument.write_report(recorder, args.metrics)
+        return
+    manifest = args.manifest
+    if manifest == '':
+        manifest = Path(args.directory) / MANIFEST_NAME
+    results = analyze_all_tcx_files(args.directory, workers=args.workers,
+                                    rider_mass=args.rider_mass,
+                                    extra_weight=args.extra_weight,
+                                    cache=cache, resample=args.resample,
+                                    stream=args.stream, resume=args.resume,
+                                    manifest=manifest, series_dir=args.series,
+                                    series_format=args.series_format,
+                                    power_model=args.power_model)
     
     # Print comparative summary
     if results:
@@ -268,3 +370,11 @@ if __name__ == '__main__':
             print(f"\n{result['file_name']}")
             print(f"  NP cost of 1kg: {result['extra_1kg_power']['normalized_power']:.1f}W")
             print(f"  Avg cost of 1kg: {result['extra_1kg_power']['average_power']:.1f}W")
+
+    if recorder is not None:
+        instrument.write_report(recorder, args.metrics)
+        print(f"\nMetrics saved to: {args.metrics}")
+
+
+if __name__ == '__main__':
+    main()